@@ -0,0 +1,580 @@
+#!/usr/bin/env python3
+"""
+benchmark_pipeline.py - Mesure des performances du pipeline PDF → LogCards
+Responsabilité : chronométrer chaque étape (découpage, rendu, OCR, mise en page,
+consolidation, Phase 2 avec LLM simulé, validation) sur le PDF de référence et sur
+des documents synthétiques de N pages, puis enregistrer les résultats en JSON
+pour comparer les exécutions entre elles.
+
+Exemples :
+    python benchmark_pipeline.py
+    python benchmark_pipeline.py --synthetic-pages 24 60 --skip-ocr
+    python benchmark_pipeline.py --compare BENCHMARK_RESULTS/benchmark_20250901_120000.json
+    python benchmark_pipeline.py --check-rules
+    python benchmark_pipeline.py --skip-ocr --llm-429-every 3
+"""
+
+import os
+import io
+import re
+import sys
+import json
+import time
+import glob
+import shutil
+import platform
+import argparse
+import threading
+import subprocess
+import contextlib
+from itertools import groupby
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import PyPDF2
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+REPO_DIR = os.path.abspath(os.path.join(SCRIPTS_DIR, '..'))
+
+sys.path.append(os.path.join(SCRIPTS_DIR, 'ocr_extraction'))
+sys.path.append(os.path.join(SCRIPTS_DIR, 'logcard_analyzer'))
+sys.path.append(os.path.join(SCRIPTS_DIR, 'truth_scripts'))
+
+DEFAULT_PDF = os.path.join(REPO_DIR, "INPUT_DOCS", "LOG CARDS - INVENTORY LOG BOOK 6 pages.pdf")
+DEFAULT_GROUND_TRUTH = os.path.join(REPO_DIR, "INPUT_DOCS", "LOG_CARDS_INVENTORY_LOG_BOOK_ground_truth.json")
+RECORDED_PAGES_GLOB = os.path.join(SCRIPTS_DIR, "main_scripts", "WORKFLOW_RESULTS", "*", "phase1_ocr",
+                                   "temp_segments", "segment_*_p??_paddle.json")
+
+
+# ---------------------------------------------------------------------------
+# Mesures
+# ---------------------------------------------------------------------------
+
+def _current_rss_bytes():
+    """RSS courant du processus (psutil si disponible, sinon /proc sous Linux)"""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class PeakRSSSampler:
+    """Échantillonne le RSS dans un thread pendant une étape et retient le maximum"""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = _current_rss_bytes()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            rss = _current_rss_bytes()
+            if rss is not None and (self.peak is None or rss > self.peak):
+                self.peak = rss
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        if self.peak is not None:
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        rss = _current_rss_bytes()
+        if rss is not None and (self.peak is None or rss > self.peak):
+            self.peak = rss
+
+
+def _cpu_seconds():
+    """Temps CPU utilisateur + système du processus et de ses enfants terminés"""
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+def run_stage(results, name, pages, fn, verbose=False):
+    """
+    Exécute une étape et ajoute sa mesure à `results`
+
+    Args:
+        results (list): Liste des mesures du document
+        name (str): Nom de l'étape
+        pages (int): Nombre de pages traitées (pour pages/s)
+        fn (callable): Étape à exécuter ; peut retourner un dict de métriques supplémentaires
+        verbose (bool): Afficher la sortie des scripts du pipeline
+
+    Returns:
+        bool: True si l'étape a réussi
+    """
+    print(f"   ⏱️  {name}...", end=" ", flush=True)
+    extra, error = None, None
+    sink = io.StringIO()
+    with PeakRSSSampler() as sampler:
+        cpu_start = _cpu_seconds()
+        wall_start = time.perf_counter()
+        try:
+            if verbose:
+                extra = fn()
+            else:
+                with contextlib.redirect_stdout(sink):
+                    extra = fn()
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        wall = time.perf_counter() - wall_start
+        cpu = _cpu_seconds() - cpu_start
+
+    measure = {
+        'stage': name,
+        'ok': error is None,
+        'pages': pages,
+        'wall_s': round(wall, 4),
+        'cpu_s': round(cpu, 4),
+        'peak_rss_mb': round(sampler.peak / (1024 * 1024), 1) if sampler.peak else None,
+        'pages_per_s': round(pages / wall, 2) if wall > 0 and pages else None
+    }
+    if isinstance(extra, dict):
+        measure.update(extra)
+    if error:
+        measure['error'] = error
+    results.append(measure)
+
+    if error:
+        print(f"❌ {error}")
+    else:
+        print(f"✅ {wall:.3f}s (CPU {cpu:.3f}s, {measure['pages_per_s']} pages/s, "
+              f"RSS max {measure['peak_rss_mb']} MB)")
+    return error is None
+
+
+# ---------------------------------------------------------------------------
+# Documents
+# ---------------------------------------------------------------------------
+
+def build_synthetic_pdf(source_pdf, num_pages, output_path):
+    """Construit un PDF de `num_pages` pages en répétant les pages du PDF source"""
+    reader = PyPDF2.PdfReader(source_pdf)
+    writer = PyPDF2.PdfWriter()
+    for i in range(num_pages):
+        writer.add_page(reader.pages[i % len(reader.pages)])
+    with open(output_path, 'wb') as f:
+        writer.write(f)
+    return output_path
+
+
+def load_recorded_pages():
+    """Pages PaddleOCR déjà enregistrées dans le dépôt (mode --skip-ocr)"""
+    pages = []
+    for path in sorted(glob.glob(RECORDED_PAGES_GLOB)):
+        with open(path, 'r', encoding='utf-8') as f:
+            pages.append(json.load(f))
+    return pages
+
+
+def load_recorded_logcards():
+    """Pages enregistrées regroupées par segment OCR (segment_XXX_pYY : une LogCard par XXX)"""
+    paths = sorted(glob.glob(RECORDED_PAGES_GLOB))
+    logcards = []
+    for _, group in groupby(paths, key=lambda path: re.sub(r'_p\d+_paddle\.json$', '', path)):
+        pages = []
+        for path in group:
+            with open(path, 'r', encoding='utf-8') as f:
+                pages.append(json.load(f))
+        logcards.append(pages)
+    return logcards
+
+
+# ---------------------------------------------------------------------------
+# Extraction par règles sur les pages enregistrées
+# ---------------------------------------------------------------------------
+
+def _same_value(a, b):
+    return str(a).strip() == str(b).strip()
+
+
+def check_rule_extraction(ground_truth_path):
+    """
+    Rejoue l'extraction par règles sur les pages OCR enregistrées, toutes les pages
+    d'un segment ensemble comme en Phase 2, et compare à la vérité terrain
+
+    Returns:
+        bool: True si aucune LogCard extraite par les règles n'a de champ perdu (renseigné
+              dans la vérité terrain mais null en sortie des règles) ou différent
+    """
+    from layout_engine import segment_to_cells
+    from logcard_rules import extract_logcard_fields
+
+    with open(ground_truth_path, 'r', encoding='utf-8') as f:
+        truth_cards = json.load(f).get('logCards', [])
+    logcards = load_recorded_logcards()
+    if not logcards or not truth_cards:
+        print("❌ Pages OCR enregistrées ou vérité terrain introuvables")
+        return False
+
+    print("📐 EXTRACTION PAR RÈGLES SUR LES PAGES ENREGISTRÉES")
+    print("=" * 50)
+    by_rules, lost_total, different_total = 0, 0, 0
+    for card_index, pages in enumerate(logcards):
+        rows = [cells for page in pages for cells in segment_to_cells(page, conf_thresh=0.30)]
+        data, missing = extract_logcard_fields(rows)
+        truth = truth_cards[card_index]['logCardData'] if card_index < len(truth_cards) else {}
+        if missing:
+            print(f"   🤖 LogCard {card_index + 1}: LLM (non résolus: {', '.join(missing)})")
+            continue
+        by_rules += 1
+        lost = [field for field, value in data.items() if value is None and truth.get(field) is not None]
+        different = [field for field, value in data.items()
+                     if value is not None and truth.get(field) is not None and not _same_value(value, truth[field])]
+        lost_total += len(lost)
+        different_total += len(different)
+        details = ""
+        if lost:
+            details += f" ❌ perdus: {', '.join(lost)}"
+        if different:
+            details += " ❌ différents: " + ", ".join(f"{field}={data[field]!r}/{truth[field]!r}" for field in different)
+        print(f"   📐 LogCard {card_index + 1}: règles{details or ' ✅'}")
+
+    print(f"\n📊 {by_rules}/{len(logcards)} LogCards extraites sans LLM, {lost_total} champs perdus, "
+          f"{different_total} champs différents")
+    return lost_total == 0 and different_total == 0
+
+
+# ---------------------------------------------------------------------------
+# LLM simulé pour la Phase 2
+# ---------------------------------------------------------------------------
+
+class _StubChatHandler(BaseHTTPRequestHandler):
+    """
+    Imite POST /v1/chat/completions de l'API Mistral avec une latence fixe ;
+    une requête sur `rate_limit_every` reçoit un 429 (Retry-After court)
+    """
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(length)
+        time.sleep(self.server.latency)
+
+        with self.server.lock:
+            self.server.requests += 1
+            rate_limited = self.server.rate_limit_every and self.server.requests % self.server.rate_limit_every == 0
+            if rate_limited:
+                self.server.rate_limited += 1
+        if rate_limited:
+            body = json.dumps({"object": "error", "message": "Requests rate limit exceeded",
+                               "type": "rate_limited", "code": "1300"}).encode('utf-8')
+            self.send_response(429)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Retry-After', '0.1')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        content = json.dumps({"logCardData": {"Name": "BENCHMARK", "SN": None, "ATA": None}})
+        body = json.dumps({
+            "id": "benchmark",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": "mistral-large-latest",
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        }).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_llm(latency, rate_limit_every=0):
+    """Démarre le LLM simulé sur un port libre ; retourne (serveur, url)"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubChatHandler)
+    server.latency = latency
+    server.rate_limit_every = max(0, int(rate_limit_every or 0))
+    server.lock = threading.Lock()
+    server.requests = 0
+    server.rate_limited = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+# ---------------------------------------------------------------------------
+# Pipeline
+# ---------------------------------------------------------------------------
+
+def benchmark_document(label, pdf_path, work_dir, args, stub_url):
+    """
+    Exécute toutes les étapes sur un PDF
+
+    Returns:
+        dict: Mesures du document
+    """
+    print(f"\n📄 {label}")
+    os.makedirs(work_dir, exist_ok=True)
+    stages = []
+    state = {}
+
+    with open(pdf_path, 'rb') as f:
+        num_pages = len(PyPDF2.PdfReader(f).pages)
+
+    # 1) Découpage en segments LogCard
+    def split():
+        from ocr_extractor_6_lilian import Phase1OCRExtractor, DocumentStructureManager
+        extractor = Phase1OCRExtractor(None, os.path.join(work_dir, "phase1_ocr"),
+                                       ocr_batch_size=args.ocr_batch_size, ocr_server_url=args.ocr_server)
+        extractor._setup_for_pdf(pdf_path, extractor.output_dir)
+        extractor._analyze_pdf()
+        structure_config = None
+        if args.structure_config:
+            with open(args.structure_config, 'r') as f:
+                structure_config = json.load(f)
+        segments = DocumentStructureManager(structure_config).generate_segments(num_pages)
+        state['extractor'] = extractor
+        state['chunks'] = extractor._split_pdf_by_segments(segments)
+        return {'segments': len(state['chunks'])}
+
+    if not run_stage(stages, "split", num_pages, split, args.verbose):
+        return {'label': label, 'pdf': pdf_path, 'pages': num_pages, 'stages': stages}
+    extractor, chunks = state['extractor'], state['chunks']
+    page_refs = [(chunk, pos, page) for chunk in chunks for pos, page in enumerate(chunk['pages'])]
+
+    # 2) Rendu des pages (images libérées au fur et à mesure)
+    def rasterize():
+        from ocr_extractor_6_lilian import PdfPageRasterizer
+        rasterizer = PdfPageRasterizer(pdf_path, dpi=extractor.dpi)
+        try:
+            pixels = 0
+            for _, _, page in page_refs:
+                img = rasterizer.render_page(page)
+                pixels += img.shape[0] * img.shape[1]
+        finally:
+            rasterizer.close()
+        return {'megapixels': round(pixels / 1e6, 1)}
+
+    run_stage(stages, "rasterize", len(page_refs), rasterize, args.verbose)
+
+    # 3) OCR (rendu inclus, par lots de --ocr-batch-size pages) ou pages enregistrées
+    def ocr():
+        from ocr_extractor_6_lilian import PdfPageRasterizer, _build_ocr_engine, _ocr_images_to_page_jsons
+        engine = _build_ocr_engine(extractor.lang, args.ocr_server)
+        rasterizer = PdfPageRasterizer(pdf_path, dpi=extractor.dpi)
+        page_jsons, ocr_time = [], 0.0
+        try:
+            for start in range(0, len(page_refs), args.ocr_batch_size):
+                refs = page_refs[start:start + args.ocr_batch_size]
+                images = rasterizer.render_pages([page for _, _, page in refs])
+                t0 = time.perf_counter()
+                page_jsons.extend(_ocr_images_to_page_jsons(engine, images))
+                ocr_time += time.perf_counter() - t0
+        finally:
+            rasterizer.close()
+        state['page_jsons'] = page_jsons
+        return {'ocr_only_s': round(ocr_time, 4)}
+
+    if args.skip_ocr:
+        recorded = load_recorded_pages()
+        if not recorded:
+            print("   ❌ Aucune page OCR enregistrée pour --skip-ocr")
+            return {'label': label, 'pdf': pdf_path, 'pages': num_pages, 'stages': stages}
+        state['page_jsons'] = [recorded[i % len(recorded)] for i in range(len(page_refs))]
+        print(f"   ⏭️  ocr ignoré : {len(page_refs)} pages enregistrées réutilisées")
+    elif not run_stage(stages, "ocr", len(page_refs), ocr, args.verbose):
+        return {'label': label, 'pdf': pdf_path, 'pages': num_pages, 'stages': stages}
+    page_jsons = state['page_jsons']
+
+    # 4) Mise en page OCR → Markdown (formes Phase 1 et Phase 2)
+    def layout():
+        from layout_engine import segment_to_text, segment_to_markdown_table
+        tokens = 0
+        for page_json in page_jsons:
+            tokens += len(page_json.get('rec_texts') or [])
+            segment_to_text(page_json, poly_keys=("rec_polys",))
+            segment_to_markdown_table(page_json, max_cols=100)
+        return {'tokens': tokens}
+
+    run_stage(stages, "layout", len(page_jsons), layout, args.verbose)
+
+    # 5) Consolidation Phase 1 (fichiers page par page → JSON + Markdown final)
+    for (chunk, pos, _), page_json in zip(page_refs, page_jsons):
+        path = os.path.join(extractor.temp_dir, f"segment_{chunk['index']:03d}_p{pos+1:02d}_paddle.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(page_json, f, ensure_ascii=False)
+    extractor.progress['completed_chunks'] = len(chunks)
+
+    if not run_stage(stages, "consolidation", len(page_jsons), extractor._consolidate_markdown_results, args.verbose):
+        return {'label': label, 'pdf': pdf_path, 'pages': num_pages, 'stages': stages}
+
+    # 6) Phase 2 avec LLM simulé
+    def phase2():
+        from logcard_analyzer_6_lilian import Phase2LogCardAnalyzer
+        analyzer = Phase2LogCardAnalyzer("benchmark", os.path.join(work_dir, "phase2_logcard"),
+                                         llm_concurrency=args.llm_concurrency, llm_rate=args.llm_rate,
+                                         llm_server_url=stub_url, llm_cache_dir=None)
+        result = analyzer.analyze_markdown_to_logcards(json_path=extractor.final_json_path,
+                                                       output_dir=analyzer.output_dir)
+        if not result or not result.get('success'):
+            raise RuntimeError((result or {}).get('error', "Phase 2 échouée"))
+        state['logcards_json'] = result['json_file']
+        return {'logcards': result['total_logcards']}
+
+    if not run_stage(stages, "phase2_stub_llm", len(page_jsons), phase2, args.verbose):
+        return {'label': label, 'pdf': pdf_path, 'pages': num_pages, 'stages': stages}
+
+    # 7) Validation contre la vérité terrain
+    def validation():
+        from verification_results_2 import compare_and_create_validated_excel
+        validation_dir = os.path.join(work_dir, "validation_results")
+        os.makedirs(validation_dir, exist_ok=True)
+        if not compare_and_create_validated_excel(state['logcards_json'], args.ground_truth, validation_dir):
+            raise RuntimeError("validation échouée")
+
+    run_stage(stages, "validation", len(page_jsons), validation, args.verbose)
+
+    return {'label': label, 'pdf': pdf_path, 'pages': num_pages, 'stages': stages}
+
+
+# ---------------------------------------------------------------------------
+# Résultats
+# ---------------------------------------------------------------------------
+
+def environment_info():
+    """Contexte machine + révision git, pour comparer des exécutions comparables"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                                capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except Exception:
+        commit = None
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'git_commit': commit
+    }
+
+
+def compare_results(current, previous_path):
+    """Affiche l'écart de temps mur par étape avec une exécution précédente"""
+    with open(previous_path, 'r', encoding='utf-8') as f:
+        previous = json.load(f)
+
+    previous_stages = {
+        (doc['label'], stage['stage']): stage
+        for doc in previous.get('documents', []) for stage in doc.get('stages', [])
+    }
+
+    print(f"\n📊 COMPARAISON AVEC {os.path.basename(previous_path)} "
+          f"(commit {previous.get('environment', {}).get('git_commit')})")
+    for doc in current['documents']:
+        print(f"📄 {doc['label']}")
+        for stage in doc['stages']:
+            before = previous_stages.get((doc['label'], stage['stage']))
+            if not before or not before.get('ok') or not stage['ok'] or not before['wall_s']:
+                print(f"   {stage['stage']:<16} {stage['wall_s']:>9.3f}s   (pas de référence)")
+                continue
+            delta = (stage['wall_s'] - before['wall_s']) / before['wall_s'] * 100
+            icon = "🔴" if delta > 10 else ("🟢" if delta < -10 else "⚪")
+            print(f"   {icon} {stage['stage']:<16} {before['wall_s']:>9.3f}s → {stage['wall_s']:>9.3f}s ({delta:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark du pipeline PDF → LogCards")
+    parser.add_argument('--pdf', default=DEFAULT_PDF, help="PDF de référence (défaut: PDF 6 pages du dépôt)")
+    parser.add_argument('--synthetic-pages', type=int, nargs='*', default=[24],
+                        help="Tailles des documents synthétiques à générer (défaut: 24)")
+    parser.add_argument('--structure-config', help="Configuration de structure JSON (optionnelle)")
+    parser.add_argument('--ground-truth', default=DEFAULT_GROUND_TRUTH, help="Vérité terrain pour l'étape de validation")
+    parser.add_argument('--skip-ocr', action='store_true',
+                        help="Ne pas lancer PaddleOCR : réutilise les pages OCR enregistrées dans le dépôt")
+    parser.add_argument('--ocr-batch-size', type=int, default=1, help="Pages par appel PaddleOCR (défaut: 1)")
+    parser.add_argument('--ocr-server', help="URL d'un serveur OCR persistant (optionnel)")
+    parser.add_argument('--llm-latency', type=float, default=0.2, help="Latence simulée du LLM en secondes (défaut: 0.2)")
+    parser.add_argument('--llm-429-every', type=int, default=0,
+                        help="Le LLM simulé répond 429 à une requête sur N (défaut: 0 = jamais)")
+    parser.add_argument('--llm-concurrency', type=int, default=4, help="Appels LLM simultanés en Phase 2 (défaut: 4)")
+    parser.add_argument('--llm-rate', type=float, default=100.0, help="Débit LLM maximal en Phase 2, requêtes/s (défaut: 100)")
+    parser.add_argument('--output-dir', default="BENCHMARK_RESULTS", help="Dossier des résultats (défaut: BENCHMARK_RESULTS)")
+    parser.add_argument('--compare', help="Fichier de résultats précédent à comparer")
+    parser.add_argument('--keep-work', action='store_true', help="Conserver les fichiers intermédiaires")
+    parser.add_argument('--verbose', action='store_true', help="Afficher la sortie des scripts du pipeline")
+    parser.add_argument('--check-rules', action='store_true',
+                        help="Vérifier seulement l'extraction par règles sur les pages OCR enregistrées")
+    args = parser.parse_args()
+    args.ocr_batch_size = max(1, args.ocr_batch_size)
+
+    if args.check_rules:
+        sys.exit(0 if check_rule_extraction(args.ground_truth) else 1)
+
+    if not os.path.exists(args.pdf):
+        print(f"❌ Fichier PDF non trouvé: {args.pdf}")
+        return
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    work_root = os.path.join(args.output_dir, f"work_{timestamp}")
+    os.makedirs(work_root, exist_ok=True)
+
+    print("🏁 BENCHMARK DU PIPELINE PDF → LOGCARDS")
+    print("=" * 50)
+
+    documents = [(f"{os.path.basename(args.pdf)}", args.pdf)]
+    for n in args.synthetic_pages or []:
+        synthetic_path = os.path.join(work_root, f"synthetic_{n}_pages.pdf")
+        build_synthetic_pdf(args.pdf, n, synthetic_path)
+        documents.append((f"synthetic {n} pages", synthetic_path))
+
+    stub_server, stub_url = start_stub_llm(args.llm_latency, args.llm_429_every)
+    try:
+        results = []
+        for i, (label, pdf_path) in enumerate(documents):
+            results.append(benchmark_document(label, pdf_path, os.path.join(work_root, f"doc_{i:02d}"), args, stub_url))
+    finally:
+        stub_server.shutdown()
+    if stub_server.rate_limited:
+        print(f"\n🚦 LLM simulé : {stub_server.rate_limited}/{stub_server.requests} requêtes refusées (429)")
+
+    report = {
+        'benchmark_date': datetime.now().isoformat(),
+        'environment': environment_info(),
+        'config': {
+            'skip_ocr': args.skip_ocr,
+            'ocr_batch_size': args.ocr_batch_size,
+            'ocr_server': args.ocr_server,
+            'llm_latency_s': args.llm_latency,
+            'llm_429_every': args.llm_429_every,
+            'llm_requests': stub_server.requests,
+            'llm_rate_limited': stub_server.rate_limited,
+            'llm_concurrency': args.llm_concurrency,
+            'llm_rate': args.llm_rate,
+            'structure_config': args.structure_config
+        },
+        'documents': results
+    }
+
+    results_path = os.path.join(args.output_dir, f"benchmark_{timestamp}.json")
+    with open(results_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\n💾 Résultats: {results_path}")
+
+    if args.compare:
+        if os.path.exists(args.compare):
+            compare_results(report, args.compare)
+        else:
+            print(f"⚠️ Fichier de comparaison non trouvé: {args.compare}")
+
+    if not args.keep_work:
+        shutil.rmtree(work_root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
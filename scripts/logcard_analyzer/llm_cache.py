@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+llm_cache.py - Cache disque des complétions Mistral de la Phase 2
+Responsabilité : ne pas renvoyer à l'API un prompt déjà analysé (relances --phase2-only)
+Clé = (modèle, température, SHA-256 du prompt)
+"""
+
+import os
+import json
+import time
+import hashlib
+import tempfile
+from types import SimpleNamespace
+
+
+class CachedCompletion:
+    """
+    Réponse reconstruite depuis le cache, avec la même forme que la réponse Mistral
+    utilisée par l'analyseur (choices[0].message.content, usage)
+    """
+
+    def __init__(self, content, usage=None):
+        self.choices = [SimpleNamespace(message=SimpleNamespace(content=content))]
+        self.usage = SimpleNamespace(**usage) if isinstance(usage, dict) else usage
+        self.from_cache = True
+
+
+def _usage_to_dict(usage):
+    """Convertit l'objet usage de la réponse en dict sérialisable"""
+    if usage is None:
+        return None
+    if isinstance(usage, dict):
+        return usage
+    if hasattr(usage, 'model_dump'):
+        return usage.model_dump()
+    if hasattr(usage, '__dict__'):
+        return {k: v for k, v in vars(usage).items() if not k.startswith('_')}
+    return {'raw': str(usage)}
+
+
+class LLMCompletionCache:
+    """
+    Cache persistant des complétions : un fichier JSON par prompt.
+    Les entrées expirent après `ttl_hours` ; au-delà de `max_size_mb`,
+    les moins récemment utilisées (date de modification) sont supprimées.
+    """
+
+    def __init__(self, cache_dir, ttl_hours=24 * 30, max_size_mb=256):
+        """
+        Args:
+            cache_dir (str): Dossier du cache (créé si besoin)
+            ttl_hours (float): Durée de validité d'une réponse (None = illimitée)
+            max_size_mb (float): Taille maximale du cache sur disque
+        """
+        self.cache_dir = cache_dir
+        self.ttl_seconds = ttl_hours * 3600 if ttl_hours else None
+        self.max_bytes = int(max_size_mb * 1024 * 1024) if max_size_mb else None
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        # Compteurs
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+        # Taille estimée, recalculée lors de chaque éviction (la première purge aussi les entrées expirées)
+        self._approx_bytes = 0
+        self.evict()
+
+    @staticmethod
+    def make_key(model, temperature, prompt):
+        """
+        Args:
+            model (str): Modèle Mistral
+            temperature (float): Température de génération
+            prompt (str): Prompt complet envoyé au modèle
+
+        Returns:
+            str: Empreinte hexadécimale
+        """
+        prompt_hash = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+        return hashlib.sha256(f"{model}|{temperature!r}|{prompt_hash}".encode('utf-8')).hexdigest()
+
+    def _path_for(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key):
+        """Retourne la complétion en cache (CachedCompletion) ou None"""
+        path = self._path_for(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+
+        if self.ttl_seconds is not None and time.time() - entry.get('created_at', 0) > self.ttl_seconds:
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+                self._approx_bytes -= size
+                self.evictions += 1
+            except OSError:
+                pass
+            self.misses += 1
+            return None
+
+        # Rafraîchir l'horodatage LRU
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        self.hits += 1
+        return CachedCompletion(entry['content'], entry.get('usage'))
+
+    def put(self, key, response, model=None, temperature=None):
+        """Enregistre la réponse Mistral d'un prompt (écriture atomique)"""
+        entry = {
+            'created_at': time.time(),
+            'model': model,
+            'temperature': temperature,
+            'content': response.choices[0].message.content,
+            'usage': _usage_to_dict(getattr(response, 'usage', None))
+        }
+
+        path = self._path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            replaced_size = os.path.getsize(path)
+        except OSError:
+            replaced_size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False, default=str)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.writes += 1
+        self._approx_bytes += os.path.getsize(path) - replaced_size
+
+        # Parcours du dossier seulement quand la taille estimée dépasse la limite
+        if self.max_bytes is not None and self._approx_bytes > self.max_bytes:
+            self.evict()
+
+    def _iter_entries(self):
+        """(chemin, taille, mtime) de toutes les entrées du cache"""
+        for sub in os.scandir(self.cache_dir):
+            if not sub.is_dir():
+                continue
+            for entry in os.scandir(sub.path):
+                if entry.name.endswith('.json'):
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    yield entry.path, st.st_size, st.st_mtime
+
+    def evict(self):
+        """Supprime les entrées expirées puis les moins récemment utilisées au-delà de la taille maximale"""
+        now = time.time()
+        entries = sorted(self._iter_entries(), key=lambda e: e[2])
+        total_bytes = sum(e[1] for e in entries)
+
+        for path, size, mtime in entries:
+            # mtime >= date de création : une entrée non relue depuis le TTL est forcément expirée
+            expired = self.ttl_seconds is not None and now - mtime > self.ttl_seconds
+            over_size = self.max_bytes is not None and total_bytes > self.max_bytes
+            if not (expired or over_size):
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total_bytes -= size
+            self.evictions += 1
+
+        self._approx_bytes = total_bytes
+
+    def stats(self):
+        """Retourne les compteurs du cache"""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'writes': self.writes,
+            'evictions': self.evictions,
+            'size_mb': self._approx_bytes / (1024 * 1024)
+        }
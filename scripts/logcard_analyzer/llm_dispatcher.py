@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+llm_dispatcher.py - Répartiteur asyncio des appels LLM de la Phase 2
+Responsabilité : lancer plusieurs analyses LogCard en parallèle sans dépasser
+le quota de l'API (limite de concurrence + seau à jetons + recul adaptatif sur 429)
+"""
+
+import time
+import random
+import asyncio
+
+
+class TokenBucket:
+    """Seau à jetons asynchrone : `rate` requêtes/s en régime établi, rafales jusqu'à `capacity`"""
+
+    def __init__(self, rate, capacity=None):
+        """
+        Args:
+            rate (float): Jetons ajoutés par seconde
+            capacity (float): Taille du seau (défaut: max(1, rate))
+        """
+        self.rate = float(rate)
+        self.capacity = float(capacity) if capacity else max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def set_rate(self, rate):
+        """Modifie le débit (les jetons déjà accumulés sont conservés)"""
+        self._refill()
+        self.rate = float(rate)
+
+    async def acquire(self):
+        """
+        Réserve un jeton puis attend qu'il soit disponible. Le solde peut devenir négatif
+        (jetons réservés d'avance) : l'attente est calculée sous le verrou mais a lieu
+        hors du verrou, les appels suivants réservent leur propre créneau sans attendre.
+        """
+        async with self._lock:
+            self._refill()
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+def _rate_limit_delay(error):
+    """
+    Détecte une réponse 429 et retourne le délai Retry-After éventuel
+
+    Returns:
+        tuple: (est_un_429, délai_suggéré_en_secondes ou None)
+    """
+    status = getattr(error, 'status_code', None)
+    response = getattr(error, 'raw_response', None) or getattr(error, 'response', None)
+    if status is None and response is not None:
+        status = getattr(response, 'status_code', None)
+
+    is_rate_limited = status == 429 or (status is None and '429' in str(error))
+    if not is_rate_limited:
+        return False, None
+
+    retry_after = None
+    headers = getattr(response, 'headers', None) if response is not None else None
+    if headers:
+        try:
+            retry_after = float(headers.get('retry-after'))
+        except (TypeError, ValueError):
+            retry_after = None
+    return True, retry_after
+
+
+class AsyncLLMDispatcher:
+    """
+    Exécute une fonction d'appel LLM bloquante sur une liste d'éléments :
+    - au plus `max_concurrency` appels simultanés (threads via asyncio.to_thread)
+    - débit plafonné par un TokenBucket
+    - sur 429 : pause globale exponentielle (ou Retry-After) et division du débit par 2,
+      puis remontée progressive du débit après chaque succès
+    """
+
+    def __init__(self, max_concurrency=4, requests_per_second=1.0, burst=None, max_retries=3,
+                 base_backoff=3.0, max_backoff=60.0, max_rate_limit_retries=8):
+        """
+        Args:
+            max_concurrency (int): Nombre maximal d'appels en vol
+            requests_per_second (float): Débit cible
+            burst (int): Rafale autorisée (défaut: max_concurrency)
+            max_retries (int): Tentatives par élément (hors 429)
+            base_backoff (float): Attente de base entre tentatives (s)
+            max_backoff (float): Attente maximale après 429 (s)
+            max_rate_limit_retries (int): Réponses 429 tolérées par élément avant abandon
+        """
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.target_rate = float(requests_per_second)
+        self.min_rate = self.target_rate / 16
+        self.burst = burst or self.max_concurrency
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.max_rate_limit_retries = max_rate_limit_retries
+
+        # Statistiques
+        self.rate_limited = 0
+        self.retries = 0
+
+    async def _pause_if_rate_limited(self):
+        delay = self._paused_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def _on_rate_limited(self, retry_after):
+        self.rate_limited += 1
+        self._consecutive_429 += 1
+        delay = retry_after or min(self.max_backoff, self.base_backoff * (2 ** (self._consecutive_429 - 1)))
+        delay *= 1 + random.random() * 0.1  # léger jitter pour désynchroniser les appels en vol
+        self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        self.bucket.set_rate(max(self.min_rate, self.bucket.rate / 2))
+        return delay
+
+    def _on_success(self):
+        self._consecutive_429 = 0
+        if self.bucket.rate < self.target_rate:
+            self.bucket.set_rate(min(self.target_rate, self.bucket.rate + self.target_rate / 8))
+
+    async def _run_one(self, item, call, on_result, on_failure, label):
+        async with self._semaphore:
+            attempt = 0
+            rate_limited = 0
+            while True:
+                await self._pause_if_rate_limited()
+                await self.bucket.acquire()
+                try:
+                    result = await asyncio.to_thread(call, item)
+                except Exception as e:
+                    is_rate_limited, retry_after = _rate_limit_delay(e)
+                    if is_rate_limited:
+                        rate_limited += 1
+                        delay = self._on_rate_limited(retry_after)
+                        if rate_limited > self.max_rate_limit_retries:
+                            print(f"❌ {label(item)}: {rate_limited} réponses 429, abandon")
+                            on_failure(item, e)
+                            return False
+                        print(f"🚦 {label(item)}: limite de débit atteinte (429), pause de {delay:.1f}s "
+                              f"(débit ramené à {self.bucket.rate:.2f} req/s)")
+                        continue
+
+                    attempt += 1
+                    print(f"❌ Tentative {attempt}/{self.max_retries} échouée pour {label(item)}: {e}")
+                    if attempt >= self.max_retries:
+                        on_failure(item, e)
+                        return False
+                    self.retries += 1
+                    wait_time = attempt * self.base_backoff
+                    print(f"⏳ Attente de {wait_time}s...")
+                    await asyncio.sleep(wait_time)
+                    continue
+
+                self._on_success()
+                # Exécuté dans la boucle d'événements : pas d'accès concurrent à l'état de l'appelant
+                return on_result(item, result)
+
+    def _reset_state(self):
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.bucket = TokenBucket(self.target_rate, self.burst)
+        self._paused_until = 0.0
+        self._consecutive_429 = 0
+
+    async def run_async(self, items, call, on_result, on_failure, label=str):
+        """
+        Traite tous les éléments ; `on_result`/`on_failure` sont appelés dans l'ordre d'achèvement
+
+        Args:
+            items (list): Éléments à traiter
+            call (callable): call(item) -> résultat, bloquant (exécuté dans un thread)
+            on_result (callable): on_result(item, résultat) -> bool de succès
+            on_failure (callable): on_failure(item, exception) après épuisement des tentatives
+            label (callable): Libellé d'un élément pour les logs
+
+        Returns:
+            int: Nombre d'éléments traités avec succès
+        """
+        self._reset_state()
+        outcomes = await asyncio.gather(
+            *(self._run_one(item, call, on_result, on_failure, label) for item in items)
+        )
+        return sum(1 for ok in outcomes if ok)
+
+    def run(self, items, call, on_result, on_failure, label=str):
+        """Version synchrone de run_async (crée sa propre boucle d'événements)"""
+        return asyncio.run(self.run_async(items, call, on_result, on_failure, label))
+
+    async def run_stream_async(self, next_item, call, on_result, on_failure, label=str, handled=None):
+        """
+        Variante de run_async pour des éléments produits au fil de l'eau (ex: pages
+        sortant de l'OCR) : chaque élément est lancé dès son arrivée, sans attendre les suivants
+
+        Args:
+            next_item (callable): next_item() -> élément suivant, ou None en fin de flux ;
+                                  bloquant, exécuté dans un thread
+            handled (callable): handled(item) -> True si l'élément a été traité sans appel
+                                (règles, cache) ; exécuté dans la boucle d'événements (optionnel)
+            (autres arguments : voir run_async)
+
+        Returns:
+            int: Nombre d'éléments traités avec succès (y compris ceux de `handled`)
+        """
+        self._reset_state()
+        handled_count = 0
+        tasks = []
+        while True:
+            item = await asyncio.to_thread(next_item)
+            if item is None:
+                break
+            if handled is not None and handled(item):
+                handled_count += 1
+                continue
+            tasks.append(asyncio.ensure_future(self._run_one(item, call, on_result, on_failure, label)))
+
+        outcomes = await asyncio.gather(*tasks)
+        return handled_count + sum(1 for ok in outcomes if ok)
+
+    def run_stream(self, next_item, call, on_result, on_failure, label=str, handled=None):
+        """Version synchrone de run_stream_async (crée sa propre boucle d'événements)"""
+        return asyncio.run(self.run_stream_async(next_item, call, on_result, on_failure, label, handled))
@@ -10,32 +10,60 @@ import json
 import time
 import re
 import argparse
+from collections import deque
 from datetime import datetime
 from mistralai import Mistral
 import sys
 import math
 import unicodedata
 import re
-import statistics
 from math import inf
 from itertools import groupby
 
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'ocr_extraction'))
+
+from llm_dispatcher import AsyncLLMDispatcher
+from llm_cache import LLMCompletionCache
+from layout_engine import segment_to_text, segment_to_markdown_table, segment_to_cells, cells_to_markdown_table
+from logcard_rules import extract_logcard_fields
+from ocr_document import OCRDocument
+
+# Paramètres de l'appel LLM (également utilisés dans la clé du cache de complétions)
+LLM_MODEL = "mistral-large-latest"
+LLM_TEMPERATURE = 0.1
+
 
 class Phase2LogCardAnalyzer:
-    def __init__(self, api_key, output_dir=None):
+    def __init__(self, api_key, output_dir=None, llm_concurrency=4, llm_rate=1.0, llm_server_url=None,
+                 llm_cache_dir="LLM_CACHE", llm_cache_ttl_hours=24 * 30, rule_extraction=True):
         """
         Initialise l'analyseur LogCard
         
         Args:
             api_key (str): Clé API Mistral
             output_dir (str): Dossier de sortie (optionnel, sinon créé automatiquement)
+            llm_concurrency (int): Nombre maximal d'appels LLM simultanés
+            llm_rate (float): Débit maximal d'appels LLM (requêtes/seconde)
+            llm_server_url (str): URL alternative de l'API (ex: serveur de test local), optionnelle
+            llm_cache_dir (str): Dossier du cache des complétions (None = cache désactivé)
+            llm_cache_ttl_hours (float): Durée de validité d'une réponse en cache
+            rule_extraction (bool): Extraire d'abord les champs par règles ; seules les LogCards
+                incomplètes sont envoyées au LLM
         """
-        self.client = Mistral(api_key=api_key)
+        if llm_server_url:
+            self.client = Mistral(api_key=api_key, server_url=llm_server_url)
+        else:
+            self.client = Mistral(api_key=api_key)
         self.api_key = api_key
         self.output_dir = output_dir
+        self.llm_concurrency = max(1, int(llm_concurrency or 1))
+        self.llm_rate = llm_rate
+        self.llm_cache = LLMCompletionCache(llm_cache_dir, ttl_hours=llm_cache_ttl_hours) if llm_cache_dir else None
+        self.rule_extraction = rule_extraction
         
         # États
         self.markdown_path = None
+        self.document = None
         self.document_info = None
         self.progress = None
         self.progress_file = None
@@ -80,12 +108,8 @@ class Phase2LogCardAnalyzer:
             
         print(f"🏷️ {len(logcard_pairs)} LogCards identifiées")
         
-        # Traiter chaque LogCard
-        successful_logcards = 0
-        for logcard_info in logcard_pairs:
-            if self._process_logcard_with_llm(logcard_info):
-                successful_logcards += 1
-            time.sleep(1)  # Délai entre LogCards
+        # Traiter les LogCards (appels LLM concurrents, débit limité)
+        successful_logcards = self._process_logcards_concurrently(logcard_pairs)
         
         print(f"\n✅ Analyse LogCard terminée: {successful_logcards}/{len(logcard_pairs)} LogCards réussies")
         
@@ -113,14 +137,154 @@ class Phase2LogCardAnalyzer:
             'temp_directory': self.temp_dir
         }
     
-    def _setup_for_markdown(self, markdown_path, output_dir=None):
-        """Configure l'environnement pour un Markdown spécifique"""
+    def analyze_page_stream(self, pages, json_path, output_dir=None):
+        """
+        Analyse les LogCards au fil de l'OCR (workflow en pipeline) : chaque page est
+        traitée dès sa sortie de la Phase 1, sans attendre le JSON consolidé
+        
+        Args:
+            pages (iterable): (numéro de LogCard, JSON de page) dans l'ordre d'arrivée ;
+                              l'itération (bloquante) se termine avec la Phase 1
+            json_path (str): JSON consolidé de la Phase 1, lu une fois le flux terminé
+                             pour les métadonnées du document
+            output_dir (str): Dossier de sortie spécifique
+            
+        Returns:
+            dict: Résultats de l'analyse (mêmes clés que analyze_markdown_to_logcards,
+                  plus 'first_logcard_seconds')
+        """
+        
+        print("🏷️ PHASE 2 (PIPELINE): ANALYSE LOGCARD AU FIL DE L'OCR")
+        print("="*50)
+        
+        if not self._setup_for_markdown(json_path, output_dir, must_exist=False):
+            return None
+        
+        start_time = datetime.now()
+        iterator = iter(pages)
+        
+        # Extraction par règles : une page n'est transmise qu'avec les autres pages de sa
+        # LogCard (même segment OCR, donc produites ensemble)
+        waiting = {}
+        ready = deque()
+        rule_units = {}
+        
+        def next_logcard():
+            while not ready:
+                item = next(iterator, None)
+                if item is None:
+                    # Fin du flux : pages restées sans le reste de leur segment
+                    for unit_key in sorted(waiting):
+                        ready.extend(waiting.pop(unit_key))
+                    break
+                logcard_number, segment = item
+                logcard_info = self._build_logcard_info(logcard_number, segment)
+                if not self.rule_extraction:
+                    return logcard_info
+                unit_key = self._logcard_unit(logcard_info)
+                unit = waiting.setdefault(unit_key, [])
+                unit.append(logcard_info)
+                rule_units[logcard_number] = unit
+                # Taille du segment transmise par la Phase 1 (2 pages recto/verso sinon)
+                if len(unit) >= (len(logcard_info.get('segment_pages') or ()) or 2):
+                    unit.sort(key=lambda lc: lc['logcard_number'])
+                    ready.extend(waiting.pop(unit_key))
+            return ready.popleft() if ready else None
+        
+        counts = {'received': 0, 'done': 0, 'cached': 0}
+        by_rules = set()
+        
+        def handled(logcard_info):
+            logcard_number = logcard_info['logcard_number']
+            counts['received'] += 1
+            self.progress['total_logcards'] = max(self.progress['total_logcards'], logcard_number)
+            if logcard_number in by_rules:
+                return True
+            if logcard_number in self.progress['logcard_files']:
+                print(f"⏭️  LogCard {logcard_number} déjà analysée")
+                counts['done'] += 1
+                return True
+            unit = rule_units.pop(logcard_number, None)
+            if unit:
+                # Règles essayées une seule fois par LogCard, sur ses pages non analysées
+                for lc in unit:
+                    rule_units.pop(lc['logcard_number'], None)
+                unit = [lc for lc in unit if lc['logcard_number'] not in self.progress['logcard_files']]
+                if self._try_rule_extraction(unit):
+                    by_rules.update(lc['logcard_number'] for lc in unit)
+                    return True
+            response = self._get_cached_completion(logcard_info)
+            if response is not None and self._on_logcard_completion(logcard_info, response):
+                counts['cached'] += 1
+                return True
+            return False
+        
+        dispatcher = AsyncLLMDispatcher(max_concurrency=self.llm_concurrency,
+                                        requests_per_second=self.llm_rate)
+        successful_logcards = dispatcher.run_stream(
+            next_logcard,
+            call=self._request_logcard_completion,
+            on_result=self._on_logcard_completion,
+            on_failure=lambda logcard_info, error: self._record_logcard_failure(logcard_info['logcard_number']),
+            label=lambda logcard_info: f"LogCard {logcard_info['logcard_number']}",
+            handled=handled
+        )
+        total_logcards = counts['received']
+        self.progress['total_logcards'] = total_logcards
+        self._save_progress()
+        
+        if dispatcher.rate_limited:
+            print(f"🚦 {dispatcher.rate_limited} réponses 429 rencontrées")
+        print(f"📐 Règles: {len(by_rules)} LogCards, ⚡ cache LLM: {counts['cached']} LogCards, "
+              f"🤖 LLM: {total_logcards - counts['done'] - len(by_rules) - counts['cached']} LogCards")
+        print(f"\n✅ Analyse LogCard terminée: {successful_logcards}/{total_logcards} LogCards réussies")
+        
+        # Délai entre le début du flux et la première LogCard enregistrée
+        completed_at = [datetime.fromisoformat(info['completed_at'])
+                        for info in self.progress['logcard_files'].values() if 'completed_at' in info]
+        first_logcard_seconds = None
+        if completed_at:
+            first_logcard_seconds = max(0.0, (min(completed_at) - start_time).total_seconds())
+        
+        # Le flux est terminé : le JSON consolidé de la Phase 1 existe s'il a réussi
+        if successful_logcards > 0 and os.path.exists(json_path) and self._analyze_markdown_structure():
+            final_json = self._consolidate_logcard_results()
+            if final_json:
+                self.progress['completed'] = True
+                self._save_progress()
+                
+                return {
+                    'success': True,
+                    'json_file': self.final_json_path,
+                    'temp_directory': self.temp_dir,
+                    'output_directory': self.output_dir,
+                    'document_info': self.document_info,
+                    'logcards_processed': successful_logcards,
+                    'total_logcards': total_logcards,
+                    'progress_file': self.progress_file,
+                    'first_logcard_seconds': first_logcard_seconds
+                }
+        
+        return {
+            'success': False,
+            'error': f"Seulement {successful_logcards}/{total_logcards} LogCards réussies",
+            'temp_directory': self.temp_dir,
+            'first_logcard_seconds': first_logcard_seconds
+        }
+    
+    def _setup_for_markdown(self, markdown_path, output_dir=None, must_exist=True):
+        """
+        Configure l'environnement pour un Markdown spécifique
+        (must_exist=False : fichier encore en cours de production par la Phase 1)
+        """
         
-        if not os.path.exists(markdown_path):
+        if must_exist and not os.path.exists(markdown_path):
             print(f"❌ Fichier Markdown non trouvé: {markdown_path}")
             return False
             
         self.markdown_path = markdown_path
+        # JSON de la Phase 1 ouvert une seule fois pour les métadonnées et les segments
+        self.document = OCRDocument(markdown_path)
         
         # Créer la structure de dossiers
         if output_dir:
@@ -156,6 +320,10 @@ class Phase2LogCardAnalyzer:
             try:
                 with open(self.progress_file, 'r') as f:
                     self.progress = json.load(f)
+                # Les clés JSON sont des chaînes : revenir aux numéros de LogCard
+                self.progress['logcard_files'] = {
+                    int(number): info for number, info in self.progress['logcard_files'].items()
+                }
                 print(f"📂 Progression existante: {self.progress['completed_logcards']}/{self.progress['total_logcards']} LogCards")
                 return
             except:
@@ -173,18 +341,21 @@ class Phase2LogCardAnalyzer:
         }
     
     def _save_progress(self):
-        """Sauvegarde la progression"""
-        with open(self.progress_file, 'w') as f:
-            json.dump(self.progress, f, indent=2)
+        """Sauvegarde la progression (écriture atomique, LogCards triées par numéro)"""
+        progress = dict(self.progress)
+        progress['logcard_files'] = dict(sorted(self.progress['logcard_files'].items()))
+        progress['failed_logcards'] = sorted(self.progress['failed_logcards'])
+        
+        tmp_file = f"{self.progress_file}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(progress, f, indent=2)
+        os.replace(tmp_file, self.progress_file)
     
     def _analyze_markdown_structure(self):
         """Analyse la structure du fichier JSON"""
         try:
-            with open(self.markdown_path, 'r', encoding='utf-8') as f:
-                json_data = json.load(f)
-            
             # Extraire les métadonnées
-            metadata = json_data.get('metadata', {})
+            metadata = self.document.metadata
             
             # Compter les pages totales
             total_pages = metadata.get('total_pages', 0)
@@ -192,7 +363,7 @@ class Phase2LogCardAnalyzer:
             self.document_info = {
                 'filename': metadata.get('source_file', os.path.basename(self.markdown_path)),
                 'total_pages': total_pages,
-                'content_length': len(str(json_data)),
+                'content_length': self.document.file_size,
                 'metadata': metadata,
                 'analysis_date': datetime.now().isoformat(),
                 'segments_processed': metadata.get('segments_processed', 0),
@@ -213,42 +384,22 @@ class Phase2LogCardAnalyzer:
     def _identify_logcard_pairs(self):
         """Identifie les paires de pages constituant les LogCards à partir du JSON"""
         
-        # Charger le fichier JSON
+        # Segments de type logcard, en un seul passage : seules les cellules et le
+        # markdown de chaque page sont conservés, pas les polygones OCR bruts.
+        # Numéro de LogCard fixé par la Phase 1 s'il est présent (même numérotation
+        # que le workflow en pipeline), sinon rang dans le fichier
+        logcard_pairs = []
         try:
-            with open(self.markdown_path, 'r', encoding='utf-8') as f:
-                json_data = json.load(f)
+            for segment in self.document.iter_segments():
+                segment_info = segment.get('segment_info', {})
+                if segment_info.get('type') == 'logcard':
+                    logcard_number = segment_info.get('logcard_number') or len(logcard_pairs) + 1
+                    logcard_pairs.append(self._build_logcard_info(logcard_number, segment))
         except Exception as e:
             print(f"❌ Erreur lors du chargement du JSON: {e}")
             return []
         
-        # Extraire les segments de type logcard
-        logcard_segments = [
-            segment for segment in json_data.get('segments', [])
-            if segment.get('segment_info', {}).get('type') == 'logcard'
-        ]
-        
-        print(f"🔍 {len(logcard_segments)} segments LogCard identifiés")
-        
-        # Créer les paires LogCard
-        logcard_pairs = []
-        for i, segment in enumerate(logcard_segments):
-            segment_info = segment.get('segment_info', {})
-            pages = self._get_segment_pages(segment)
-            start_page = pages[0] if pages else segment_info.get('start_page')
-            end_page   = pages[-1] if pages else segment_info.get('end_page')
-
-            # markdown robuste pour ce segment
-            full_md = self._get_segment_markdown(segment)
-
-            logcard_pairs.append({
-                'logcard_number': i + 1,
-                'start_page': start_page,
-                'end_page': end_page,
-                'page_numbers': pages,
-                'full_markdown': full_md,
-                'segment_index': segment_info.get('index')
-            })
-        
+        print(f"🔍 {len(logcard_pairs)} segments LogCard identifiés")
         print(f"🏷️ {len(logcard_pairs)} paires LogCard créées")
         
         # Mettre à jour la progression
@@ -257,7 +408,100 @@ class Phase2LogCardAnalyzer:
         
         return logcard_pairs
     
+    def _build_logcard_info(self, logcard_number, segment):
+        """Prépare une LogCard (pages, cellules OCR, markdown) à partir d'un segment JSON de page"""
+        segment_info = segment.get('segment_info', {})
+        pages = self._get_segment_pages(segment)
+        start_page = pages[0] if pages else segment_info.get('start_page')
+        end_page   = pages[-1] if pages else segment_info.get('end_page')
+
+        # Cellules OCR (extraction par règles) et markdown robuste pour ce segment
+        rows = segment_to_cells(segment, conf_thresh=0.30)
+        full_md = cells_to_markdown_table(rows, min_cols=2, max_cols=100) if rows else ""
+
+        return {
+            'logcard_number': logcard_number,
+            'start_page': start_page,
+            'end_page': end_page,
+            'page_numbers': pages,
+            'full_markdown': full_md,
+            'rows': rows,
+            'segment_index': segment_info.get('index'),
+            'segment_pages': segment_info.get('segment_pages'),
+            'page_label': segment_info.get('page_label')
+        }
     
+    @staticmethod
+    def _logcard_unit(logcard_info):
+        """
+        LogCard physique d'une page : son segment OCR (recto, verso et continuations).
+        Résultat de Phase 1 sans index de segment : pages 2k-1 (recto) et 2k (verso)
+        """
+        if logcard_info.get('segment_index') is not None:
+            return ('segment', logcard_info['segment_index'])
+        return ('pair', (logcard_info['logcard_number'] + 1) // 2)
+    
+    def _process_logcards_concurrently(self, logcard_pairs):
+        """
+        Analyse les LogCards via le répartiteur asyncio : plusieurs appels LLM en vol,
+        débit limité par seau à jetons et recul adaptatif sur les réponses 429.
+        Les résultats sont enregistrés dans l'ordre d'achèvement.
+        
+        Returns:
+            int: Nombre de LogCards analysées (y compris celles déjà présentes)
+        """
+        already_done = [lc for lc in logcard_pairs if lc['logcard_number'] in self.progress['logcard_files']]
+        for logcard_info in already_done:
+            print(f"⏭️  LogCard {logcard_info['logcard_number']} déjà analysée")
+        pending = [lc for lc in logcard_pairs if lc['logcard_number'] not in self.progress['logcard_files']]
+        
+        # Champs déterministes lus par règles sur toutes les pages du segment ensemble :
+        # ces LogCards n'ont pas besoin du LLM
+        by_rules = 0
+        if self.rule_extraction:
+            remaining = []
+            for _, unit in groupby(pending, key=self._logcard_unit):
+                unit = list(unit)
+                if self._try_rule_extraction(unit):
+                    by_rules += len(unit)
+                else:
+                    remaining.extend(unit)
+            pending = remaining
+            print(f"📐 Règles: {by_rules} LogCards extraites sans LLM, {len(pending)} à envoyer au LLM")
+        
+        # Les réponses en cache ne passent pas par le limiteur de débit
+        cached = 0
+        if self.llm_cache is not None:
+            remaining = []
+            for logcard_info in pending:
+                response = self._get_cached_completion(logcard_info)
+                if response is None:
+                    remaining.append(logcard_info)
+                elif self._on_logcard_completion(logcard_info, response):
+                    cached += 1
+            pending = remaining
+            stats = self.llm_cache.stats()
+            print(f"⚡ Cache LLM: {stats['hits']} réponses réutilisées, {stats['misses']} à demander")
+        
+        if not pending:
+            return len(already_done) + by_rules + cached
+        
+        print(f"🚀 {len(pending)} LogCards à analyser "
+              f"({self.llm_concurrency} appels simultanés max, {self.llm_rate} req/s)")
+        
+        dispatcher = AsyncLLMDispatcher(max_concurrency=self.llm_concurrency,
+                                        requests_per_second=self.llm_rate)
+        successful = dispatcher.run(
+            pending,
+            call=self._request_logcard_completion,
+            on_result=self._on_logcard_completion,
+            on_failure=lambda logcard_info, error: self._record_logcard_failure(logcard_info['logcard_number']),
+            label=lambda logcard_info: f"LogCard {logcard_info['logcard_number']}"
+        )
+        
+        if dispatcher.rate_limited:
+            print(f"🚦 {dispatcher.rate_limited} réponses 429 rencontrées")
+        return len(already_done) + by_rules + cached + successful
     
     def _process_logcard_with_llm(self, logcard_info):
         """Traite une LogCard avec le LLM"""
@@ -269,42 +513,15 @@ class Phase2LogCardAnalyzer:
             print(f"⏭️  LogCard {logcard_number} déjà analysée")
             return True
         
+        response = self._get_cached_completion(logcard_info)
+        if response is not None:
+            return self._on_logcard_completion(logcard_info, response)
+        
         max_retries = 3
         for attempt in range(max_retries):
             try:
-                print(f"🏷️ Analyse LogCard {logcard_number} ({self.progress['completed_logcards']+1}/{self.progress['total_logcards']}) - Pages {logcard_info['start_page']}-{logcard_info['end_page']}...")
-                
-                # Combiner le contenu des deux pages
-                combined_content = logcard_info['full_markdown']
-                
-                # Prompt pour l'analyse LogCard
-                analysis_prompt = f"""
-{self._get_logcard_analysis_prompt()}
-
-CONTENU DE LA LOGCARD {logcard_number} À ANALYSER (PAGES {logcard_info['start_page']}-{logcard_info['end_page']}) :
-
-{combined_content}
-"""
-                
-                # Appel au LLM
-                response = self.client.chat.complete(
-                    model="mistral-large-latest",
-                    messages=[
-                        {
-                            "role": "user", 
-                            "content": analysis_prompt
-                        }
-                    ],
-                    temperature=0.1
-                )
-
-                print(f"response.usage : {response.usage}")
-                
-                # Extraire et sauvegarder le résultat
-                self._save_logcard_result(logcard_number, response, logcard_info, combined_content)
-                
-                print(f"✅ LogCard {logcard_number} analysée!")
-                return True
+                response = self._request_logcard_completion(logcard_info)
+                return self._on_logcard_completion(logcard_info, response)
                 
             except Exception as e:
                 print(f"❌ Tentative {attempt+1}/{max_retries} échouée pour LogCard {logcard_number}: {e}")
@@ -313,17 +530,123 @@ CONTENU DE LA LOGCARD {logcard_number} À ANALYSER (PAGES {logcard_info['start_p
                     print(f"⏳ Attente de {wait_time}s...")
                     time.sleep(wait_time)
         
-        # Marquer comme échouée
-        self.progress['failed_logcards'].append(logcard_number)
+        self._record_logcard_failure(logcard_number)
+        return False
+    
+    def _try_rule_extraction(self, logcard_infos):
+        """
+        Extrait une LogCard physique par règles si tous les champs déterministes sont
+        trouvés sans ambiguïté sur l'ensemble de ses pages (identification au recto,
+        installations aussi au verso)
+        
+        Args:
+            logcard_infos (list): Pages de la LogCard (segment OCR : recto, verso, continuations)
+        
+        Returns:
+            bool: True si les pages sont enregistrées (pas d'appel LLM), False sinon
+        """
+        rows = [cells for logcard_info in logcard_infos for cells in logcard_info.get('rows') or []]
+        if not rows:
+            return False
+        
+        logcard_data, missing = extract_logcard_fields(rows)
+        if missing:
+            return False
+        
+        # Chaque page garde son fichier (fusion par segment à la consolidation)
+        for logcard_info in logcard_infos:
+            logcard_number = logcard_info['logcard_number']
+            structured_data = {
+                "logCard": logcard_number,
+                "pageNumbers": logcard_info['page_numbers'],
+                "logCardData": dict(logcard_data),
+                "originalMarkdown": logcard_info['full_markdown'],
+                "extractionMethod": "rules"
+            }
+            self._store_logcard_data(logcard_number, logcard_info, structured_data)
+        numbers = "+".join(str(logcard_info['logcard_number']) for logcard_info in logcard_infos)
+        print(f"📐 LogCard {numbers} extraite par règles: {logcard_data['Name']}")
+        return True
+    
+    def _build_logcard_prompt(self, logcard_info):
+        """Construit le prompt d'analyse d'une LogCard"""
+        logcard_number = logcard_info['logcard_number']
+        
+        # Combiner le contenu des deux pages
+        combined_content = logcard_info['full_markdown']
+        
+        # Prompt pour l'analyse LogCard
+        return f"""
+{self._get_logcard_analysis_prompt()}
+
+CONTENU DE LA LOGCARD {logcard_number} À ANALYSER (PAGES {logcard_info['start_page']}-{logcard_info['end_page']}) :
+
+{combined_content}
+"""
+    
+    def _get_cached_completion(self, logcard_info):
+        """Retourne la réponse LLM en cache pour cette LogCard, ou None"""
+        if self.llm_cache is None:
+            return None
+        key = LLMCompletionCache.make_key(LLM_MODEL, LLM_TEMPERATURE, self._build_logcard_prompt(logcard_info))
+        response = self.llm_cache.get(key)
+        if response is not None:
+            print(f"⚡ LogCard {logcard_info['logcard_number']} - réponse LLM en cache")
+        return response
+    
+    def _request_logcard_completion(self, logcard_info):
+        """Construit le prompt d'une LogCard et appelle le LLM (bloquant, sans effet sur la progression)"""
+        
+        logcard_number = logcard_info['logcard_number']
+        print(f"🏷️ Analyse LogCard {logcard_number} ({self.progress['completed_logcards']+1}/{self.progress['total_logcards']}) - Pages {logcard_info['start_page']}-{logcard_info['end_page']}...")
+        
+        analysis_prompt = self._build_logcard_prompt(logcard_info)
+        
+        # Appel au LLM
+        response = self.client.chat.complete(
+            model=LLM_MODEL,
+            messages=[
+                {
+                    "role": "user", 
+                    "content": analysis_prompt
+                }
+            ],
+            temperature=LLM_TEMPERATURE
+        )
+
+        print(f"response.usage : {response.usage}")
+        return response
+    
+    def _on_logcard_completion(self, logcard_info, response):
+        """
+        Enregistre la réponse LLM d'une LogCard et met à jour la progression ; la réponse
+        n'est mise en cache qu'une fois son JSON extrait (une réponse illisible sera redemandée)
+        """
+        logcard_number = logcard_info['logcard_number']
+        parsed = self._save_logcard_result(logcard_number, response, logcard_info, logcard_info['full_markdown'])
+        
+        if parsed and self.llm_cache is not None and not getattr(response, 'from_cache', False):
+            key = LLMCompletionCache.make_key(LLM_MODEL, LLM_TEMPERATURE, self._build_logcard_prompt(logcard_info))
+            self.llm_cache.put(key, response, model=LLM_MODEL, temperature=LLM_TEMPERATURE)
+        print(f"✅ LogCard {logcard_number} analysée!")
+        return True
+    
+    def _record_logcard_failure(self, logcard_number):
+        """Marque une LogCard comme échouée"""
+        if logcard_number not in self.progress['failed_logcards']:
+            self.progress['failed_logcards'].append(logcard_number)
         self._save_progress()
         print(f"💥 LogCard {logcard_number} a échoué définitivement")
-        return False
     
     def _save_logcard_result(self, logcard_number, llm_response, logcard_info, combined_content):
-        """Sauvegarde le résultat LLM d'une LogCard"""
+        """
+        Sauvegarde le résultat LLM d'une LogCard
         
-        logcard_file = os.path.join(self.temp_dir, f"logcard_{logcard_number:03d}.json")
+        Returns:
+            bool: True si le JSON de la réponse a été extrait (False : enregistrement de secours)
+        """
         
+        parsed = False
         try:
             # Extraire le JSON de la réponse
             response_content = llm_response.choices[0].message.content
@@ -347,6 +670,7 @@ CONTENU DE LA LOGCARD {logcard_number} À ANALYSER (PAGES {logcard_info['start_p
                 # Extraire le nom pour le logging
                 name = structured_data.get('logCardData', {}).get('Name', 'N/A')
                 print(f"🏷️  LogCard {logcard_number} - Données extraites: {name}")
+                parsed = True
                 
             else:
                 # Fallback
@@ -372,7 +696,13 @@ CONTENU DE LA LOGCARD {logcard_number} À ANALYSER (PAGES {logcard_info['start_p
                 "rawLlmResponse": llm_response.choices[0].message.content
             }
         
-        # Sauvegarder
+        self._store_logcard_data(logcard_number, logcard_info, structured_data)
+        return parsed
+    
+    def _store_logcard_data(self, logcard_number, logcard_info, structured_data):
+        """Écrit le JSON d'une LogCard et met à jour la progression"""
+        
+        logcard_file = os.path.join(self.temp_dir, f"logcard_{logcard_number:03d}.json")
         with open(logcard_file, 'w', encoding='utf-8') as f:
             json.dump(structured_data, f, indent=2, ensure_ascii=False)
         
@@ -380,43 +710,49 @@ CONTENU DE LA LOGCARD {logcard_number} À ANALYSER (PAGES {logcard_info['start_p
         self.progress['logcard_files'][logcard_number] = {
             'file': logcard_file,
             'page_numbers': logcard_info['page_numbers'],
+            'segment_index': logcard_info.get('segment_index'),
+            'page_label': logcard_info.get('page_label'),
             'completed_at': datetime.now().isoformat()
         }
-        self.progress['completed_logcards'] += 1
+        self.progress['completed_logcards'] = len(self.progress['logcard_files'])
+        if logcard_number in self.progress['failed_logcards']:
+            self.progress['failed_logcards'].remove(logcard_number)
         self._save_progress()
     
     def _consolidate_logcard_results(self):
-        """Consolide les résultats LogCard 2 par 2 (recto/verso)."""
+        """Consolide les résultats LogCard par segment OCR (recto, verso et continuations)."""
 
         from copy import deepcopy
         from datetime import datetime
 
-        print("🔄 Consolidation des résultats LogCard (recto+verso)...")
+        print("🔄 Consolidation des résultats LogCard (recto+verso, par segment)...")
 
         def is_nullish(v):
             return v is None or (isinstance(v, str) and v.strip().lower() in {"", "null", "none", "na", "n/a"})
 
-        def merge_two_cards(card1, card2):
+        def merge_cards(cards):
+            """Fusionne les pages d'une LogCard : recto d'abord, puis verso et continuations"""
+            card1 = cards[0]
+            card2 = cards[1] if len(cards) > 1 else None
             merged = deepcopy(card1)
             d1 = merged.get("logCardData", {}) or {}
-            d2 = (card2 or {}).get("logCardData", {}) or {}
-
-            # Remplir uniquement les champs nuls du recto avec ceux du verso
-            for key in set(d1.keys()) | set(d2.keys()):
-                if key not in d1 or is_nullish(d1.get(key)):
-                    val2 = d2.get(key)
-                    if not is_nullish(val2):
-                        d1[key] = val2
+
+            # Remplir uniquement les champs nuls du recto avec ceux des pages suivantes
+            for card in cards[1:]:
+                d2 = card.get("logCardData", {}) or {}
+                for key in set(d1.keys()) | set(d2.keys()):
+                    if key not in d1 or is_nullish(d1.get(key)):
+                        val2 = d2.get(key)
+                        if not is_nullish(val2):
+                            d1[key] = val2
             merged["logCardData"] = d1
 
             # Fusion des numéros de pages
-            pages1 = merged.get("pageNumbers", []) or []
-            pages2 = (card2 or {}).get("pageNumbers", []) or []
-            merged["pageNumbers"] = sorted(set(pages1 + pages2))
+            merged["pageNumbers"] = sorted(set(page for card in cards for page in card.get("pageNumbers", []) or []))
 
-            # Conserver les deux markdowns
+            # Conserver les markdowns de toutes les pages
             merged["originalMarkdown"] = {
-                "front_page_markdown": merged.get("originalMarkdown"),
+                "front_page_markdown": card1.get("originalMarkdown"),
                 "back_page_markdown": (card2 or {}).get("originalMarkdown"),
             }
 
@@ -425,31 +761,39 @@ CONTENU DE LA LOGCARD {logcard_number} À ANALYSER (PAGES {logcard_info['start_p
                 "front_logCard_index": card1.get("logCard"),
                 "back_logCard_index": (card2 or {}).get("logCard"),
             }
-            return merged
 
-        all_logcards = []
+            # Feuilles de continuation (segments de plus de deux pages)
+            if len(cards) > 2:
+                merged["originalMarkdown"]["continuation_page_markdowns"] = [
+                    card.get("originalMarkdown") for card in cards[2:]]
+                merged["pairInfo"]["continuation_logCard_indexes"] = [card.get("logCard") for card in cards[2:]]
+            return merged
 
-        # Charger tous les fichiers temporaires générés
+        # Charger tous les fichiers temporaires générés, regroupés par LogCard physique
+        # (segment OCR) : une page manquante ne décale pas les LogCards suivantes
+        units = []
         sorted_logcards = sorted(
             self.progress['logcard_files'].items(),
             key=lambda x: x[0]
         )
 
-        for _, logcard_info in sorted_logcards:
+        for logcard_number, logcard_info in sorted_logcards:
             path = logcard_info['file']
             if not os.path.exists(path):
                 continue
             with open(path, 'r', encoding='utf-8') as f:
-                all_logcards.append(json.load(f))
+                card = json.load(f)
+            unit_key = self._logcard_unit({'logcard_number': logcard_number,
+                                           'segment_index': logcard_info.get('segment_index')})
+            if not units or units[-1][0] != unit_key:
+                units.append((unit_key, []))
+            units[-1][1].append((logcard_info.get('page_label'), card))
 
-        # Fusion par paires
+        # Fusion par segment, le recto détecté en tête
         merged_cards = []
-        i = 0
-        while i < len(all_logcards):
-            front = all_logcards[i]
-            back = all_logcards[i+1] if i+1 < len(all_logcards) else None
-            merged_cards.append(merge_two_cards(front, back))
-            i += 2
+        for _, unit in units:
+            unit.sort(key=lambda item: item[0] != 'logcard_front')
+            merged_cards.append(merge_cards([card for _, card in unit]))
 
         # Construire le JSON final
         final_data = {
@@ -459,7 +803,7 @@ CONTENU DE LA LOGCARD {logcard_number} À ANALYSER (PAGES {logcard_info['start_p
                 "analysisDate": self.progress.get('start_time'),
                 "consolidationDate": datetime.now().isoformat(),
                 "documentMetadata": self.document_info.get('metadata', {}),
-                "note": "Fusion recto+verso : champs nuls du recto complétés avec le verso"
+                "note": "Fusion par LogCard (recto+verso, continuations) : champs nuls du recto complétés avec les pages suivantes"
             },
             "logCards": merged_cards
         }
@@ -540,119 +884,10 @@ CONTENU DE LA LOGCARD {logcard_number} À ANALYSER (PAGES {logcard_info['start_p
 
 
 
-    def _tokens_from_seg(self,seg, conf_thresh=0.30):
-        texts  = seg.get("rec_texts")  or []
-        scores = seg.get("rec_scores") or []
-        boxes  = seg.get("rec_boxes")
-        polys  = seg.get("rec_polys") or seg.get("dt_polys")
-
-        toks = []
-        if boxes and len(boxes) == len(texts):
-            for t, sc, b in zip(texts, scores, boxes):
-                sc = float(sc or 0.0)
-                if not t or sc < conf_thresh: 
-                    continue
-                xmin,ymin,xmax,ymax = map(float, b)
-                toks.append({
-                    "text": t.strip(),
-                    "cx": 0.5*(xmin+xmax), "cy": 0.5*(ymin+ymax),
-                    "xmin": xmin, "xmax": xmax, "ymin": ymin, "ymax": ymax,
-                    "h": max(1.0, ymax-ymin)
-                })
-        elif polys and len(polys) == len(texts):
-            for t, sc, poly in zip(texts, scores, polys):
-                sc = float(sc or 0.0)
-                if not t or sc < conf_thresh:
-                    continue
-                xs = [p[0] for p in poly]; ys = [p[1] for p in poly]
-                xmin,ymin,xmax,ymax = min(xs),min(ys),max(xs),max(ys)
-                toks.append({
-                    "text": t.strip(),
-                    "cx": sum(xs)/len(xs), "cy": sum(ys)/len(ys),
-                    "xmin": xmin, "xmax": xmax, "ymin": ymin, "ymax": ymax,
-                    "h": max(1.0, ymax-ymin)
-                })
-        toks.sort(key=lambda d: (d["cy"], d["cx"]))
-        return toks
-
-    def _bucket_rows_by_y(self,toks,tolerenance):
-        """ regroupe les tokens par lignes (tolérance basée sur médiane des hauteurs) """
-        if not toks: return []
-        med_h = statistics.median(t["h"] for t in toks)
-        tol = max(8.0, tolerenance*med_h)
-        rows = []
-        cur = []
-        cur_y = None
-        for t in toks:
-            if cur_y is None or abs(t["cy"] - cur_y) <= tol:
-                if cur_y is None:
-                    cur_y = t["cy"]
-                cur.append(t)
-            else:
-                rows.append(sorted(cur, key=lambda d: d["cx"]))
-                cur = [t]; cur_y = t["cy"]
-        if cur: rows.append(sorted(cur, key=lambda d: d["cx"]))
-        return rows
-
-    def _split_row_into_columns(self,row, min_gap_ratio=0.35):
-        """
-        découpe une ligne en colonnes en détectant les 'grands gaps' horizontaux.
-        min_gap_ratio: fraction de la largeur moyenne d’un mot pour décider un saut de colonne.
-        """
-        if not row: return [row]
-        # largeur moyenne
-        widths = [(t["xmax"]-t["xmin"]) for t in row]
-        avg_w = max(1.0, sum(widths)/len(widths))
-
-        cols = [[]]
-        prev = None
-        for t in row:
-            if prev is None:
-                cols[-1].append(t)
-                prev = t
-                continue
-            gap = t["xmin"] - prev["xmax"]
-            if gap > min_gap_ratio * avg_w:
-                cols.append([t])
-            else:
-                cols[-1].append(t)
-            prev = t
-        return cols
-
-    def _rows_to_markdown_table(self,rows, min_cols=2, max_cols=None):
-        """
-        Convertit des lignes -> table Markdown.
-        On harmonise le nombre de colonnes sur l’ensemble (max observé borné).
-        """
-        # transformer chaque ligne en liste de cellules (chaque cellule = concat des tokens)
-        line_cells = []
-        maxc = 0
-        for row in rows:
-            cols = self._split_row_into_columns(row)
-            cells = [" ".join(t["text"] for t in c).strip() for c in cols]
-            maxc = max(maxc, len(cells))
-            line_cells.append(cells)
-        maxc = max(min_cols, min(maxc, max_cols))
-
-        # normaliser la largeur (ajouter cellules vides à droite si besoin)
-        line_cells = [c + [""]*(maxc-len(c)) if len(c)<maxc else c[:maxc] for c in line_cells]
-
-        # construire markdown
-        header = "| " + " | ".join(f"Col {i+1}" for i in range(maxc)) + " |"
-        sep    = "| " + " | ".join("---" for _ in range(maxc)) + " |"
-        body   = "\n".join("| " + " | ".join(c.replace("|","/") for c in cells) + " |" for cells in line_cells)
-        return header + "\n" + sep + "\n" + body
-
-
     def _paddle_segment_to_markdown_table(self, seg: dict, conf_thresh: float = 0.30,
                                       min_cols: int = 2, max_cols: int = 100) -> str:
-        toks = self._tokens_from_seg(seg, conf_thresh=conf_thresh)
-        if not toks:
-            return ""
-        rows = self._bucket_rows_by_y(toks,tolerenance=0.6)
-        if not rows:
-            return ""
-        return self._rows_to_markdown_table(rows, min_cols=min_cols, max_cols=max_cols)
+        return segment_to_markdown_table(seg, conf_thresh=conf_thresh, min_cols=min_cols,
+                                         max_cols=max_cols, tolerance=0.6)
 
     def _paddle_segment_to_markdown(self, seg: dict, conf_thresh: float = 0.30) -> str:
         """
@@ -660,62 +895,7 @@ CONTENU DE LA LOGCARD {logcard_number} À ANALYSER (PAGES {logcard_info['start_p
         rec_texts/rec_scores + rec_boxes([xmin,ymin,xmax,ymax]) OU rec_polys([[x,y],...]*4).
         Regroupe par lignes : haut→bas puis gauche→droite.
         """
-        texts  = seg.get("rec_texts")  or []
-        scores = seg.get("rec_scores") or []
-        boxes  = seg.get("rec_boxes")
-        polys  = seg.get("rec_polys") or seg.get("dt_polys")  # tolérance si clé s'appelle dt_polys
-
-        items = []
-        if boxes and len(boxes) == len(texts):
-            for txt, sc, b in zip(texts, scores, boxes):
-                try: sc = float(sc)
-                except: sc = 0.0
-                if not txt or sc < conf_thresh: 
-                    continue
-                xmin, ymin, xmax, ymax = map(float, b)
-                cx = 0.5*(xmin+xmax); cy = 0.5*(ymin+ymax)
-                h  = max(1.0, ymax-ymin)
-                items.append((cy, cx, h, txt.strip()))
-        elif polys and len(polys) == len(texts):
-            for txt, sc, poly in zip(texts, scores, polys):
-                try: sc = float(sc)
-                except: sc = 0.0
-                if not txt or sc < conf_thresh: 
-                    continue
-                xs = [p[0] for p in poly]; ys = [p[1] for p in poly]
-                cx = sum(xs)/len(xs); cy = sum(ys)/len(ys)
-                h  = max(1.0, (max(ys)-min(ys)))
-                items.append((cy, cx, h, txt.strip()))
-        else:
-            return ""
-
-        if not items:
-            return ""
-
-        items.sort(key=lambda t: (t[0], t[1]))  # y puis x
-
-        try:
-            import statistics
-            med_h = statistics.median([t[2] for t in items])
-        except Exception:
-            med_h = 12.0
-        tol = max(8.0, 0.6*med_h)
-
-        lines, current_line, current_y = [], [], None
-        for cy, cx, h, txt in items:
-            if current_y is None or abs(cy - current_y) <= tol:
-                if current_y is None:
-                    current_y = cy
-                current_line.append((cx, txt))
-            else:
-                current_line.sort(key=lambda t: t[0])
-                lines.append(" ".join([t[1] for t in current_line]))
-                current_y = cy
-                current_line = [(cx, txt)]
-        if current_line:
-            current_line.sort(key=lambda t: t[0])
-            lines.append(" ".join([t[1] for t in current_line]))
-        return "\n".join(lines)
+        return segment_to_text(seg, conf_thresh=conf_thresh, poly_keys=("rec_polys", "dt_polys"))
 
 
     def _get_segment_markdown(self, seg: dict) -> str:
@@ -757,7 +937,14 @@ def main():
     parser.add_argument('--api-key', help="Clé API Mistral (ou variable d'environnement MISTRAL_API_KEY)")
     parser.add_argument('--output-dir', help="Dossier de sortie (optionnel)")
     parser.add_argument('--keep-temp', action='store_true', help="Conserver les fichiers temporaires")
-    parser.add_argument('--json', required=True, help="Chemin vers le fichier JSON")
+    parser.add_argument('--json', required=True, help="Chemin vers le fichier JSON (ou .npz) de la Phase 1")
+    parser.add_argument('--llm-concurrency', type=int, default=4, help="Appels LLM simultanés (défaut: 4)")
+    parser.add_argument('--llm-rate', type=float, default=1.0, help="Débit maximal d'appels LLM en requêtes/s (défaut: 1.0)")
+    parser.add_argument('--llm-server-url', help="URL alternative de l'API de complétion (ex: serveur de test local)")
+    parser.add_argument('--llm-cache-dir', default="LLM_CACHE", help="Dossier du cache des réponses LLM (défaut: LLM_CACHE)")
+    parser.add_argument('--llm-cache-ttl-hours', type=float, default=24 * 30, help="Durée de validité du cache LLM en heures (défaut: 720)")
+    parser.add_argument('--no-llm-cache', action='store_true', help="Toujours interroger l'API (ignore le cache LLM)")
+    parser.add_argument('--no-rules', action='store_true', help="Envoyer toutes les LogCards au LLM (pas d'extraction par règles)")
     
     args = parser.parse_args()
     
@@ -775,11 +962,15 @@ def main():
         return
     
     # Lancer l'analyse
-    analyzer = Phase2LogCardAnalyzer(api_key)
+    analyzer = Phase2LogCardAnalyzer(api_key, llm_concurrency=args.llm_concurrency, llm_rate=args.llm_rate,
+                                     llm_server_url=args.llm_server_url,
+                                     llm_cache_dir=None if args.no_llm_cache else args.llm_cache_dir,
+                                     llm_cache_ttl_hours=args.llm_cache_ttl_hours,
+                                     rule_extraction=not args.no_rules)
     
     try:
         result = analyzer.analyze_markdown_to_logcards(
-            markdown_path=args.json,
+            json_path=args.json,
             output_dir=args.output_dir
         )
         
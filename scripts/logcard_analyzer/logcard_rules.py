@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+logcard_rules.py - Extraction par règles des champs déterministes d'une LogCard
+Responsabilité : lire les champs à libellé fixe (Name, Manufacturer's Part number,
+Serial number, ATA, ligne AH d'installation, case Inventory of lifed components)
+dans les cellules OCR d'une LogCard (recto + verso), sans appel au LLM.
+
+Un champ n'est retenu que s'il est trouvé sans ambiguïté ; la LogCard n'évite le LLM
+que si tous les champs de RULE_FIELDS le sont. Sinon elle suit le chemin LLM habituel.
+"""
+
+import re
+from datetime import datetime
+
+# Champs extraits par les règles (tous requis pour se passer du LLM)
+RULE_FIELDS = ('ATA', 'Name', 'Manufacturer_PN', 'SN', 'install_Date_AC', 'TSN_AC', 'CSN_AC',
+               'TSN_Part', 'Inventory_lifed_components')
+
+# Ordre des champs de logCardData (celui du prompt LLM) ; CSN_Part (colonne Cycles → Total
+# de la ligne d'installation) est lu s'il est écrit et reste à null sinon, comme le
+# demande le prompt pour une valeur non trouvée
+LOGCARD_FIELDS = ('ATA', 'Name', 'Manufacturer_PN', 'SN', 'install_Date_AC', 'TSN_AC', 'CSN_AC',
+                  'TSN_Part', 'CSN_Part', 'Inventory_lifed_components')
+
+_NAME_CELL = re.compile(r'^Name\b\s*:?\s*(.*)$')
+_PART_NUMBER = re.compile(r"Manufacturer.?s Part number\s*[|:]?\s*([A-Z0-9][A-Z0-9./-]{2,})", re.IGNORECASE)
+_SERIAL_NUMBER = re.compile(r'Serial number\s*[|:]?\s*([A-Z0-9][A-Z0-9./-]*)', re.IGNORECASE)
+_ATA_CELL = re.compile(r'^ATA\s*:?\s*(\d{2})?$')
+_TWO_DIGITS = re.compile(r'^\d{2}$')
+_DATE = re.compile(r'(?<!\d)(\d{2}/\d{2}/\d{4})(?!\d)')
+_AIRCRAFT_TYPE = re.compile(r'\bH\s?160\b')
+# Heures : "0H", "OH" (O lu à la place de 0), "04H26"
+_HOURS = re.compile(r'(?<![A-Z0-9])([0-9O]{1,5})H(\d{2})?(?![A-Z0-9])')
+# Colonnes Cycles (Partiel | Total) juste après les heures de la ligne d'installation
+_CYCLES = re.compile(r'^\s*\|\s*(\d{1,6})\s*\|\s*(\d{1,6})\s*(?:\||$)')
+_INVENTORY = re.compile(r'Inventory of lifed components\s*:?(.*)$', re.IGNORECASE)
+_CHECK_MARK = r'\s*\|?\s*[X✗✘☒☑✓✔](?![A-Za-z])'
+_YES_MARKED = re.compile(r'\b(?:YES|OUI)' + _CHECK_MARK, re.IGNORECASE)
+_NO_MARKED = re.compile(r'\b(?:NO|ON|NON)' + _CHECK_MARK, re.IGNORECASE)
+
+
+def _row_text(cells):
+    return " | ".join(cell for cell in cells if cell)
+
+
+def _single(values):
+    """Valeur unique trouvée, sinon None (absente ou ambiguë)"""
+    distinct = set(values)
+    return distinct.pop() if len(distinct) == 1 else None
+
+
+def _find_names(rows):
+    """
+    Valeurs de la cellule Name. Un nom portant une référence (mot avec chiffres,
+    ex: "FMS CMA9000") n'est pas retenu : la LogCard peut alors être désignée par sa
+    dénomination française plutôt que par ce nom, le choix est laissé au LLM.
+    """
+    for cells in rows:
+        for i, cell in enumerate(cells):
+            match = _NAME_CELL.match(cell)
+            if not match:
+                continue
+            value = match.group(1).strip()
+            if not value:
+                value = next((c.strip() for c in cells[i + 1:] if c.strip()), '')
+            if value and not any(ch.isdigit() for ch in value):
+                yield value
+
+
+def _find_pattern(rows, pattern):
+    for cells in rows:
+        for match in pattern.finditer(_row_text(cells)):
+            value = match.group(1).strip('.-/')
+            # Un numéro contient au moins un chiffre (écarte "NATO", "Amendments"...)
+            if any(ch.isdigit() for ch in value):
+                yield value
+
+
+def _find_ata(rows):
+    for idx, cells in enumerate(rows):
+        for i, cell in enumerate(cells):
+            match = _ATA_CELL.match(cell.strip())
+            if not match:
+                continue
+            if match.group(1):
+                yield match.group(1)
+            elif i + 1 < len(cells) and _TWO_DIGITS.match(cells[i + 1].strip()):
+                yield cells[i + 1].strip()
+            elif i + 1 == len(cells) and idx + 1 < len(rows) and rows[idx + 1] \
+                    and _TWO_DIGITS.match(rows[idx + 1][-1].strip()):
+                # Libellé en fin de ligne, code en dessous (dernière cellule de la ligne suivante)
+                yield rows[idx + 1][-1].strip()
+
+
+def _is_ah_row(cells):
+    return any(cell.strip() == 'AH' or cell.strip().startswith('AH ') for cell in cells)
+
+
+def _hours_to_hhmm(match):
+    hours = int(match.group(1).replace('O', '0'))
+    minutes = int(match.group(2) or 0)
+    return f"{hours:02d}:{minutes:02d}"
+
+
+def _installation_counters(text):
+    """
+    Heures et cycles d'une ligne d'installation (texte après la date)
+
+    Colonnes du tableau : Hours (Partiel | Total) puis Cycles (Partiel | Total).
+    Partiel = compteur de l'appareil (TSN_AC / CSN_AC), Total = compteur de la pièce.
+
+    Returns:
+        tuple: (TSN_AC, TSN_Part, CSN_AC, CSN_Part) ; None pour ce qui n'est pas lu
+    """
+    text = text.upper()
+    hours = list(_HOURS.finditer(text))
+    if not hours:
+        return None, None, None, None
+    tsn_part = _hours_to_hhmm(hours[-1])
+    tsn_ac = _hours_to_hhmm(hours[-2]) if len(hours) >= 2 else None
+
+    cycles = _CYCLES.match(text[hours[-1].end():])
+    if cycles:
+        return tsn_ac, tsn_part, int(cycles.group(1)), int(cycles.group(2))
+    return tsn_ac, tsn_part, None, None
+
+
+def _find_installation(rows):
+    """
+    Dernière ligne d'installation (date sur une ligne AH, ou portant le type d'appareil,
+    ou voisine d'une ligne AH) et compteurs relevés sur cette ligne. Si la ligne de la
+    date ne porte aucune heure, elles sont lues sur la ligne suivante (cellules de la
+    même installation découpées en deux lignes par l'OCR).
+
+    Returns:
+        dict: install_Date_AC, TSN_AC, CSN_AC, TSN_Part, CSN_Part ; None pour ce qui
+              n'est pas trouvé ou diffère entre plusieurs lignes de la même date
+    """
+    candidates = []
+    for idx, cells in enumerate(rows):
+        text = _row_text(cells)
+        if 'CUSTOMIZATION' in text.upper():
+            continue
+        anchored = (_is_ah_row(cells) or _AIRCRAFT_TYPE.search(text)
+                    or (idx > 0 and _is_ah_row(rows[idx - 1]))
+                    or (idx + 1 < len(rows) and _is_ah_row(rows[idx + 1])))
+        if not anchored:
+            continue
+        for match in _DATE.finditer(text):
+            try:
+                date = datetime.strptime(match.group(1), '%d/%m/%Y')
+            except ValueError:
+                continue
+            # Compteurs après la date : la dernière heure est la colonne "Total"
+            after = text[match.end():]
+            if not _HOURS.search(after.upper()) and idx + 1 < len(rows):
+                next_text = _row_text(rows[idx + 1])
+                if not _DATE.search(next_text):
+                    after = f"{after} | {next_text}"
+            candidates.append((date, match.group(1), _installation_counters(after)))
+
+    found = {'install_Date_AC': None, 'TSN_AC': None, 'CSN_AC': None, 'TSN_Part': None, 'CSN_Part': None}
+    if not candidates:
+        return found
+    latest = max(date for date, _, _ in candidates)
+    latest_rows = [(date_text, counters) for date, date_text, counters in candidates if date == latest]
+    found['install_Date_AC'] = latest_rows[0][0]
+    for position, field in enumerate(('TSN_AC', 'TSN_Part', 'CSN_AC', 'CSN_Part')):
+        found[field] = _single(counters[position] for _, counters in latest_rows
+                               if counters[position] is not None)
+    return found
+
+
+def _find_inventory(rows):
+    """Case cochée : True (YES), False (NO), None si les deux sont cochées ; rien si aucune"""
+    for cells in rows:
+        match = _INVENTORY.search(_row_text(cells))
+        if not match:
+            continue
+        rest = match.group(1)
+        yes_marked = bool(_YES_MARKED.search(rest))
+        no_marked = bool(_NO_MARKED.search(rest))
+        if yes_marked != no_marked:
+            yield yes_marked
+        elif yes_marked:
+            yield None
+
+
+def _inventory_value(rows):
+    """Case Inventory of lifed components : None si elle n'est pas lue ou si les marques divergent"""
+    marks = list(_find_inventory(rows))
+    if None in marks:
+        return None
+    return _single(marks)
+
+
+def extract_logcard_fields(rows):
+    """
+    Extrait les champs déterministes d'une LogCard à partir de ses cellules OCR
+
+    Args:
+        rows (list): Cellules ligne par ligne (layout_engine.segment_to_cells) de toutes
+                     les pages de la LogCard (recto puis verso)
+
+    Returns:
+        tuple: (logCardData avec tous les champs de LOGCARD_FIELDS,
+                liste des champs de RULE_FIELDS non trouvés ou ambigus)
+    """
+    found = {
+        'ATA': _single(_find_ata(rows)),
+        'Name': _single(_find_names(rows)),
+        'Manufacturer_PN': _single(_find_pattern(rows, _PART_NUMBER)),
+        'SN': _single(_find_pattern(rows, _SERIAL_NUMBER)),
+        'Inventory_lifed_components': _inventory_value(rows),
+    }
+    found.update(_find_installation(rows))
+
+    data = {field: found.get(field) for field in LOGCARD_FIELDS}
+    missing = [field for field in RULE_FIELDS if found[field] is None]
+    return data, missing
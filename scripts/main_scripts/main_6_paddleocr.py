@@ -10,6 +10,9 @@ import os
 import json
 import argparse
 import sys
+import time
+import queue
+import threading
 from datetime import datetime
 
 
@@ -20,21 +23,57 @@ from datetime import datetime
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'ocr_extraction'))
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'logcard_analyzer'))
 
-from  ocr_extractor_5_lilian import Phase1OCRExtractor
+from ocr_extractor_6_lilian import Phase1OCRExtractor
 from logcard_analyzer_6_lilian import Phase2LogCardAnalyzer
 
 
 class WorkflowOrchestrator:
-    def __init__(self, api_key, output_base_dir="WORKFLOW_RESULTS"):
+    def __init__(self, api_key, output_base_dir="WORKFLOW_RESULTS", ocr_workers=1, prefetch_pages=2,
+                 ocr_batch_size=1, ocr_cache_dir=None, ocr_cache_max_mb=1024,
+                 ocr_server_url=None, llm_concurrency=4, llm_rate=1.0, llm_cache_dir="LLM_CACHE",
+                 rule_extraction=True, pipeline_phases=False, ocr_storage='json', adaptive_dpi=False,
+                 form_template_path=None, detect_structure=False):
         """
         Initialise l'orchestrateur de workflow
         
         Args:
             api_key (str): Clé API Mistral
             output_base_dir (str): Dossier de base pour tous les résultats
+            ocr_workers (int): Nombre de processus OCR en parallèle pour la Phase 1
+            prefetch_pages (int): Pages rendues en avance sur l'OCR (pipeline Phase 1)
+            ocr_batch_size (int): Pages envoyées ensemble à PaddleOCR en Phase 1
+            ocr_cache_dir (str): Dossier du cache OCR par page, partagé entre workflows (optionnel)
+            ocr_cache_max_mb (float): Taille maximale du cache OCR
+            ocr_server_url (str): URL du serveur OCR persistant (modèles déjà chargés), optionnelle
+            llm_concurrency (int): Appels LLM simultanés en Phase 2
+            llm_rate (float): Débit maximal d'appels LLM en Phase 2 (requêtes/seconde)
+            llm_cache_dir (str): Dossier du cache des réponses LLM (None = désactivé)
+            rule_extraction (bool): Phase 2 : LogCards complètes extraites par règles, sans LLM
+            pipeline_phases (bool): Workflow complet en pipeline : chaque page OCR est transmise
+                                    à la Phase 2 sans attendre la fin de la Phase 1
+            ocr_storage (str): Format des résultats OCR de la Phase 1 ('json' ou 'npz')
+            adaptive_dpi (bool): Phase 1 : résolution choisie page par page d'après une vignette
+            form_template_path (str): Phase 1 : gabarit de formulaire JSON, OCR limité aux zones utiles
+            detect_structure (bool): Phase 1 : LogCards détectées page par page (titres, rectos,
+                                     versos) au lieu des listes de pages de la configuration
         """
         self.api_key = api_key
         self.output_base_dir = output_base_dir
+        self.ocr_workers = ocr_workers
+        self.prefetch_pages = prefetch_pages
+        self.ocr_batch_size = ocr_batch_size
+        self.ocr_cache_dir = ocr_cache_dir
+        self.ocr_cache_max_mb = ocr_cache_max_mb
+        self.ocr_server_url = ocr_server_url
+        self.llm_concurrency = llm_concurrency
+        self.llm_rate = llm_rate
+        self.llm_cache_dir = llm_cache_dir
+        self.rule_extraction = rule_extraction
+        self.pipeline_phases = pipeline_phases
+        self.ocr_storage = ocr_storage
+        self.adaptive_dpi = adaptive_dpi
+        self.form_template_path = form_template_path
+        self.detect_structure = detect_structure
         
         # Créer le dossier de base
         os.makedirs(self.output_base_dir, exist_ok=True)
@@ -71,6 +110,10 @@ class WorkflowOrchestrator:
         if structure_config_path:
             print(f"📋 Configuration de structure: {structure_config_path}")
         
+        if self.pipeline_phases:
+            phase1_result, phase2_result = self._run_pipelined_phases(pdf_path, structure_config_path)
+            return self._finish_full_workflow(phase1_result, phase2_result, keep_temp)
+        
         # Phase 1: OCR
         phase1_result = self.run_phase1_only(pdf_path, structure_config_path)
         if not phase1_result or not phase1_result['success']:
@@ -87,6 +130,20 @@ class WorkflowOrchestrator:
         
         # Phase 2: LogCard Analysis
         phase2_result = self.run_phase2_only(phase1_result['json_file'])
+        return self._finish_full_workflow(phase1_result, phase2_result, keep_temp)
+    
+    def _finish_full_workflow(self, phase1_result, phase2_result, keep_temp):
+        """Résultat du workflow complet une fois les deux phases exécutées"""
+        if not phase1_result or not phase1_result['success']:
+            print("❌ Phase 1 (OCR) a échoué - arrêt du workflow")
+            return {
+                'success': False,
+                'phase1_completed': False,
+                'phase2_completed': False,
+                'error': 'Phase 1 échouée',
+                'workflow_directory': self.workflow_dir
+            }
+        
         if not phase2_result or not phase2_result['success']:
             print("❌ Phase 2 (LogCard) a échoué")
             return {
@@ -143,7 +200,7 @@ class WorkflowOrchestrator:
         
         # Créer l'extracteur Phase 1
         phase1_output_dir = os.path.join(self.workflow_dir, "phase1_ocr")
-        self.phase1_extractor = Phase1OCRExtractor(self.api_key, phase1_output_dir)
+        self.phase1_extractor = self._create_phase1_extractor(phase1_output_dir)
         
         # Exécuter l'extraction avec configuration de structure
         result = self.phase1_extractor.extract_pdf_to_markdown(
@@ -184,7 +241,7 @@ class WorkflowOrchestrator:
         
         # Créer l'analyseur Phase 2
         phase2_output_dir = os.path.join(self.workflow_dir, "phase2_logcard")
-        self.phase2_analyzer = Phase2LogCardAnalyzer(self.api_key, phase2_output_dir)
+        self.phase2_analyzer = self._create_phase2_analyzer(phase2_output_dir)
         
         # Exécuter l'analyse
         result = self.phase2_analyzer.analyze_markdown_to_logcards(
@@ -199,6 +256,98 @@ class WorkflowOrchestrator:
         
         return result
     
+    def _run_pipelined_phases(self, pdf_path, structure_config_path=None):
+        """
+        Phases 1 et 2 en parallèle : l'OCR (CPU) tourne dans le thread principal, chaque
+        page persistée passe par une file bornée vers l'analyse LogCard (appels réseau),
+        exécutée dans un thread dédié. Les pages sont numérotées comme dans le JSON
+        consolidé (segment_info.logcard_number), y compris si un segment échoue.
+        
+        Returns:
+            tuple: (résultat Phase 1, résultat Phase 2)
+        """
+        
+        print("\n🔀 PHASES 1 + 2 EN PIPELINE : OCR → LOGCARDS AU FIL DE L'EAU")
+        print("-" * 40)
+        
+        phase1_output_dir = os.path.join(self.workflow_dir, "phase1_ocr")
+        phase2_output_dir = os.path.join(self.workflow_dir, "phase2_logcard")
+        self.phase1_extractor = self._create_phase1_extractor(phase1_output_dir)
+        self.phase2_analyzer = self._create_phase2_analyzer(phase2_output_dir)
+        
+        # Pages OCR (numéro de LogCard, JSON) ; None marque la fin de la Phase 1.
+        # File bornée : l'OCR attend si la Phase 2 ne suit plus
+        pages = queue.Queue(maxsize=max(2, 2 * self.llm_concurrency))
+        
+        def _put(item):
+            # Sans consommateur (Phase 2 interrompue), la page n'est plus transmise
+            while phase2_thread.is_alive():
+                try:
+                    pages.put(item, timeout=0.5)
+                    return
+                except queue.Full:
+                    continue
+        
+        self.phase1_extractor.page_sink = lambda logcard_number, page_json: _put((logcard_number, page_json))
+        
+        phase2 = {'result': None}
+        
+        def _run_phase2():
+            try:
+                phase2['result'] = self.phase2_analyzer.analyze_page_stream(
+                    iter(pages.get, None),
+                    json_path=Phase1OCRExtractor.result_json_path(pdf_path, phase1_output_dir,
+                                                                  self.phase1_extractor.ocr_storage),
+                    output_dir=phase2_output_dir
+                )
+            except Exception as e:
+                print(f"❌ Phase 2 (pipeline) interrompue: {e}")
+        
+        start = time.monotonic()
+        # Thread non démon : les résultats LogCard en cours sont toujours écrits avant de rendre la main
+        phase2_thread = threading.Thread(target=_run_phase2, name="phase2-logcards")
+        phase2_thread.start()
+        try:
+            phase1_result = self.phase1_extractor.extract_pdf_to_markdown(
+                pdf_path=pdf_path,
+                structure_config_path=structure_config_path,
+                output_dir=phase1_output_dir
+            )
+        finally:
+            _put(None)
+            phase1_seconds = time.monotonic() - start
+            print(f"⏳ Phase 1 terminée en {phase1_seconds:.1f}s, fin des analyses LogCard en cours...")
+            phase2_thread.join()
+        total_seconds = time.monotonic() - start
+        
+        phase2_result = phase2['result']
+        first_logcard = (phase2_result or {}).get('first_logcard_seconds')
+        print(f"⏱️  Pipeline: première LogCard après "
+              f"{f'{first_logcard:.1f}s' if first_logcard is not None else 'N/A'}, "
+              f"total {total_seconds:.1f}s (dont {total_seconds - phase1_seconds:.1f}s après l'OCR)")
+        
+        return phase1_result, phase2_result
+    
+    def _create_phase1_extractor(self, phase1_output_dir):
+        return Phase1OCRExtractor(self.api_key, phase1_output_dir,
+                                  ocr_workers=self.ocr_workers,
+                                  prefetch_pages=self.prefetch_pages,
+                                  ocr_batch_size=self.ocr_batch_size,
+                                  ocr_cache_dir=self.ocr_cache_dir,
+                                  ocr_cache_max_mb=self.ocr_cache_max_mb,
+                                  ocr_server_url=self.ocr_server_url,
+                                  ocr_storage=self.ocr_storage,
+                                  adaptive_dpi=self.adaptive_dpi,
+                                  form_template_path=self.form_template_path,
+                                  detect_structure=self.detect_structure)
+    
+    def _create_phase2_analyzer(self, phase2_output_dir):
+        return Phase2LogCardAnalyzer(self.api_key, phase2_output_dir,
+                                     llm_concurrency=self.llm_concurrency,
+                                     llm_rate=self.llm_rate,
+                                     llm_cache_dir=self.llm_cache_dir,
+                                     rule_extraction=self.rule_extraction)
+    
     def _setup_workflow(self, pdf_path):
         """Configure l'environnement de workflow"""
         
@@ -324,7 +473,7 @@ def main():
     
     # Arguments principaux
     parser.add_argument('--pdf', help="Chemin vers le fichier PDF (requis pour --full ou --phase1-only)")
-    parser.add_argument('--json', help="Chemin vers le fichier JSON (requis pour --phase2-only)")
+    parser.add_argument('--json', help="Chemin vers le fichier JSON ou .npz de la Phase 1 (requis pour --phase2-only)")
     parser.add_argument('--api-key', help="Clé API Mistral (ou variable d'environnement MISTRAL_API_KEY)")
     parser.add_argument('--output-dir', help="Dossier de sortie de base (défaut: WORKFLOW_RESULTS)")
     
@@ -337,6 +486,26 @@ def main():
     # Options supplémentaires (modifiées pour la nouvelle fonctionnalité)
     parser.add_argument('--structure-config', help="Chemin vers le fichier de configuration de structure JSON")
     parser.add_argument('--keep-temp', action='store_true', help="Conserver les fichiers temporaires")
+    parser.add_argument('--ocr-workers', type=int, default=1, help="Nombre de processus OCR en parallèle pour la Phase 1 (défaut: 1)")
+    parser.add_argument('--prefetch-pages', type=int, default=2, help="Pages rendues en avance sur l'OCR en Phase 1 (défaut: 2)")
+    parser.add_argument('--ocr-batch-size', type=int, default=1, help="Pages envoyées ensemble à PaddleOCR en Phase 1 (défaut: 1)")
+    parser.add_argument('--ocr-cache-dir', help="Dossier du cache OCR par page (désactivé par défaut)")
+    parser.add_argument('--ocr-cache-max-mb', type=float, default=1024, help="Taille maximale du cache OCR en MB (défaut: 1024)")
+    parser.add_argument('--ocr-server', help="URL d'un serveur OCR persistant (ex: http://127.0.0.1:8866)")
+    parser.add_argument('--llm-concurrency', type=int, default=4, help="Appels LLM simultanés en Phase 2 (défaut: 4)")
+    parser.add_argument('--llm-rate', type=float, default=1.0, help="Débit maximal d'appels LLM en Phase 2, requêtes/s (défaut: 1.0)")
+    parser.add_argument('--llm-cache-dir', default="LLM_CACHE", help="Dossier du cache des réponses LLM (défaut: LLM_CACHE)")
+    parser.add_argument('--no-llm-cache', action='store_true', help="Toujours interroger l'API Mistral (ignore le cache LLM)")
+    parser.add_argument('--no-rules', action='store_true', help="Envoyer toutes les LogCards au LLM en Phase 2 (pas d'extraction par règles)")
+    parser.add_argument('--ocr-storage', choices=('json', 'npz'), default='json',
+                        help="Format des résultats OCR de la Phase 1 : json (défaut) ou npz (tableaux NumPy compacts)")
+    parser.add_argument('--adaptive-dpi', action='store_true',
+                        help="Phase 1 : résolution choisie page par page d'après une vignette (DPI bas pour les pages vides, haut pour les scans pâles)")
+    parser.add_argument('--form-template',
+                        help="Phase 1 : gabarit de formulaire JSON (ex: logcard_form_template.json), OCR limité aux zones utiles")
+    parser.add_argument('--detect-structure', action='store_true',
+                        help="Phase 1 : détecter titres, rectos, versos et continuations au lieu des listes de pages de --structure-config")
+    parser.add_argument('--pipeline', action='store_true', help="Avec --full : analyse LogCard au fil de l'OCR (Phases 1 et 2 en parallèle)")
     
     args = parser.parse_args()
     
@@ -375,7 +544,22 @@ def main():
     
     # Créer l'orchestrateur
     output_base_dir = args.output_dir or "WORKFLOW_RESULTS"
-    orchestrator = WorkflowOrchestrator(api_key, output_base_dir)
+    orchestrator = WorkflowOrchestrator(api_key, output_base_dir,
+                                        ocr_workers=args.ocr_workers,
+                                        prefetch_pages=args.prefetch_pages,
+                                        ocr_batch_size=args.ocr_batch_size,
+                                        ocr_cache_dir=args.ocr_cache_dir,
+                                        ocr_cache_max_mb=args.ocr_cache_max_mb,
+                                        ocr_server_url=args.ocr_server,
+                                        llm_concurrency=args.llm_concurrency,
+                                        llm_rate=args.llm_rate,
+                                        llm_cache_dir=None if args.no_llm_cache else args.llm_cache_dir,
+                                        rule_extraction=not args.no_rules,
+                                        pipeline_phases=args.pipeline,
+                                        ocr_storage=args.ocr_storage,
+                                        adaptive_dpi=args.adaptive_dpi,
+                                        form_template_path=args.form_template,
+                                        detect_structure=args.detect_structure)
     
     try:
         # Exécuter selon le mode choisi
@@ -533,6 +717,9 @@ def demonstrate_usage():
     print("5️⃣  AVEC OPTIONS:")
     print("   python main_4.py --full --pdf doc.pdf --structure-config config.json --keep-temp")
     print("   python main_4.py --full --pdf doc.pdf --output-dir /mon/dossier")
+    print("   python main_4.py --full --pdf doc.pdf --structure-config config.json --ocr-workers 8")
+    print("   python main_4.py --full --pdf doc.pdf --ocr-cache-dir OCR_CACHE")
+    print("   python main_4.py --full --pdf doc.pdf --ocr-server http://127.0.0.1:8866")
     print()
     
     print("🔑 CONFIGURATION API:")
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+adaptive_dpi.py - Choix de la résolution de rendu page par page
+Responsabilité : rendre d'abord une vignette basse résolution, en estimer la densité
+d'encre et le contraste, puis choisir le DPI du rendu envoyé à l'OCR :
+- page blanche ou presque vide (page de titre, partie 7 sans opération) → DPI bas
+- scan pâle (contraste faible) → DPI haut
+- page normale → DPI de référence
+
+Les boîtes OCR d'une page rendue à un autre DPI sont ramenées au DPI de référence,
+la mise en page (tolérances en pixels) reste donc inchangée en aval.
+"""
+
+import numpy as np
+
+# Clés des JSON PaddleOCR contenant des coordonnées en pixels
+_COORD_KEYS = ('rec_boxes', 'rec_polys', 'dt_polys')
+
+
+def page_profile(thumbnail):
+    """
+    Mesure la densité d'encre et le contraste d'une vignette
+
+    Args:
+        thumbnail (np.ndarray): Image HxWx3 (ou HxW) de la page en basse résolution
+
+    Returns:
+        dict: {'paper': niveau du papier, 'ink': niveau de l'encre (0 = noir, 1 = blanc),
+               'contrast': écart papier/encre, 'ink_ratio': part des pixels d'encre}
+    """
+    img = np.asarray(thumbnail, dtype=np.float32)
+    gray = img @ np.array([0.299, 0.587, 0.114], dtype=np.float32) if img.ndim == 3 else img
+    gray = gray.ravel() / 255.0
+
+    # Le papier occupe l'essentiel de la page ; l'encre est dans la queue sombre
+    paper, ink = np.percentile(gray, [90, 0.5])
+    contrast = float(paper - ink)
+    ink_ratio = float(np.mean(gray < paper - contrast / 2)) if contrast > 0 else 0.0
+    return {
+        'paper': round(float(paper), 3),
+        'ink': round(float(ink), 3),
+        'contrast': round(contrast, 3),
+        'ink_ratio': round(ink_ratio, 4)
+    }
+
+
+class AdaptiveDPIPolicy:
+    """
+    Règles de choix du DPI à partir du profil d'une vignette.
+    Les seuils font partie de la clé du cache OCR (voir settings()).
+    """
+
+    def __init__(self, reference_dpi=200, probe_dpi=72, low_dpi=150, high_dpi=300,
+                 blank_ink_ratio=0.002, sparse_ink_ratio=0.015, min_contrast=0.08,
+                 faded_contrast=0.45):
+        """
+        Args:
+            reference_dpi (int): DPI normal, celui des coordonnées des JSON produits
+            probe_dpi (int): DPI de la vignette d'analyse
+            low_dpi (int): DPI des pages vides ou presque vides
+            high_dpi (int): DPI des scans pâles
+            blank_ink_ratio (float): En dessous, la page est considérée blanche
+            sparse_ink_ratio (float): En dessous, la page est peu remplie
+            min_contrast (float): En dessous, aucune encre n'est visible (page blanche)
+            faded_contrast (float): En dessous, l'encre est pâle (scan délavé)
+        """
+        self.reference_dpi = reference_dpi
+        self.probe_dpi = probe_dpi
+        self.low_dpi = low_dpi
+        self.high_dpi = high_dpi
+        self.blank_ink_ratio = blank_ink_ratio
+        self.sparse_ink_ratio = sparse_ink_ratio
+        self.min_contrast = min_contrast
+        self.faded_contrast = faded_contrast
+
+    def choose(self, profile):
+        """
+        Returns:
+            tuple: (DPI retenu, motif 'blank' | 'sparse' | 'faded' | 'normal')
+        """
+        if profile['contrast'] < self.min_contrast or profile['ink_ratio'] < self.blank_ink_ratio:
+            return self.low_dpi, 'blank'
+        if profile['contrast'] < self.faded_contrast:
+            return self.high_dpi, 'faded'
+        if profile['ink_ratio'] < self.sparse_ink_ratio:
+            return self.low_dpi, 'sparse'
+        return self.reference_dpi, 'normal'
+
+    def settings(self):
+        """Paramètres qui invalident le cache OCR lorsqu'ils changent"""
+        return {
+            'adaptive_dpi': True,
+            'reference_dpi': self.reference_dpi,
+            'probe_dpi': self.probe_dpi,
+            'low_dpi': self.low_dpi,
+            'high_dpi': self.high_dpi,
+            'blank_ink_ratio': self.blank_ink_ratio,
+            'sparse_ink_ratio': self.sparse_ink_ratio,
+            'min_contrast': self.min_contrast,
+            'faded_contrast': self.faded_contrast
+        }
+
+
+def rescale_page_json(page_json, render_dpi, reference_dpi):
+    """
+    Ramène les coordonnées d'un JSON PaddleOCR au DPI de référence (en place)
+
+    Args:
+        page_json (dict): JSON rec_texts/rec_boxes/... d'une page
+        render_dpi (int): DPI auquel la page a été rendue pour l'OCR
+        reference_dpi (int): DPI attendu par la mise en page
+
+    Returns:
+        dict: Le même JSON, annoté de 'render_dpi'
+    """
+    if render_dpi != reference_dpi:
+        factor = reference_dpi / float(render_dpi)
+        for key in _COORD_KEYS:
+            coords = page_json.get(key)
+            if coords is None or len(coords) == 0:
+                continue
+            scaled = np.asarray(coords, dtype=np.float64) * factor
+            if key == 'rec_boxes':
+                scaled = np.rint(scaled).astype(np.int64)
+            page_json[key] = scaled.tolist()
+    page_json['render_dpi'] = render_dpi
+    return page_json
+
+
+class RenderStats:
+    """Compteurs des rendus : pages par DPI et pixels envoyés à l'OCR"""
+
+    def __init__(self, reference_dpi=200):
+        self.reference_dpi = reference_dpi
+        self.pages_by_dpi = {}
+        self.pixels = 0
+        self.reference_pixels = 0
+
+    def record(self, img_array, dpi):
+        pixels = int(img_array.shape[0]) * int(img_array.shape[1])
+        self.pages_by_dpi[dpi] = self.pages_by_dpi.get(dpi, 0) + 1
+        self.pixels += pixels
+        # Pixels qu'aurait eus la même page au DPI de référence
+        self.reference_pixels += int(pixels * (self.reference_dpi / float(dpi)) ** 2)
+
+    def merge(self, counts):
+        """Ajoute les compteurs renvoyés par un worker (voir as_dict)"""
+        for dpi, pages in counts['pages_by_dpi'].items():
+            self.pages_by_dpi[int(dpi)] = self.pages_by_dpi.get(int(dpi), 0) + pages
+        self.pixels += counts['pixels']
+        self.reference_pixels += counts['reference_pixels']
+
+    def as_dict(self):
+        return {
+            'pages_by_dpi': dict(self.pages_by_dpi),
+            'pixels': self.pixels,
+            'reference_pixels': self.reference_pixels
+        }
+
+    def summary(self):
+        """Ligne de résumé, ex: '12 p. à 150 DPI, 8 p. à 200 DPI — pixels OCR -31%'"""
+        parts = [f"{pages} p. à {dpi} DPI" for dpi, pages in sorted(self.pages_by_dpi.items())]
+        saving = 1 - self.pixels / self.reference_pixels if self.reference_pixels else 0.0
+        return f"{', '.join(parts)} — pixels OCR {-saving*100:+.0f}%"
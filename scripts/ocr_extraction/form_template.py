@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+form_template.py - OCR par zones d'un formulaire imprimé (gabarit LogCard)
+Responsabilité : recaler une page sur un gabarit de référence à l'aide de libellés
+d'ancrage ("Name", "Serial number"...), puis ne lancer l'OCR que sur les zones utiles
+(bloc d'identification, tableau de la partie 5, case Inventory, ATA).
+
+Recalage : chaque ancre est cherchée dans une petite fenêtre autour de sa position
+attendue ; une échelle et une translation par axe sont ajustées sur les ancres trouvées.
+Si trop peu d'ancres sont trouvées ou si elles ne concordent pas, register_page
+retourne None et l'appelant repasse en OCR pleine page.
+
+Usage (recaler les ancres d'un gabarit sur une page de référence déjà reconnue) :
+    python form_template.py --template ../logcard_form_template.json \
+        --reference-page temp_segments/segment_000_p01_paddle.json
+"""
+
+import re
+import json
+import hashlib
+import argparse
+import unicodedata
+from difflib import SequenceMatcher
+
+import numpy as np
+
+from ocr_store import load_page_file
+
+
+def _normalize_label(text):
+    """Minuscules, sans accents ni ponctuation, espaces simples"""
+    text = unicodedata.normalize('NFKD', text or '').encode('ascii', 'ignore').decode('ascii')
+    return ' '.join(re.sub(r'[^a-z0-9]+', ' ', text.lower()).split())
+
+
+def _label_matches(text, label, min_ratio=0.8):
+    """Le texte OCR commence-t-il par le libellé (à quelques erreurs OCR près) ?"""
+    text, label = _normalize_label(text), _normalize_label(label)
+    if not text or not label:
+        return False
+    return SequenceMatcher(None, text[:len(label)], label).ratio() >= min_ratio
+
+
+def page_json_boxes(page_json):
+    """
+    Tokens d'un JSON PaddleOCR avec leur boîte englobante
+
+    Returns:
+        list: [(texte, score, [x1, y1, x2, y2]), ...]
+    """
+    texts = page_json.get('rec_texts') or []
+    scores = page_json.get('rec_scores') or [0.0] * len(texts)
+    geometry = page_json.get('rec_boxes')
+    if geometry is None or len(geometry) != len(texts):
+        geometry = page_json.get('rec_polys') or page_json.get('dt_polys') or []
+    if len(geometry) != len(texts):
+        return []
+
+    tokens = []
+    for text, score, geom in zip(texts, scores, geometry):
+        pts = np.asarray(geom, dtype=np.float64)
+        if pts.ndim == 1 and pts.size == 4:
+            box = pts.tolist()
+        else:
+            pts = pts.reshape(-1, 2)
+            box = [pts[:, 0].min(), pts[:, 1].min(), pts[:, 0].max(), pts[:, 1].max()]
+        tokens.append((text, float(score or 0.0), [float(v) for v in box]))
+    return tokens
+
+
+class FormTemplate:
+    """
+    Gabarit d'un formulaire : ancres et zones en pixels au DPI de référence.
+
+    Fichier JSON :
+        {"name", "reference_dpi", "page_size": [w, h], "page_positions": [1],
+         "search_margin": [mx, my], "min_anchors", "max_residual",
+         "anchors": [{"text", "box"}], "regions": [{"name", "box"}]}
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.name = config.get('name', 'form')
+        self.reference_dpi = config.get('reference_dpi', 200)
+        self.page_size = config['page_size']
+        # Positions (1-based) des pages du segment concernées par le gabarit
+        self.page_positions = set(config.get('page_positions', [1]))
+        self.search_margin = config.get('search_margin', [80, 120])
+        self.min_anchors = config.get('min_anchors', 3)
+        self.max_residual = config.get('max_residual', 15)
+        self.anchors = config['anchors']
+        self.regions = config['regions']
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def applies_to(self, page_pos):
+        """page_pos : position 0-based de la page dans son segment"""
+        return page_pos + 1 in self.page_positions
+
+    def settings(self):
+        """Paramètres qui invalident le cache OCR lorsqu'ils changent"""
+        digest = hashlib.blake2b(json.dumps(self.config, sort_keys=True).encode('utf-8'),
+                                 digest_size=8).hexdigest()
+        return {'form_template': self.name, 'form_template_digest': digest}
+
+
+def _fit_axis(ref, found, min_spread):
+    """Ajuste found = scale * ref + offset ; échelle 1 si les ancres sont trop groupées"""
+    ref, found = np.asarray(ref, dtype=np.float64), np.asarray(found, dtype=np.float64)
+    if np.ptp(ref) >= min_spread:
+        scale, offset = np.polyfit(ref, found, 1)
+    else:
+        scale, offset = 1.0, float(np.median(found - ref))
+    return float(scale), float(offset)
+
+
+def _crop(img, box):
+    """Découpe une zone (bornée à l'image) ; retourne (image, origine x, origine y)"""
+    h, w = img.shape[:2]
+    x1, y1 = max(0, int(box[0])), max(0, int(box[1]))
+    x2, y2 = min(w, int(np.ceil(box[2]))), min(h, int(np.ceil(box[3])))
+    if x2 - x1 < 8 or y2 - y1 < 8:
+        return None, x1, y1
+    return np.ascontiguousarray(img[y1:y2, x1:x2]), x1, y1
+
+
+def register_page(img, template, ocr_images, scale=1.0):
+    """
+    Recale une page sur le gabarit à partir des ancres
+
+    Args:
+        img (np.ndarray): Page rendue
+        template (FormTemplate): Gabarit
+        ocr_images (callable): OCR d'une liste d'images → liste de JSON PaddleOCR
+        scale (float): DPI du rendu / DPI de référence du gabarit
+
+    Returns:
+        tuple: (transformation {'sx', 'tx', 'sy', 'ty'} du repère gabarit vers les pixels
+                de la page, ou None si le recalage n'est pas fiable ; motif / nombre d'ancres,
+                pixels passés à l'OCR)
+    """
+    page_w, page_h = template.page_size
+    h, w = img.shape[:2]
+    # Page d'un autre format (portrait, demi-page...) : pas de recalage possible
+    if abs((w / float(h)) / (page_w / float(page_h)) - 1) > 0.08:
+        return None, "format de page différent du gabarit", 0
+
+    mx, my = template.search_margin
+    windows, crops = [], []
+    for anchor in template.anchors:
+        x1, y1, x2, y2 = anchor['box']
+        crop, ox, oy = _crop(img, [(x1 - mx) * scale, (y1 - my) * scale, (x2 + mx) * scale, (y2 + my) * scale])
+        if crop is not None:
+            windows.append((anchor, ox, oy))
+            crops.append(crop)
+    pixels = sum(c.shape[0] * c.shape[1] for c in crops)
+    if not crops:
+        return None, "fenêtres d'ancrage hors page", pixels
+
+    ref_pts, found_pts = [], []
+    for (anchor, ox, oy), crop_json in zip(windows, ocr_images(crops)):
+        hits = [box for text, _, box in page_json_boxes(crop_json) if _label_matches(text, anchor['text'])]
+        if len(hits) != 1:
+            continue
+        # Coin haut-gauche, ramené au DPI de référence
+        ref_pts.append(anchor['box'][:2])
+        found_pts.append([(hits[0][0] + ox) / scale, (hits[0][1] + oy) / scale])
+
+    if len(ref_pts) < template.min_anchors:
+        return None, f"{len(ref_pts)}/{len(template.anchors)} ancres trouvées", pixels
+
+    ref_pts, found_pts = np.asarray(ref_pts), np.asarray(found_pts)
+    sy, ty = _fit_axis(ref_pts[:, 1], found_pts[:, 1], min_spread=page_h / 3)
+    sx, tx = _fit_axis(ref_pts[:, 0], found_pts[:, 0], min_spread=page_w / 3)
+    predicted = np.column_stack([sx * ref_pts[:, 0] + tx, sy * ref_pts[:, 1] + ty])
+    residual = float(np.abs(predicted - found_pts).max())
+    if residual > template.max_residual or not (0.85 < sx < 1.15 and 0.85 < sy < 1.15):
+        return None, f"ancres incohérentes (écart {residual:.0f} px)", pixels
+
+    transform = {'sx': sx * scale, 'tx': tx * scale, 'sy': sy * scale, 'ty': ty * scale}
+    return transform, len(ref_pts), pixels
+
+
+def ocr_page_regions(img, template, ocr_images, scale=1.0):
+    """
+    OCR d'une page limité aux zones du gabarit
+
+    Args:
+        img (np.ndarray): Page rendue
+        template (FormTemplate): Gabarit
+        ocr_images (callable): OCR d'une liste d'images → liste de JSON PaddleOCR
+        scale (float): DPI du rendu / DPI de référence du gabarit
+
+    Returns:
+        tuple: (JSON de page {'rec_texts', 'rec_scores', 'rec_boxes', 'rec_polys', 'roi_ocr'}
+                en coordonnées de la page, ou None si le recalage échoue ; motif de l'échec)
+    """
+    page_pixels = int(img.shape[0]) * int(img.shape[1])
+    transform, detail, pixels = register_page(img, template, ocr_images, scale)
+    if transform is None:
+        return None, {'template': template.name, 'fallback': detail,
+                      'pixels': pixels + page_pixels, 'page_pixels': page_pixels}
+
+    sx, tx, sy, ty = transform['sx'], transform['tx'], transform['sy'], transform['ty']
+    crops, origins, names = [], [], []
+    for region in template.regions:
+        x1, y1, x2, y2 = region['box']
+        crop, ox, oy = _crop(img, [sx * x1 + tx, sy * y1 + ty, sx * x2 + tx, sy * y2 + ty])
+        if crop is not None:
+            crops.append(crop)
+            origins.append((ox, oy))
+            names.append(region['name'])
+    pixels += sum(c.shape[0] * c.shape[1] for c in crops)
+
+    page_json = {'rec_texts': [], 'rec_scores': [], 'rec_boxes': [], 'rec_polys': []}
+    for (ox, oy), crop_json in zip(origins, ocr_images(crops) if crops else []):
+        for text, score, (x1, y1, x2, y2) in page_json_boxes(crop_json):
+            x1, x2, y1, y2 = x1 + ox, x2 + ox, y1 + oy, y2 + oy
+            page_json['rec_texts'].append(text)
+            page_json['rec_scores'].append(score)
+            page_json['rec_boxes'].append([int(round(v)) for v in (x1, y1, x2, y2)])
+            page_json['rec_polys'].append([[x1, y1], [x2, y1], [x2, y2], [x1, y2]])
+
+    page_json['roi_ocr'] = {
+        'template': template.name,
+        'anchors': detail,
+        'transform': [round(v, 4) for v in (sx, tx, sy, ty)],
+        'regions': names,
+        'pixels': pixels,
+        'page_pixels': page_pixels
+    }
+    return page_json, None
+
+
+def locate_anchors(template_config, reference_page_json):
+    """
+    Met à jour la position des ancres d'après une page de référence reconnue en pleine page
+
+    Returns:
+        tuple: (configuration mise à jour, libellés introuvables ou ambigus)
+    """
+    tokens = page_json_boxes(reference_page_json)
+    missing = []
+    for anchor in template_config['anchors']:
+        hits = [box for text, _, box in tokens if _label_matches(text, anchor['text'])]
+        if len(hits) != 1:
+            missing.append(anchor['text'])
+            continue
+        x1, y1, _, y2 = hits[0]
+        # Largeur du libellé seul : le token OCR peut inclure la valeur qui suit
+        width = anchor['box'][2] - anchor['box'][0] if anchor.get('box') else 0
+        anchor['box'] = [int(x1), int(y1), int(x1 + width) if width else int(hits[0][2]), int(y2)]
+    return template_config, missing
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recalage des ancres d'un gabarit de formulaire")
+    parser.add_argument('--template', required=True, help="Fichier JSON du gabarit")
+    parser.add_argument('--reference-page', required=True, help="JSON PaddleOCR pleine page (segment_XXX_pYY_paddle.json ou .npz)")
+    parser.add_argument('--output', help="Fichier du gabarit mis à jour (défaut: écrase --template)")
+    args = parser.parse_args()
+
+    with open(args.template, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    reference = load_page_file(args.reference_page)[0]
+
+    config, missing = locate_anchors(config, reference)
+    for label in missing:
+        print(f"⚠️ Ancre introuvable ou ambiguë: {label}")
+
+    output = args.output or args.template
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(config, f, indent=2, ensure_ascii=False)
+    print(f"✅ Gabarit enregistré: {output} ({len(config['anchors']) - len(missing)}/{len(config['anchors'])} ancres)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+layout_engine.py - Mise en page vectorisée des tokens PaddleOCR
+Responsabilité : transformer rec_texts/rec_scores + rec_boxes|rec_polys en lignes,
+colonnes et Markdown, avec des tableaux NumPy contigus au lieu d'un dict par token.
+
+Le résultat est identique caractère pour caractère à l'ancienne implémentation
+(mêmes tris stables, même tolérance par médiane des hauteurs, mêmes sommes
+séquentielles pour les moyennes).
+"""
+
+import numpy as np
+
+
+class PageTokens:
+    """
+    Tokens d'une page, triés haut→bas puis gauche→droite.
+    `texts` est une liste Python, les coordonnées sont des tableaux float64 alignés.
+    """
+
+    __slots__ = ("texts", "cx", "cy", "xmin", "xmax", "ymin", "ymax", "h")
+
+    def __init__(self, texts, cx, cy, xmin, xmax, ymin, ymax, h):
+        self.texts = texts
+        self.cx, self.cy = cx, cy
+        self.xmin, self.xmax = xmin, xmax
+        self.ymin, self.ymax = ymin, ymax
+        self.h = h
+
+    def __len__(self):
+        return len(self.texts)
+
+
+def _parse_score(sc):
+    try:
+        return float(sc)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _poly_geometry(polys):
+    """
+    Min/max et centres (moyenne des sommets) de polygones.
+    La moyenne utilise une somme cumulée pour reproduire sum(xs)/len(xs) exactement.
+    """
+    try:
+        pts = np.asarray(polys, dtype=np.float64)
+    except (TypeError, ValueError):
+        pts = None
+
+    if pts is not None and pts.ndim == 3 and pts.shape[2] >= 2 and pts.shape[1] > 0:
+        xs, ys = pts[:, :, 0], pts[:, :, 1]
+        npts = pts.shape[1]
+        cx = np.cumsum(xs, axis=1)[:, -1] / npts
+        cy = np.cumsum(ys, axis=1)[:, -1] / npts
+        return xs.min(axis=1), ys.min(axis=1), xs.max(axis=1), ys.max(axis=1), cx, cy
+
+    # Polygones de tailles différentes : calcul par polygone
+    geom = []
+    for poly in polys:
+        xs = [p[0] for p in poly]; ys = [p[1] for p in poly]
+        geom.append((min(xs), min(ys), max(xs), max(ys), sum(xs)/len(xs), sum(ys)/len(ys)))
+    cols = np.asarray(geom, dtype=np.float64).reshape(-1, 6)
+    return tuple(cols[:, i] for i in range(6))
+
+
+def page_tokens(seg, conf_thresh=0.30, poly_keys=("rec_polys", "dt_polys")):
+    """
+    Extrait les tokens d'un segment OCR (rec_boxes prioritaire, sinon polygones)
+
+    Args:
+        seg (dict): JSON PaddleOCR d'une page
+        conf_thresh (float): Score minimal de reconnaissance
+        poly_keys (tuple): Clés de polygones acceptées, par ordre de priorité
+
+    Returns:
+        PageTokens ou None si le segment n'a pas de géométrie exploitable
+    """
+    texts = seg.get("rec_texts") or []
+    scores = seg.get("rec_scores") or []
+    boxes = seg.get("rec_boxes")
+    polys = None
+    for key in poly_keys:
+        polys = seg.get(key)
+        if polys:
+            break
+
+    use_boxes = bool(boxes) and len(boxes) == len(texts)
+    if not use_boxes and not (polys and len(polys) == len(texts)):
+        return None
+
+    # zip() s'arrête à la plus courte des listes : même comportement ici
+    n = min(len(texts), len(scores))
+    try:
+        sc = np.asarray(scores[:n], dtype=np.float64).reshape(n)
+        exact = not np.isnan(sc).any()  # None est converti en NaN par NumPy
+    except (TypeError, ValueError):
+        exact = False
+    if not exact:
+        # Scores manquants (None) ou non numériques : 0.0, comme float(sc or 0.0)
+        sc = np.fromiter((_parse_score(s) for s in scores[:n]), dtype=np.float64, count=n)
+    has_text = np.fromiter(map(bool, texts[:n]), dtype=bool, count=n)
+    keep = np.flatnonzero(has_text & ~(sc < conf_thresh))
+
+    if use_boxes:
+        b = np.asarray(boxes[:n], dtype=np.float64).reshape(-1, 4)[keep]
+        xmin, ymin, xmax, ymax = b[:, 0], b[:, 1], b[:, 2], b[:, 3]
+        cx = 0.5 * (xmin + xmax)
+        cy = 0.5 * (ymin + ymax)
+    else:
+        xmin, ymin, xmax, ymax, cx, cy = _poly_geometry([polys[i] for i in keep])
+
+    h = np.maximum(1.0, ymax - ymin)
+
+    # Tri stable par (cy, cx), comme list.sort(key=(cy, cx))
+    order = np.lexsort((cx, cy))
+    texts_kept = [texts[i].strip() for i in keep[order]]
+    return PageTokens(texts_kept, cx[order], cy[order], xmin[order], xmax[order],
+                      ymin[order], ymax[order], h[order])
+
+
+def _row_layout(tokens, tolerance=0.6, min_tol=8.0):
+    """
+    Regroupe les tokens par lignes : une ligne commence au premier token non placé
+    et inclut tous les suivants dont |cy - cy_début| <= tolérance.
+    Comme les tokens sont triés par cy, chaque ligne est une plage contiguë.
+
+    Returns:
+        tuple: (ordre des tokens ligne par ligne puis gauche→droite,
+                bornes des lignes dans cet ordre [0, fin_ligne_1, ..., n])
+    """
+    n = len(tokens)
+    cy = tokens.cy
+    tol = max(min_tol, tolerance * float(np.median(tokens.h)))
+
+    bounds = [0]
+    start = 0
+    while start < n:
+        anchor = cy[start]
+        end = int(np.searchsorted(cy, anchor + tol, side='right'))
+        # Ajuster la frontière sur la comparaison exacte |cy - anchor| <= tol
+        while end < n and abs(cy[end] - anchor) <= tol:
+            end += 1
+        while end > start + 1 and abs(cy[end - 1] - anchor) > tol:
+            end -= 1
+        bounds.append(end)
+        start = end
+    bounds = np.asarray(bounds)
+
+    # Tri stable gauche→droite à l'intérieur de chaque ligne
+    row_id = np.repeat(np.arange(len(bounds) - 1), np.diff(bounds))
+    order = np.lexsort((tokens.cx, row_id))
+    return order, bounds
+
+
+def rows_to_text(tokens, tolerance=0.6):
+    """Une ligne de texte par ligne détectée, tokens séparés par un espace"""
+    order, bounds = _row_layout(tokens, tolerance)
+    texts = [tokens.texts[i] for i in order.tolist()]
+    b = bounds.tolist()
+    return "\n".join(" ".join(texts[b[r]:b[r + 1]]) for r in range(len(b) - 1))
+
+
+def _column_breaks(tokens, order, bounds, min_gap_ratio=0.35):
+    """
+    Début de chaque cellule (positions dans `order`) : début de ligne, ou écart
+    horizontal > min_gap_ratio × largeur moyenne des tokens de la ligne
+    """
+    xmin = tokens.xmin[order]
+    xmax = tokens.xmax[order]
+    b = bounds.tolist()
+
+    # Somme séquentielle par ligne, comme sum(widths)/len(widths)
+    widths = (xmax - xmin).tolist()
+    avg_w = np.array([max(1.0, sum(widths[b[r]:b[r + 1]]) / (b[r + 1] - b[r])) for r in range(len(b) - 1)])
+    row_id = np.repeat(np.arange(len(b) - 1), np.diff(bounds))
+
+    is_break = np.zeros(len(order), dtype=bool)
+    is_break[1:] = (xmin[1:] - xmax[:-1]) > min_gap_ratio * avg_w[row_id[1:]]
+    is_break[bounds[:-1]] = True
+    return np.flatnonzero(is_break)
+
+
+def rows_to_cells(tokens, tolerance=0.6):
+    """
+    Découpe chaque ligne en cellules (écart horizontal entre tokens)
+
+    Returns:
+        list: Une liste de cellules (texte) par ligne détectée
+    """
+    order, bounds = _row_layout(tokens, tolerance)
+    texts = [tokens.texts[i] for i in order.tolist()]
+    cell_starts = _column_breaks(tokens, order, bounds)
+    cell_bounds = np.append(cell_starts, len(order)).tolist()
+    cells_all = [" ".join(texts[cell_bounds[k]:cell_bounds[k + 1]]).strip() for k in range(len(cell_starts))]
+
+    # Cellules de chaque ligne
+    first_cell = np.searchsorted(cell_starts, bounds).tolist()
+    return [cells_all[first_cell[r]:first_cell[r + 1]] for r in range(len(first_cell) - 1)]
+
+
+def cells_to_markdown_table(line_cells, min_cols=2, max_cols=6):
+    """
+    Convertit les cellules en table Markdown ; le nombre de colonnes est harmonisé
+    sur l'ensemble (max observé borné par max_cols, au moins min_cols)
+    """
+    maxc = max((len(c) for c in line_cells), default=0)
+    maxc = max(min_cols, min(maxc, max_cols))
+
+    line_cells = [c + [""]*(maxc-len(c)) if len(c) < maxc else c[:maxc] for c in line_cells]
+
+    header = "| " + " | ".join(f"Col {i+1}" for i in range(maxc)) + " |"
+    sep    = "| " + " | ".join("---" for _ in range(maxc)) + " |"
+    body   = "\n".join("| " + " | ".join(c.replace("|", "/") for c in cells) + " |" for cells in line_cells)
+    return header + "\n" + sep + "\n" + body
+
+
+def rows_to_markdown_table(tokens, min_cols=2, max_cols=6, tolerance=0.6):
+    """Table Markdown des lignes détectées (voir cells_to_markdown_table)"""
+    return cells_to_markdown_table(rows_to_cells(tokens, tolerance), min_cols=min_cols, max_cols=max_cols)
+
+
+def segment_to_text(seg, conf_thresh=0.30, poly_keys=("rec_polys", "dt_polys"), tolerance=0.6):
+    """Texte ligne par ligne d'une page OCR ("" si rien d'exploitable)"""
+    tokens = page_tokens(seg, conf_thresh=conf_thresh, poly_keys=poly_keys)
+    if tokens is None or len(tokens) == 0:
+        return ""
+    return rows_to_text(tokens, tolerance=tolerance)
+
+
+def segment_to_cells(seg, conf_thresh=0.30, tolerance=0.6):
+    """Cellules ligne par ligne d'une page OCR ([] si rien d'exploitable)"""
+    tokens = page_tokens(seg, conf_thresh=conf_thresh)
+    if tokens is None or len(tokens) == 0:
+        return []
+    return rows_to_cells(tokens, tolerance=tolerance)
+
+
+def segment_to_markdown_table(seg, conf_thresh=0.30, min_cols=2, max_cols=6, tolerance=0.6):
+    """Table Markdown d'une page OCR ("" si rien d'exploitable)"""
+    tokens = page_tokens(seg, conf_thresh=conf_thresh)
+    if tokens is None or len(tokens) == 0:
+        return ""
+    return rows_to_markdown_table(tokens, min_cols=min_cols, max_cols=max_cols, tolerance=tolerance)
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+ocr_cache.py - Cache disque des résultats OCR par page
+Responsabilité : éviter de relancer PaddleOCR sur une page déjà reconnue
+Clé = hash des pixels de la page rendue + paramètres OCR (langue, DPI, seuils det/rec)
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+
+import numpy as np
+
+
+class OCRResultCache:
+    """
+    Cache adressé par contenu des JSON PaddleOCR (rec_texts/rec_scores/rec_boxes...).
+
+    Chaque entrée est un fichier JSON ; la date de modification sert d'horodatage
+    LRU (rafraîchie à chaque lecture). Aucun index partagé : plusieurs processus
+    workers peuvent lire et écrire dans le même dossier sans coordination.
+    """
+
+    def __init__(self, cache_dir, max_size_mb=1024, max_entries=None):
+        """
+        Args:
+            cache_dir (str): Dossier du cache (créé si besoin)
+            max_size_mb (float): Taille maximale du cache sur disque
+            max_entries (int): Nombre maximal d'entrées (optionnel)
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_size_mb * 1024 * 1024) if max_size_mb else None
+        self.max_entries = max_entries
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        # Compteurs
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+        # Taille estimée, recalculée lors de chaque éviction
+        self._approx_bytes, self._approx_entries = self._scan_usage()
+
+    @staticmethod
+    def make_key(img_array, settings):
+        """
+        Calcule la clé d'une page à partir de ses pixels et des paramètres OCR
+
+        Args:
+            img_array (np.ndarray): Image rendue de la page
+            settings (dict): Paramètres influençant le résultat OCR
+
+        Returns:
+            str: Empreinte hexadécimale
+        """
+        img = np.ascontiguousarray(img_array)
+        h = hashlib.blake2b(digest_size=20)
+        h.update(json.dumps(settings, sort_keys=True, default=str).encode('utf-8'))
+        h.update(f"{img.shape}|{img.dtype}".encode('utf-8'))
+        h.update(memoryview(img).cast('B'))
+        return h.hexdigest()
+
+    def _path_for(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key):
+        """Retourne le JSON OCR en cache ou None"""
+        path = self._path_for(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                page_json = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+
+        # Rafraîchir l'horodatage LRU
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        self.hits += 1
+        return page_json
+
+    def put(self, key, page_json):
+        """Enregistre le JSON OCR d'une page (écriture atomique)"""
+        path = self._path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Entrée remplacée (même clé) : seule la différence de taille est comptée
+        try:
+            old_size = os.path.getsize(path)
+        except OSError:
+            old_size = None
+
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(page_json, f, ensure_ascii=False, separators=(',', ':'))
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        self.writes += 1
+        self._approx_bytes += os.path.getsize(path) - (old_size or 0)
+        if old_size is None:
+            self._approx_entries += 1
+
+        if self._over_limits(self._approx_bytes, self._approx_entries):
+            self.evict()
+
+    def _over_limits(self, total_bytes, total_entries):
+        if self.max_bytes is not None and total_bytes > self.max_bytes:
+            return True
+        if self.max_entries is not None and total_entries > self.max_entries:
+            return True
+        return False
+
+    def _iter_entries(self):
+        """(chemin, taille, mtime) de toutes les entrées du cache"""
+        for sub in os.scandir(self.cache_dir):
+            if not sub.is_dir():
+                continue
+            for entry in os.scandir(sub.path):
+                if entry.name.endswith('.json'):
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    yield entry.path, st.st_size, st.st_mtime
+
+    def _scan_usage(self):
+        total_bytes, total_entries = 0, 0
+        for _, size, _ in self._iter_entries():
+            total_bytes += size
+            total_entries += 1
+        return total_bytes, total_entries
+
+    def evict(self):
+        """
+        Supprime les entrées les moins récemment utilisées jusqu'à repasser
+        sous 90% des limites configurées
+        """
+        entries = sorted(self._iter_entries(), key=lambda e: e[2])
+        total_bytes = sum(e[1] for e in entries)
+        total_entries = len(entries)
+
+        target_bytes = int(self.max_bytes * 0.9) if self.max_bytes is not None else None
+        target_entries = int(self.max_entries * 0.9) if self.max_entries is not None else None
+
+        for path, size, _ in entries:
+            over_bytes = target_bytes is not None and total_bytes > target_bytes
+            over_entries = target_entries is not None and total_entries > target_entries
+            if not (over_bytes or over_entries):
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total_bytes -= size
+            total_entries -= 1
+            self.evictions += 1
+
+        self._approx_bytes, self._approx_entries = total_bytes, total_entries
+
+    def record(self, hits=0, misses=0, writes=0):
+        """Agrège les compteurs remontés par les processus workers"""
+        self.hits += hits
+        self.misses += misses
+        self.writes += writes
+
+    def stats(self):
+        """Retourne les compteurs du cache"""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'writes': self.writes,
+            'evictions': self.evictions,
+            'entries': self._approx_entries,
+            'size_mb': self._approx_bytes / (1024 * 1024)
+        }
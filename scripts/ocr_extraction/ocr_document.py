@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+ocr_document.py - Lecture du JSON consolidé de la Phase 1
+Responsabilité : ouvrir le résultat OCR une seule fois et en exposer les
+métadonnées et les segments (pages) aux consommateurs de la Phase 2.
+
+Avec ijson installé, les segments sont lus au fil de l'eau : seules les
+métadonnées (écrites en tête du fichier) et la page en cours sont en mémoire.
+Sinon le fichier est chargé une fois par json.load puis partagé.
+Un résultat au format .npz (ocr_store.py) est lu de façon transparente.
+"""
+
+import os
+import json
+
+from ocr_store import read_ocr_metadata, iter_ocr_pages
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+
+class OCRDocument:
+    """Résultat OCR consolidé {metadata, segments: [JSON de page, ...]} (.json ou .npz)"""
+
+    def __init__(self, path, streaming=True):
+        """
+        Args:
+            path (str): Résultat consolidé de la Phase 1 (.json ou .npz)
+            streaming (bool): Lire les segments au fil de l'eau si ijson est disponible
+        """
+        self.path = path
+        self.packed = path.endswith('.npz')
+        self.streaming = streaming and ijson is not None
+        self._data = None
+        self._metadata = None
+
+    @property
+    def file_size(self):
+        """Taille du fichier en octets (sans relire le contenu)"""
+        return os.path.getsize(self.path)
+
+    def _load(self):
+        if self._data is None:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self._data = json.load(f)
+        return self._data
+
+    @property
+    def metadata(self):
+        if self._metadata is None:
+            if self.packed:
+                self._metadata = read_ocr_metadata(self.path)
+            elif self.streaming:
+                # 'metadata' précède 'segments' : la lecture s'arrête après le premier objet
+                with open(self.path, 'rb') as f:
+                    self._metadata = next(ijson.items(f, 'metadata', use_float=True), None) or {}
+            else:
+                self._metadata = self._load().get('metadata', {})
+        return self._metadata
+
+    def iter_segments(self):
+        """Itère sur les JSON de page dans l'ordre du fichier"""
+        if self.packed:
+            yield from iter_ocr_pages(self.path)
+        elif self.streaming:
+            with open(self.path, 'rb') as f:
+                yield from ijson.items(f, 'segments.item', use_float=True)
+        else:
+            data = self._load()
+            self._metadata = data.get('metadata', {})
+            yield from data.get('segments', [])
+            # Segments consommés : le document complet n'est plus retenu en mémoire
+            self._data = None
@@ -23,32 +23,66 @@ import time
 import argparse
 from datetime import datetime
 import PyPDF2
-from io import BytesIO
 import sys
+import tempfile
+import multiprocessing
+import threading
+import queue
 
 # Imports PaddleOCR v3.1.0
 from paddleocr import PaddleOCR
-from pdf2image import convert_from_bytes
+from pdf2image import convert_from_path
 from PIL import Image
 import io
 import numpy as np
-import statistics
+from ocr_cache import OCRResultCache
+from adaptive_dpi import AdaptiveDPIPolicy, RenderStats, page_profile, rescale_page_json
+from form_template import FormTemplate, ocr_page_regions
+from page_classifier import classify_pages, build_segments, save_structure_config
+from ocr_server import RemoteOCREngine
+from ocr_store import OCR_STORAGE_FORMATS, save_ocr_pages, load_page_file
+from layout_engine import segment_to_text, segment_to_markdown_table
 from math import inf
 from itertools import groupby
 
 class DocumentStructureManager:
     """Gestionnaire de la structure des documents avec LogCards"""
     
-    def __init__(self, structure_config=None):
+    def __init__(self, structure_config=None, detect_structure=False):
         self.config = structure_config or {}
+        # Détection des LogCards page par page : option explicite ou "auto_detect": true
+        self.detect_structure = detect_structure or self.config.get('document_structure', {}).get('auto_detect', False)
+        self.page_labels = None
     
-    def generate_segments(self, total_pages):
+    def generate_segments(self, total_pages, pdf_path=None, rasterizer=None, header_ocr=None):
         document_structure = self.config.get('document_structure', {})
         
         if document_structure.get('manual_segmentation', {}).get('enabled'):
             return self._manual_segmentation()
-        else:
-            return self._automatic_segmentation(total_pages)
+        elif self.detect_structure and pdf_path:
+            segments = self._detected_segmentation(pdf_path, rasterizer, header_ocr)
+            if segments:
+                return segments
+            print("⚠️ Aucune LogCard détectée, segmentation automatique par configuration")
+        return self._automatic_segmentation(total_pages)
+    
+    def _detected_segmentation(self, pdf_path, rasterizer=None, header_ocr=None):
+        """Segments déduits de l'étiquetage des pages (voir page_classifier.py)"""
+        self.page_labels = classify_pages(pdf_path, rasterizer=rasterizer, header_ocr=header_ocr)
+        segments = build_segments(self.page_labels)
+        
+        counts = {}
+        for item in self.page_labels:
+            counts[item['label']] = counts.get(item['label'], 0) + 1
+        print(f"🔎 Détection des LogCards: {len(self.page_labels)} pages étiquetées")
+        for label, count in sorted(counts.items()):
+            print(f"   {label}: {count}")
+        for segment in segments:
+            if len(segment['pages']) != 2 or 'special' in segment:
+                print(f"   🔸 LogCard pages {segment['start_page']}-{segment['end_page']}: "
+                      f"{', '.join(segment['page_labels'])}")
+        print(f"📦 Segmentation détectée: {len(segments)} segments LogCard")
+        return segments
     
     def _manual_segmentation(self):
         segments = []
@@ -128,8 +162,331 @@ class DocumentStructureManager:
         print(f"📦 Segmentation automatique: {len(segments)} segments LogCard générés")
         return segments
 
+class PdfPageRasterizer:
+    """
+    Rendu des pages du PDF source directement en tableaux NumPy (RGB).
+    Le document est ouvert une seule fois ; seules les pages demandées sont rendues,
+    sans ré-encodage PDF intermédiaire ni sous-processus Poppler par segment.
+    Avec une AdaptiveDPIPolicy, chaque page est d'abord rendue en vignette pour
+    choisir sa résolution (voir render_page_adaptive).
+    """
+    
+    def __init__(self, pdf_path, dpi=200, adaptive=None):
+        self.pdf_path = pdf_path
+        self.dpi = dpi
+        self.adaptive = adaptive
+        self._pdf = None
+        
+        # pypdfium2 en priorité (pas d'exécutable externe)
+        try:
+            import pypdfium2 as pdfium
+            self._pdf = pdfium.PdfDocument(pdf_path)
+        except Exception as e_pdfium:
+            print(f"⚠️ pypdfium2 indisponible ({e_pdfium}), fallback pdf2image...")
+    
+    def render_page(self, page_number, dpi=None):
+        """
+        Rend une page (numérotation 1-based) en tableau NumPy HxWx3
+        """
+        dpi = dpi or self.dpi
+        if self._pdf is not None:
+            page = self._pdf[page_number - 1]
+            try:
+                bitmap = page.render(scale=dpi / 72.0, rev_byteorder=True)
+                # Copie : le buffer du bitmap est libéré avec l'objet pdfium
+                return np.array(bitmap.to_numpy()[:, :, :3])
+            finally:
+                page.close()
+        
+        # Fallback : pdf2image (nécessite Poppler), limité à la page demandée
+        poppler_path = os.environ.get("POPPLER_PATH", None)  # ex: C:\poppler\Library\bin
+        images = convert_from_path(self.pdf_path, dpi=dpi, first_page=page_number, last_page=page_number,
+                                   poppler_path=poppler_path if poppler_path else None)
+        return np.array(images[0].convert("RGB"))
+    
+    def render_pages(self, page_numbers, dpi=None):
+        """Rend une liste de pages (1-based) en tableaux NumPy"""
+        return [self.render_page(page_number, dpi=dpi) for page_number in page_numbers]
+    
+    def render_page_adaptive(self, page_number):
+        """
+        Rend une page au DPI choisi par la politique adaptative (DPI fixe sinon)
+        
+        Returns:
+            tuple: (tableau NumPy HxWx3, DPI du rendu)
+        """
+        if self.adaptive is None:
+            return self.render_page(page_number), self.dpi
+        thumbnail = self.render_page(page_number, dpi=self.adaptive.probe_dpi)
+        dpi, _ = self.adaptive.choose(page_profile(thumbnail))
+        if dpi == self.adaptive.probe_dpi:
+            return thumbnail, dpi
+        return self.render_page(page_number, dpi=dpi), dpi
+    
+    def close(self):
+        if self._pdf is not None:
+            self._pdf.close()
+            self._pdf = None
+
+
+# Paramètres PaddleOCR (également utilisés dans la clé du cache OCR)
+PADDLE_OCR_PARAMS = {
+    'use_angle_cls': True,
+    # Astuces pour docs scannés pâles:
+    'det_db_box_thresh': 0.3,     # accepte des boîtes plus "faibles"
+    'det_db_thresh': 0.25,        # seuil binarisation du det
+    'det_db_unclip_ratio': 1.8,   # un peu plus d'air autour des boîtes
+    'rec_batch_num': 32
+}
+
+
+def _build_paddle_ocr(lang='fr'):
+    """
+    Construit une instance PaddleOCR 3.1.0 (avec fallback en configuration minimale)
+    
+    Args:
+        lang (str): Langue pour PaddleOCR
+        
+    Returns:
+        PaddleOCR: Moteur OCR initialisé
+    """
+    print("🔧 Initialisation de PaddleOCR 3.1.0...")
+    
+    try:
+        # Nouvelle syntaxe pour PaddleOCR 3.1.0
+        ocr = PaddleOCR(lang=lang, **PADDLE_OCR_PARAMS)
+        print("✅ PaddleOCR initialisé avec succès")
+        return ocr
+        
+    except Exception as e:
+        print(f"❌ Erreur lors de l'initialisation de PaddleOCR: {e}")
+        # Fallback avec configuration minimale
+        try:
+            ocr = PaddleOCR(lang=lang)#, use_gpu=False)
+            print("✅ PaddleOCR initialisé en mode fallback")
+            return ocr
+        except Exception as e2:
+            print(f"❌ Impossible d'initialiser PaddleOCR: {e2}")
+            raise
+
+
+def _build_ocr_engine(lang='fr', ocr_server_url=None):
+    """
+    Retourne le moteur OCR : client du serveur persistant si une URL est fournie,
+    sinon une instance PaddleOCR locale
+    
+    Args:
+        lang (str): Langue pour PaddleOCR
+        ocr_server_url (str): URL du serveur OCR (voir ocr_server.py), optionnelle
+        
+    Returns:
+        Moteur exposant .ocr(image | [images])
+    """
+    if not ocr_server_url:
+        return _build_paddle_ocr(lang)
+    
+    engine = RemoteOCREngine(ocr_server_url)
+    server_lang = engine.server_info.get('lang')
+    if server_lang and server_lang != lang:
+        print(f"⚠️ Le serveur OCR utilise la langue '{server_lang}' (demandée: '{lang}')")
+    return engine
+
+
+def _paddle_list_to_json_like(paddle_list):
+    """
+    Convertit la sortie liste [[box, (text, score)], ...] en un dict
+    {'rec_texts': [...], 'rec_scores': [...], 'rec_boxes': [...]}
+    """
+    rec_texts, rec_scores, rec_boxes = [], [], []
+    if not paddle_list or not paddle_list[0]:
+        return {"rec_texts": [], "rec_scores": [], "rec_boxes": []}
+    for item in paddle_list[0]:
+        try:
+            box = item[0]
+            text, score = item[1][0], float(item[1][1])
+            rec_boxes.append(box)
+            rec_texts.append(text)
+            rec_scores.append(score)
+        except Exception:
+            continue
+    return {"rec_texts": rec_texts, "rec_scores": rec_scores, "rec_boxes": rec_boxes}
+
+
+def _ocr_image_to_page_json(ocr, img_array):
+    """
+    Lance PaddleOCR sur une page et retourne le JSON "officiel"
+    (rec_texts/rec_scores/rec_boxes...) sous forme de dict
+    """
+    try:
+        # Version simplifiée sans paramètres problématiques
+        result = ocr.ocr(img_array, cls=False)
+        
+        # Alternative si cls=False ne marche pas
+        if result is None:
+            result = ocr.ocr(img_array)
+    except Exception as ocr_error:
+        print(f"    ⚠️ Tentative alternative OCR: {ocr_error}")
+        # Tentative sans paramètres
+        result = ocr.ocr(img_array)
+
+    # Si la lib renvoie un objet enrichi compatible .save_to_json()
+    if result and hasattr(result[0], "save_to_json"):
+        try:
+            return _paddle_result_object_to_json(result[0])
+        except Exception:
+            # Fallback robuste
+            return _paddle_list_to_json_like(result)
+
+    # Sinon on recompose le même schéma à partir de la sortie liste
+    return _paddle_list_to_json_like(result)
+
+
+def _paddle_result_object_to_json(res):
+    """Récupère le JSON rec_texts/rec_scores/rec_boxes d'un objet résultat PaddleOCR 3.x"""
+    fd, tmp_json = tempfile.mkstemp(suffix="_paddle.json")
+    os.close(fd)
+    try:
+        res.save_to_json(tmp_json)
+        with open(tmp_json, "r", encoding="utf-8") as fj:
+            return json.load(fj)
+    finally:
+        if os.path.exists(tmp_json):
+            os.remove(tmp_json)
+
+
+def _ocr_images_to_page_jsons(ocr, img_arrays):
+    """
+    OCR d'un lot de pages (éventuellement de segments différents) en un seul appel.
+    PaddleOCR 3.x accepte une liste d'images et enchaîne détection puis
+    reconnaissance par lots ; le résultat i correspond toujours à l'image i.
+    
+    Returns:
+        list: JSON par page, dans l'ordre des images fournies
+    """
+    if len(img_arrays) == 1:
+        return [_ocr_image_to_page_json(ocr, img_arrays[0])]
+    
+    results = ocr.ocr(list(img_arrays))
+    if (not results or len(results) != len(img_arrays)
+            or not all(hasattr(res, "save_to_json") for res in results)):
+        raise ValueError("sortie PaddleOCR inattendue pour un lot de pages")
+    return [_paddle_result_object_to_json(res) for res in results]
+
+
+def _ocr_crops_to_page_jsons(ocr, img_arrays):
+    """OCR d'un lot de zones découpées, image par image si le lot échoue"""
+    try:
+        return _ocr_images_to_page_jsons(ocr, img_arrays)
+    except ValueError:
+        return [_ocr_image_to_page_json(ocr, img) for img in img_arrays]
+
+
+def _ocr_page_with_template(ocr, img_array, template, render_dpi):
+    """
+    OCR limité aux zones du gabarit de formulaire, avec repli en pleine page
+    lorsque le recalage sur les ancres n'est pas fiable
+    
+    Returns:
+        dict: JSON de la page, annoté de 'roi_ocr' (zones, ou motif du repli)
+    """
+    page_json, fallback = ocr_page_regions(img_array, template, lambda crops: _ocr_crops_to_page_jsons(ocr, crops),
+                                           scale=render_dpi / float(template.reference_dpi))
+    if page_json is None:
+        page_json = _ocr_image_to_page_json(ocr, img_array)
+        page_json['roi_ocr'] = fallback
+    return page_json
+
+
+def _lookup_cached_pages(cache, settings, img_arrays):
+    """
+    Cherche chaque page dans le cache OCR
+    
+    Returns:
+        tuple: (clés de cache, JSON par page avec None pour les absents)
+    """
+    if cache is None:
+        return [None] * len(img_arrays), [None] * len(img_arrays)
+    keys = [OCRResultCache.make_key(img, settings) for img in img_arrays]
+    return keys, [cache.get(key) for key in keys]
+
+
+# Moteur OCR et rasteriseur propres à chaque processus worker (construits une seule fois par worker)
+_WORKER_OCR = None
+_WORKER_RASTERIZER = None
+_WORKER_BATCH_SIZE = 1
+_WORKER_CACHE = None
+_WORKER_CACHE_SETTINGS = None
+_WORKER_FORM_TEMPLATE = None
+
+def _init_ocr_worker(lang, pdf_path, dpi=200, batch_size=1, cache_config=None, ocr_server_url=None,
+                     adaptive_dpi=None, form_template=None):
+    """Initialiseur du pool : charge les modèles PaddleOCR et ouvre le PDF une fois par processus"""
+    global _WORKER_OCR, _WORKER_RASTERIZER, _WORKER_BATCH_SIZE, _WORKER_CACHE, _WORKER_CACHE_SETTINGS
+    global _WORKER_FORM_TEMPLATE
+    _WORKER_OCR = _build_ocr_engine(lang, ocr_server_url)
+    _WORKER_FORM_TEMPLATE = form_template
+    _WORKER_RASTERIZER = PdfPageRasterizer(pdf_path, dpi=dpi, adaptive=adaptive_dpi)
+    _WORKER_BATCH_SIZE = max(1, batch_size)
+    if cache_config:
+        _WORKER_CACHE = OCRResultCache(cache_config['cache_dir'], max_size_mb=cache_config['max_size_mb'])
+        _WORKER_CACHE_SETTINGS = cache_config['settings']
+
+
+def _ocr_worker_process_segment(segment, max_retries=3):
+    """
+    OCR d'un segment complet dans un processus worker.
+    Aucune écriture disque ici : le processus parent persiste les résultats.
+    
+    Returns:
+        tuple: (index du segment, liste des JSON par page ou None, message d'erreur ou None,
+                compteurs du cache OCR {'hits', 'misses', 'writes'}, compteurs de rendu RenderStats)
+    """
+    segment_index = segment['index']
+    last_error = None
+    cache_counts = {'hits': 0, 'misses': 0, 'writes': 0}
+    for attempt in range(max_retries):
+        render_stats = RenderStats(_WORKER_RASTERIZER.dpi)
+        try:
+            page_jsons = []
+            pages = segment['pages']
+            for start in range(0, len(pages), _WORKER_BATCH_SIZE):
+                rendered = [_WORKER_RASTERIZER.render_page_adaptive(page_number)
+                            for page_number in pages[start:start + _WORKER_BATCH_SIZE]]
+                images = [img for img, _ in rendered]
+                for img, dpi in rendered:
+                    render_stats.record(img, dpi)
+                keys, batch_jsons = _lookup_cached_pages(_WORKER_CACHE, _WORKER_CACHE_SETTINGS, images)
+                misses = [i for i, page_json in enumerate(batch_jsons) if page_json is None]
+                if _WORKER_CACHE is not None:
+                    cache_counts['hits'] += len(images) - len(misses)
+                    cache_counts['misses'] += len(misses)
+                # Pages relevant du gabarit : OCR par zones, une page à la fois
+                roi_misses = [i for i in misses
+                              if _WORKER_FORM_TEMPLATE is not None and _WORKER_FORM_TEMPLATE.applies_to(start + i)]
+                full_misses = [i for i in misses if i not in roi_misses]
+                fresh = _ocr_images_to_page_jsons(_WORKER_OCR, [images[i] for i in full_misses]) if full_misses else []
+                fresh += [_ocr_page_with_template(_WORKER_OCR, images[i], _WORKER_FORM_TEMPLATE, rendered[i][1])
+                          for i in roi_misses]
+                for i, page_json in zip(full_misses + roi_misses, fresh):
+                    if _WORKER_RASTERIZER.adaptive is not None:
+                        rescale_page_json(page_json, rendered[i][1], _WORKER_RASTERIZER.dpi)
+                    batch_jsons[i] = page_json
+                    if _WORKER_CACHE is not None:
+                        _WORKER_CACHE.put(keys[i], page_json)
+                        cache_counts['writes'] += 1
+                page_jsons.extend(batch_jsons)
+            return segment_index, page_jsons, None, cache_counts, render_stats.as_dict()
+        except Exception as e:
+            last_error = str(e)
+            if attempt < max_retries - 1:
+                time.sleep((attempt + 1) * 5)
+    return segment_index, None, last_error, cache_counts, render_stats.as_dict()
+
+
 class Phase1OCRExtractor:
-    def __init__(self, api_key=None, output_dir=None, lang='fr'):
+    def __init__(self, api_key=None, output_dir=None, lang='fr', ocr_workers=1, prefetch_pages=2,
+                 ocr_batch_size=1, ocr_cache_dir=None, ocr_cache_max_mb=1024, ocr_server_url=None,
+                 adaptive_dpi=False, form_template_path=None, detect_structure=False, ocr_storage='json'):
         """
         Initialise l'extracteur OCR avec PaddleOCR 3.1.0
         
@@ -137,33 +494,43 @@ class Phase1OCRExtractor:
             api_key (str): Non utilisé avec PaddleOCR (gardé pour compatibilité)
             output_dir (str): Dossier de sortie (optionnel, sinon créé automatiquement)
             lang (str): Langue pour PaddleOCR ('fr', 'en', 'chinese_cht', etc.)
+            ocr_workers (int): Nombre de processus OCR en parallèle (1 = séquentiel)
+            prefetch_pages (int): Nombre maximal de pages rendues en avance sur l'OCR
+            ocr_batch_size (int): Nombre de pages envoyées ensemble à PaddleOCR (1 = page par page)
+            ocr_cache_dir (str): Dossier du cache OCR par page (optionnel, désactivé si None)
+            ocr_cache_max_mb (float): Taille maximale du cache OCR avant éviction LRU
+            ocr_server_url (str): URL d'un serveur OCR persistant (ocr_server.py) à utiliser
+                                  à la place d'un PaddleOCR local (optionnel)
+            adaptive_dpi (bool): Choisir la résolution page par page d'après une vignette
+                                 (pages vides en DPI bas, scans pâles en DPI haut)
+            form_template_path (str): Gabarit de formulaire (JSON) : OCR limité aux zones utiles
+                                      des pages recalées, pleine page sinon (optionnel)
+            detect_structure (bool): Détecter les LogCards page par page au lieu des listes
+                                     de pages de la configuration de structure
+            ocr_storage (str): Format des résultats OCR par page et consolidés : 'json'
+                               ou 'npz' (tableaux NumPy empaquetés, voir ocr_store.py)
         """
-        # Configuration PaddleOCR 3.1.0 - Syntaxe mise à jour
-        print("🔧 Initialisation de PaddleOCR 3.1.0...")
-        
-        try:
-            # Nouvelle syntaxe pour PaddleOCR 3.1.0
-            self.ocr = PaddleOCR(
-                use_angle_cls=True,
-                lang=lang,
-
-                # Astuces pour docs scannés pâles:
-                det_db_box_thresh=0.3,     # accepte des boîtes plus "faibles"
-                det_db_thresh=0.25,        # seuil binarisation du det
-                det_db_unclip_ratio=1.8,   # un peu plus d'air autour des boîtes
-                rec_batch_num=32
-            )
-            print("✅ PaddleOCR initialisé avec succès")
-            
-        except Exception as e:
-            print(f"❌ Erreur lors de l'initialisation de PaddleOCR: {e}")
-            # Fallback avec configuration minimale
+        self.lang = lang
+        self.dpi = 200  # Résolution adaptée pour OCR
+        self.adaptive_dpi = AdaptiveDPIPolicy(reference_dpi=self.dpi) if adaptive_dpi else None
+        self.render_stats = RenderStats(self.dpi)
+        self.form_template = None
+        if form_template_path:
             try:
-                self.ocr = PaddleOCR(lang=lang)#, use_gpu=False)
-                print("✅ PaddleOCR initialisé en mode fallback")
-            except Exception as e2:
-                print(f"❌ Impossible d'initialiser PaddleOCR: {e2}")
-                raise
+                self.form_template = FormTemplate.from_file(form_template_path)
+                print(f"🧭 Gabarit de formulaire chargé: {self.form_template.name}")
+            except (OSError, ValueError, KeyError) as e:
+                print(f"⚠️ Gabarit de formulaire illisible ({e}), OCR pleine page")
+        self.template_stats = {'pages': 0, 'fallbacks': 0, 'pixels': 0, 'page_pixels': 0}
+        self.ocr_workers = max(1, int(ocr_workers or 1))
+        self.prefetch_pages = max(1, int(prefetch_pages or 1))
+        self.ocr_batch_size = max(1, int(ocr_batch_size or 1))
+        self.ocr_cache = OCRResultCache(ocr_cache_dir, max_size_mb=ocr_cache_max_mb) if ocr_cache_dir else None
+        
+        # Moteur OCR construit à la première page à reconnaître (rien à charger en reprise
+        # complète) ; en mode multi-processus, chaque worker construit son propre moteur
+        self.ocr_server_url = ocr_server_url
+        self.ocr = None
         
         self.api_key = api_key
         self.output_dir = output_dir
@@ -175,7 +542,16 @@ class Phase1OCRExtractor:
         self.progress_file = None
         self.temp_dir = None
         self.final_markdown_path = None
-        self.structure_manager = DocumentStructureManager()
+        self.rasterizer = None
+        self.detect_structure = detect_structure
+        self.structure_manager = DocumentStructureManager(detect_structure=detect_structure)
+        # Callback optionnel page_sink(numéro de page dans le JSON consolidé, JSON de page),
+        # appelé dans le processus parent dès qu'une page est persistée (workflow en pipeline)
+        self.page_sink = None
+        if ocr_storage not in OCR_STORAGE_FORMATS:
+            print(f"⚠️ Format de stockage OCR inconnu ({ocr_storage}), utilisation de JSON")
+            ocr_storage = 'json'
+        self.ocr_storage = ocr_storage
 
     def extract_pdf_to_markdown(self, pdf_path, structure_config_path=None, output_dir=None):
         print("🔍 PHASE 1: EXTRACTION OCR PDF → MARKDOWN (PaddleOCR 3.1.0)")
@@ -194,10 +570,10 @@ class Phase1OCRExtractor:
         if structure_config_path and os.path.exists(structure_config_path):
             with open(structure_config_path, 'r') as f:
                 structure_config = json.load(f)
-            self.structure_manager = DocumentStructureManager(structure_config)
+            self.structure_manager = DocumentStructureManager(structure_config, detect_structure=self.detect_structure)
             print(f"📋 Configuration de structure chargée: {structure_config_path}")
         
-        segments = self.structure_manager.generate_segments(self.pdf_info['num_pages'])
+        segments = self._generate_segments()
         
         if not segments:
             print("❌ Aucun segment généré")
@@ -209,14 +585,27 @@ class Phase1OCRExtractor:
         if not chunks:
             return None
         
-        successful_segments = 0
-        for chunk in chunks:
-            if self._process_segment_ocr(chunk):
-                successful_segments += 1
-            time.sleep(1)
+        if self.ocr_workers > 1:
+            successful_segments = self._process_segments_parallel(chunks)
+        else:
+            successful_segments = self._process_segments_streaming(chunks)
         
         print(f"\n✅ Extraction OCR terminée: {successful_segments}/{len(segments)} segments réussis")
         
+        if self.adaptive_dpi is not None and self.render_stats.pixels:
+            print(f"🎚️  DPI adaptatif: {self.render_stats.summary()}")
+        
+        if self.template_stats['pages']:
+            stats = self.template_stats
+            saving = 1 - stats['pixels'] / stats['page_pixels']
+            print(f"🧭 OCR par zones: {stats['pages']} pages ({stats['fallbacks']} en repli pleine page), "
+                  f"pixels OCR {-saving*100:+.0f}% sur ces pages")
+        
+        if self.ocr_cache is not None:
+            stats = self.ocr_cache.stats()
+            print(f"⚡ Cache OCR: {stats['hits']} hits / {stats['misses']} misses "
+                  f"({stats['hit_rate']*100:.0f}%), {stats['entries']} entrées, {stats['size_mb']:.1f} MB")
+        
         if successful_segments > 0:
             final_markdown = self._consolidate_markdown_results()
             if final_markdown:
@@ -241,6 +630,13 @@ class Phase1OCRExtractor:
             'temp_directory': self.temp_dir
         }
     
+    @staticmethod
+    def result_json_path(pdf_path, output_dir, ocr_storage='json'):
+        """Chemin du résultat consolidé produit pour ce PDF (connu avant la fin de l'extraction)"""
+        pdf_basename = os.path.splitext(os.path.basename(pdf_path))[0]
+        safe_basename = "".join(c for c in pdf_basename if c.isalnum() or c in ('-', '_')).rstrip()
+        return os.path.join(output_dir, f"{safe_basename}_ocr_result.{ocr_storage}")
+
     def _setup_for_pdf(self, pdf_path, output_dir=None):
         if not os.path.exists(pdf_path):
             print(f"❌ Fichier PDF non trouvé: {pdf_path}")
@@ -260,11 +656,8 @@ class Phase1OCRExtractor:
         os.makedirs(self.output_dir, exist_ok=True)
         os.makedirs(self.temp_dir, exist_ok=True)
         
-        pdf_basename = os.path.splitext(os.path.basename(pdf_path))[0]
-        safe_basename = "".join(c for c in pdf_basename if c.isalnum() or c in ('-', '_')).rstrip()
-        
-        self.final_markdown_path = os.path.join(self.output_dir, f"{safe_basename}_ocr_result.md")
-        self.final_json_path = os.path.join(self.output_dir, f"{safe_basename}_ocr_result.json")
+        self.final_markdown_path = os.path.splitext(self.result_json_path(pdf_path, self.output_dir))[0] + ".md"
+        self.final_json_path = self.result_json_path(pdf_path, self.output_dir, self.ocr_storage)
         self.progress_file = os.path.join(self.output_dir, "ocr_progress.json")
         
         self._load_progress()
@@ -324,33 +717,59 @@ class Phase1OCRExtractor:
             print(f"❌ Erreur lors de l'analyse du PDF: {e}")
             return False
     
+    def _generate_segments(self):
+        """Segments LogCard du PDF ; la structure détectée est enregistrée pour relecture"""
+        if not self.structure_manager.detect_structure:
+            return self.structure_manager.generate_segments(self.pdf_info['num_pages'])
+        
+        rasterizer = PdfPageRasterizer(self.pdf_path, dpi=self.dpi)
+        try:
+            segments = self.structure_manager.generate_segments(
+                self.pdf_info['num_pages'], pdf_path=self.pdf_path, rasterizer=rasterizer,
+                header_ocr=lambda page_number: self._probe_header_text(rasterizer, page_number))
+        finally:
+            rasterizer.close()
+        
+        if self.structure_manager.page_labels is not None:
+            structure_path = save_structure_config(os.path.join(self.output_dir, "detected_structure.json"),
+                                                   segments, self.structure_manager.page_labels)
+            print(f"💾 Structure détectée: {structure_path} (réutilisable avec --structure-config)")
+        return segments
+
+    def _probe_header_text(self, rasterizer, page_number, header_fraction=0.15, dpi=100):
+        """OCR du seul bandeau d'en-tête d'une page (pages sans couche texte)"""
+        img_array = rasterizer.render_page(page_number, dpi=dpi)
+        band = np.ascontiguousarray(img_array[:max(1, int(img_array.shape[0] * header_fraction))])
+        if self.ocr is None:
+            self.ocr = _build_ocr_engine(self.lang, self.ocr_server_url)
+        page_json = _ocr_image_to_page_json(self.ocr, band)
+        return " ".join(page_json.get('rec_texts') or [])
+
     def _split_pdf_by_segments(self, segments):
+        """
+        Prépare les segments à traiter. Aucun PDF intermédiaire n'est construit :
+        les pages sont rendues à la demande par le PdfPageRasterizer.
+        """
         try:
             chunks = []
-            with open(self.pdf_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
+            num_pages = self.pdf_info['num_pages']
+            # Pages OCR des segments précédents : rang des pages dans le JSON consolidé
+            page_offset = 0
+            
+            for segment_index, segment in enumerate(segments):
+                pages_in_segment = [p for p in segment['pages'] if 0 <= p - 1 < num_pages]
                 
-                for segment_index, segment in enumerate(segments):
-                    pdf_writer = PyPDF2.PdfWriter()
-                    pages_in_segment = segment['pages']
-                    
-                    for page_num in pages_in_segment:
-                        if 0 <= page_num - 1 < len(pdf_reader.pages):
-                            pdf_writer.add_page(pdf_reader.pages[page_num - 1])
-                    
-                    chunk_buffer = BytesIO()
-                    pdf_writer.write(chunk_buffer)
-                    chunk_buffer.seek(0)
-                    
-                    chunks.append({
-                        'data': chunk_buffer.getvalue(),
-                        'start_page': segment['start_page'],
-                        'end_page': segment['end_page'],
-                        'pages': pages_in_segment,
-                        'index': segment_index,
-                        'type': segment.get('type', 'logcard'),
-                        'segment_info': segment
-                    })
+                chunks.append({
+                    'start_page': segment['start_page'],
+                    'end_page': segment['end_page'],
+                    'pages': pages_in_segment,
+                    'index': segment_index,
+                    'type': segment.get('type', 'logcard'),
+                    'page_offset': page_offset,
+                    'segment_info': segment
+                })
+                if segment.get('type', 'logcard') == 'logcard':
+                    page_offset += len(pages_in_segment)
             
             self.progress['total_chunks'] = len(chunks)
             self.progress['total_segments'] = len(chunks)
@@ -361,376 +780,391 @@ class Phase1OCRExtractor:
         except Exception as e:
             print(f"❌ Erreur lors de la division du PDF par segments: {e}")
             return None
-    
-
-    def _render_pdf_bytes_to_images(self, pdf_bytes, dpi=200):
-        # Try pypdfium2 first (no external exe)
-        try:
-            import pypdfium2 as pdfium
-            import numpy as np
-            import PIL.Image
-            pdf = pdfium.PdfDocument(pdf_bytes)
-            images = []
-            # Render all pages at scale = dpi/72
-            scale = dpi / 72.0
-            for i in range(len(pdf)):
-                page = pdf[i]
-                bitmap = page.render(scale=scale).to_pil()
-                images.append(bitmap.convert("RGB"))
-            return images
-        except Exception as e_pdfium:
-            print(f"⚠️ pypdfium2 indisponible ({e_pdfium}), fallback pdf2image...")
-
-        # Fallback: pdf2image (requires Poppler)
-        from pdf2image import convert_from_bytes
-        import os
-        poppler_path = os.environ.get("POPPLER_PATH", None)  # ex: C:\poppler\Library\bin
-        return convert_from_bytes(pdf_bytes, dpi=dpi, fmt='RGB',
-                                poppler_path=poppler_path if poppler_path else None)
-
 
     def _process_segment_ocr(self, segment):
         """
         Traite un segment avec PaddleOCR 3.1.0 - Version stable
         """
-        segment_index = segment['index']
-        segment_type = segment.get('type', 'logcard')
+        return self._process_segments_streaming([segment]) == 1
+
+    def _process_segments_streaming(self, chunks):
+        """
+        Pipeline borné page par page : rendu → OCR → mise en page → persistance.
+        Le rendu tourne dans un thread producteur qui garde au plus
+        `prefetch_pages` images en avance ; chaque page est écrite sur disque dès
+        qu'elle est reconnue, la mémoire reste donc constante quelle que soit
+        la longueur du document.
         
-        if segment_index in self.progress['chunk_files']:
-            print(f"⏭️  Segment {segment_index+1} ({segment_type}) déjà traité")
-            return True
+        Returns:
+            int: Nombre de segments réussis
+        """
+        successful_segments = 0
+        pending = []
+        for chunk in chunks:
+            if self._segment_needs_ocr(chunk):
+                pending.append(chunk)
+            else:
+                successful_segments += 1
         
-        if segment_type != 'logcard':
-            print(f"⏩ Segment {segment_index+1} ignoré (type: {segment_type})")
-            return True
-
-        max_retries = 3
-        for attempt in range(max_retries):
-            try:
-                pages_range = f"{segment['start_page']}-{segment['end_page']}"
-                pages_count = len(segment['pages'])
-                
-                print(f"🔍 OCR segment {segment_index+1}/{self.progress['total_segments']} "
-                    f"(pages {pages_range}, {pages_count} page{'s' if pages_count > 1 else ''})...")
-                
-                # Convertir le PDF en images avec pdf2image
-                print(f"  📸 Conversion PDF en images...")
-                #images = self._render_pdf_bytes_to_images(
-                #    segment['data'],
-                #    dpi=200,  # Résolution adaptée pour OCR
-                #    #fmt='RGB'  # Format explicite
-                #)
-                images = convert_from_bytes(
-                    segment['data'],
-                    dpi=200,  # Résolution adaptée pour OCR
-                    #fmt='RGB'  # Format explicite
-                )
-                
-                print(f"  🔤 Traitement OCR avec PaddleOCR 3.1.0...")
-                
-                ocr_results = []
-                for i, image in enumerate(images):
-                    # Convertir PIL Image en array numpy
-                    img_array = np.array(image)
-                    
-                    print(f"    📄 Page {segment['pages'][i]} - Analyse OCR...")
-                    
-                    # OCR avec PaddleOCR 3.1.0 - Nouvelle syntaxe stable
-                    try:
-                        # Version simplifiée sans paramètres problématiques
-                        result = self.ocr.ocr(img_array, cls=False)
-                        
-                        # Alternative si cls=False ne marche pas
-                        if result is None:
-                            result = self.ocr.ocr(img_array)
-                            print(result)
-                            
-                    except Exception as ocr_error:
-                        print(f"    ⚠️ Tentative alternative OCR: {ocr_error}")
-                        # Tentative sans paramètres
-                        # OCR
-                        result = self.ocr.ocr(img_array)
-
-                        # --- Récupération du JSON "officiel" avec rec_texts/rec_scores/rec_boxes ---
-                        page_json = None
-                        json_out = os.path.join(self.temp_dir, f"segment_{segment_index:03d}_p{i+1:02d}_paddle.json")
-
-                        try:
-                            # Si la lib renvoie un objet enrichi compatible .save_to_json()
-                            if result and hasattr(result[0], "save_to_json"):
-                                result[0].save_to_json(json_out)
-                                with open(json_out, "r", encoding="utf-8") as fj:
-                                    page_json = json.load(fj)
-                            else:
-                                # Sinon on recompose le même schéma à partir de la sortie liste
-                                page_json = self._paddle_list_to_json_like(result)
-                                with open(json_out, "w", encoding="utf-8") as fj:
-                                    json.dump(page_json, fj, ensure_ascii=False, indent=2)
-                        except Exception:
-                            # Fallback robuste
-                            page_json = self._paddle_list_to_json_like(result)
-
-                    # --- Markdown depuis le JSON ---
-                    markdown_text = self._paddle_result_to_markdown(page_json)
-                    actual_page_num = segment['pages'][i]
-                    ocr_results.append({
-                        'page_number': actual_page_num,
-                        'markdown': markdown_text,
-                        'raw_result_json': page_json,     # on garde le JSON structuré
-                        'paddle_json_path': json_out
-                    })
-                    print(f"    ✅ Page {actual_page_num} - {len(markdown_text)} caractères extraits")
-                       
-                    
-                    
-                
-                # Créer un objet response compatible
-                class MockResponse:
-                    def __init__(self, pages):
-                        self.pages = pages
-                        self.usage_info = None
-                
-                class MockPage:
-                    def __init__(self, markdown, text=None):
-                        self.markdown = markdown
-                        self.text = text or markdown
-                
-                mock_pages = [MockPage(page['markdown']) for page in ocr_results]
-                mock_response = MockResponse(mock_pages)
-                
-                print(f"✅ OCR PaddleOCR 3.1.0 terminé pour segment {segment_index+1}")
-                
-                # Sauvegarder le résultat du segment
-                #self._save_segment_result(segment_index, mock_response, segment)
-                
-                print(f"✅ Segment {segment_index+1} terminé!")
-                return True
-                
-            except Exception as e:
-                print(f"❌ Tentative {attempt+1}/{max_retries} échouée pour segment {segment_index+1}: {e}")
-                if attempt < max_retries - 1:
-                    wait_time = (attempt + 1) * 5
-                    print(f"⏳ Attente de {wait_time}s...")
-                    time.sleep(wait_time)
+        if not pending:
+            return successful_segments
         
-        # Marquer comme échoué
-        self.progress['failed_chunks'].append(segment_index)
-        self._save_progress()
-        print(f"💥 Segment {segment_index+1} a échoué définitivement")
-        return False
-    
-    def _paddle_list_to_json_like(self, paddle_list):
+        if self.ocr is None:
+            self.ocr = _build_ocr_engine(self.lang, self.ocr_server_url)
+        
+        # Le PDF source est ouvert une seule fois pour tous les segments
+        self.rasterizer = PdfPageRasterizer(self.pdf_path, dpi=self.dpi, adaptive=self.adaptive_dpi)
+        failed_segments = set()
+        # Le pipeline doit pouvoir remplir un lot complet pendant l'OCR du précédent
+        depth = max(self.prefetch_pages, self.ocr_batch_size)
+        try:
+            batch = []
+            for item in self._prefetch(self._iter_rendered_pages(pending, failed_segments), depth):
+                segment, page_pos, _, _ = item
+                if segment['index'] in failed_segments:
+                    continue
+                if page_pos == 0:
+                    pages_count = len(segment['pages'])
+                    print(f"🔍 OCR segment {segment['index']+1}/{self.progress['total_segments']} "
+                        f"(pages {segment['start_page']}-{segment['end_page']}, "
+                        f"{pages_count} page{'s' if pages_count > 1 else ''})...")
+                batch.append(item)
+                if len(batch) >= self.ocr_batch_size:
+                    successful_segments += self._flush_page_batch(batch, failed_segments)
+                    batch = []
+            if batch:
+                successful_segments += self._flush_page_batch(batch, failed_segments)
+        finally:
+            self.rasterizer.close()
+        
+        return successful_segments
+
+    def _flush_page_batch(self, batch, failed_segments, max_retries=3):
         """
-        Convertit la sortie liste [[box, (text, score)], ...] en un dict
-        {'rec_texts': [...], 'rec_scores': [...], 'rec_boxes': [...]}
+        OCR d'un lot de pages rendues puis persistance page par page.
+        Les pages déjà connues du cache OCR ne repassent pas dans PaddleOCR.
+        La correspondance page → segment est conservée ; en cas d'échec du lot,
+        chaque page est retraitée individuellement.
+        
+        Returns:
+            int: Nombre de segments terminés par ce lot
         """
-        rec_texts, rec_scores, rec_boxes = [], [], []
-        if not paddle_list or not paddle_list[0]:
-            return {"rec_texts": [], "rec_scores": [], "rec_boxes": []}
-        for item in paddle_list[0]:
+        settings = self._ocr_cache_settings()
+        keys, page_jsons = _lookup_cached_pages(self.ocr_cache, settings, [img for _, _, img, _ in batch])
+        misses = [i for i, page_json in enumerate(page_jsons) if page_json is None]
+        if self.ocr_cache is not None and len(misses) < len(batch):
+            print(f"    ⚡ {len(batch) - len(misses)} page(s) servie(s) par le cache OCR")
+        
+        # Les pages relevant du gabarit passent par l'OCR par zones (page par page, plus bas)
+        if self.form_template is not None:
+            misses = [i for i in misses if not self.form_template.applies_to(batch[i][1])]
+        
+        if len(misses) > 1:
             try:
-                box = item[0]
-                text, score = item[1][0], float(item[1][1])
-                rec_boxes.append(box)
-                rec_texts.append(text)
-                rec_scores.append(score)
-            except Exception:
+                print(f"    📚 Lot OCR de {len(misses)} pages...")
+                fresh = _ocr_images_to_page_jsons(self.ocr, [batch[i][2] for i in misses])
+                for i, page_json in zip(misses, fresh):
+                    page_jsons[i] = self._normalize_page_json(page_json, batch[i][3])
+                    if self.ocr_cache is not None:
+                        self.ocr_cache.put(keys[i], page_json)
+            except Exception as e:
+                print(f"    ⚠️ Lot OCR indisponible ({e}), traitement page par page...")
+        
+        completed = 0
+        for i, (segment, page_pos, img_array, render_dpi) in enumerate(batch):
+            segment_index = segment['index']
+            if segment_index in failed_segments:
                 continue
-        return {"rec_texts": rec_texts, "rec_scores": rec_scores, "rec_boxes": rec_boxes}
-
-
-
-
-    def _save_segment_result(self, segment_index, ocr_response, segment_info):
-            segment_file_md = os.path.join(self.temp_dir, f"segment_{segment_index:03d}.md")
-            segment_file_json = os.path.join(self.temp_dir, f"segment_{segment_index:03d}.json")
-
-            markdown_content = []
-            json_pages = []
-
-            for i, page in enumerate(ocr_response.pages):
-                actual_page_num = segment_info['pages'][i]
-                markdown_content.append(f"# Page {actual_page_num}\n\n{page.markdown}")
-
-                json_pages.append({
-                    "page_number": actual_page_num,
-                    "content": page.markdown,
-                    "content": page.markdown,
-                    "raw_text": getattr(page, 'text', page.markdown)
-                })
-                
-            segment_content_md = "\n\n---\n\n".join(markdown_content)
-            
-            segment_header_md = f"""<!-- SEGMENT {segment_index + 1} INFO
-    Type: {segment_info.get('type', 'logcard')}
-    Pages: {segment_info['pages']}
-    Start Page: {segment_info['start_page']}
-    End Page: {segment_info['end_page']}
-    LogCard Pages: {len(segment_info['pages'])}
-    Special: {segment_info.get('special', 'normal')}
-    OCR Engine: PaddleOCR 3.1.0
-    -->
-
-    """
             
-            final_content_md = segment_header_md + segment_content_md
-
-            segment_json_data = {
-                "segment_info": {
-                    "index": segment_index + 1,
-                    "type": segment_info.get('type', 'logcard'),
-                    "pages": segment_info['pages'],
-                    "start_page": segment_info['start_page'],
-                    "end_page": segment_info['end_page'],
-                    "total_pages": len(segment_info['pages']),
-                    "special": segment_info.get('special', 'normal'),
-                    "processed_at": datetime.now().isoformat(),
-                    "ocr_engine": "PaddleOCR 3.1.0"
-                },
-                "content": {
-                    "pages": json_pages,
-                    "full_markdown": segment_content_md
-                }
-            }
+            page_json = page_jsons[i]
+            page_number = segment['pages'][page_pos]
+            for attempt in range(max_retries if page_json is None else 0):
+                try:
+                    print(f"    📄 Page {page_number} - Analyse OCR...")
+                    page_json = self._ocr_single_page(img_array, page_pos, render_dpi)
+                    if self.ocr_cache is not None:
+                        self.ocr_cache.put(keys[i], page_json)
+                    break
+                except Exception as e:
+                    print(f"❌ Tentative {attempt+1}/{max_retries} échouée pour page {page_number}: {e}")
+                    if attempt < max_retries - 1:
+                        wait_time = (attempt + 1) * 5
+                        print(f"⏳ Attente de {wait_time}s...")
+                        time.sleep(wait_time)
             
-            with open(segment_file_md, 'w', encoding='utf-8') as f:
-                f.write(final_content_md)
-
-            with open(segment_file_json, 'w', encoding='utf-8') as f:
-                json.dump(segment_json_data, f, indent=2, ensure_ascii=False)
+            if page_json is None:
+                failed_segments.add(segment_index)
+                self._record_segment_failure(segment_index)
+                continue
             
-            self.progress['chunk_files'][segment_index] = {
-                'file_md': segment_file_md,
-                'file_json': segment_file_json,
-                 'file': segment_file_md,
-                'pages': segment_info['pages'],
-                'start_page': segment_info['start_page'],
-                'end_page': segment_info['end_page'],
-                'segment_type': segment_info.get('type', 'logcard'),
-                'completed_at': datetime.now().isoformat(),
-                'characters': len(final_content_md)
-            }
-            self.progress['completed_chunks'] += 1
-            self._save_progress()
+            self._persist_page_result(segment, page_pos, page_json)
             
-            print(f"💾 Segment {segment_index+1} sauvegardé ({len(final_content_md)} caractères)")
-
-
+            if page_pos == len(segment['pages']) - 1:
+                self._mark_segment_completed(segment)
+                completed += 1
+                print(f"✅ Segment {segment_index+1} terminé!")
+        
+        return completed
+
+    def _iter_rendered_pages(self, chunks, failed_segments=None):
+        """Générateur (segment, position de la page, image, DPI du rendu) – une seule page rendue à la fois"""
+        for segment in chunks:
+            for page_pos, page_number in enumerate(segment['pages']):
+                if failed_segments and segment['index'] in failed_segments:
+                    break
+                img_array, render_dpi = self.rasterizer.render_page_adaptive(page_number)
+                self.render_stats.record(img_array, render_dpi)
+                yield segment, page_pos, img_array, render_dpi
+
+    def _ocr_single_page(self, img_array, page_pos, render_dpi):
+        """OCR d'une page : zones du gabarit si la page en relève, sinon pleine page"""
+        if self.form_template is not None and self.form_template.applies_to(page_pos):
+            page_json = _ocr_page_with_template(self.ocr, img_array, self.form_template, render_dpi)
+        else:
+            page_json = _ocr_image_to_page_json(self.ocr, img_array)
+        return self._normalize_page_json(page_json, render_dpi)
 
-    def _tokens_from_seg(self,seg, conf_thresh=0.30):
-        texts  = seg.get("rec_texts")  or []
-        scores = seg.get("rec_scores") or []
-        boxes  = seg.get("rec_boxes")
-        polys  = seg.get("rec_polys") or seg.get("dt_polys")
+    def _normalize_page_json(self, page_json, render_dpi):
+        """Ramène les boîtes d'une page rendue en DPI adaptatif aux coordonnées du DPI de référence"""
+        if self.adaptive_dpi is None:
+            return page_json
+        return rescale_page_json(page_json, render_dpi, self.dpi)
 
-        toks = []
-        if boxes and len(boxes) == len(texts):
-            for t, sc, b in zip(texts, scores, boxes):
-                sc = float(sc or 0.0)
-                if not t or sc < conf_thresh: 
-                    continue
-                xmin,ymin,xmax,ymax = map(float, b)
-                toks.append({
-                    "text": t.strip(),
-                    "cx": 0.5*(xmin+xmax), "cy": 0.5*(ymin+ymax),
-                    "xmin": xmin, "xmax": xmax, "ymin": ymin, "ymax": ymax,
-                    "h": max(1.0, ymax-ymin)
-                })
-        elif polys and len(polys) == len(texts):
-            for t, sc, poly in zip(texts, scores, polys):
-                sc = float(sc or 0.0)
-                if not t or sc < conf_thresh:
+    @staticmethod
+    def _prefetch(iterator, depth):
+        """
+        Consomme un itérateur dans un thread dédié via une file bornée.
+        Au plus `depth` éléments sont produits en avance sur le consommateur.
+        """
+        buffer = queue.Queue(maxsize=depth)
+        done = object()
+        stop = threading.Event()
+        
+        def _put(item):
+            # Abandonne dès que le consommateur s'est arrêté (file pleine non vidée)
+            while not stop.is_set():
+                try:
+                    buffer.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
                     continue
-                xs = [p[0] for p in poly]; ys = [p[1] for p in poly]
-                xmin,ymin,xmax,ymax = min(xs),min(ys),max(xs),max(ys)
-                toks.append({
-                    "text": t.strip(),
-                    "cx": sum(xs)/len(xs), "cy": sum(ys)/len(ys),
-                    "xmin": xmin, "xmax": xmax, "ymin": ymin, "ymax": ymax,
-                    "h": max(1.0, ymax-ymin)
-                })
-        toks.sort(key=lambda d: (d["cy"], d["cx"]))
-        return toks
-
-    def _bucket_rows_by_y(self,toks):
-        """ regroupe les tokens par lignes (tolérance basée sur médiane des hauteurs) """
-        if not toks: return []
-        med_h = statistics.median(t["h"] for t in toks)
-        tol = max(8.0, 0.6*med_h)
-        rows = []
-        cur = []
-        cur_y = None
-        for t in toks:
-            if cur_y is None or abs(t["cy"] - cur_y) <= tol:
-                if cur_y is None:
-                    cur_y = t["cy"]
-                cur.append(t)
+            return False
+        
+        def _producer():
+            try:
+                for item in iterator:
+                    if not _put(item):
+                        return
+                _put(done)
+            except BaseException as e:
+                _put(e)
+        
+        producer = threading.Thread(target=_producer, daemon=True)
+        producer.start()
+        try:
+            while True:
+                item = buffer.get()
+                if item is done:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            producer.join()
+
+    def _process_segments_parallel(self, chunks):
+        """
+        Traite les segments avec un pool de processus OCR.
+        Chaque worker charge PaddleOCR une seule fois puis consomme les segments
+        dans une file partagée ; seul le processus parent écrit dans temp_segments
+        et dans ocr_progress.json.
+        
+        Returns:
+            int: Nombre de segments réussis
+        """
+        successful_segments = 0
+        pending = []
+        for chunk in chunks:
+            if self._segment_needs_ocr(chunk):
+                pending.append(chunk)
             else:
-                rows.append(sorted(cur, key=lambda d: d["cx"]))
-                cur = [t]; cur_y = t["cy"]
-        if cur: rows.append(sorted(cur, key=lambda d: d["cx"]))
-        return rows
+                successful_segments += 1
+        
+        if not pending:
+            return successful_segments
+        
+        workers = min(self.ocr_workers, len(pending))
+        print(f"⚙️  Pool OCR: {workers} processus pour {len(pending)} segments")
+        
+        segments_by_index = {chunk['index']: chunk for chunk in pending}
+        
+        # 'spawn' : PaddlePaddle n'est pas fiable après un fork
+        ctx = multiprocessing.get_context('spawn')
+        cache_config = None
+        if self.ocr_cache is not None:
+            cache_config = {
+                'cache_dir': self.ocr_cache.cache_dir,
+                'max_size_mb': self.ocr_cache.max_bytes / (1024 * 1024) if self.ocr_cache.max_bytes else None,
+                'settings': self._ocr_cache_settings()
+            }
+        with ctx.Pool(processes=workers, initializer=_init_ocr_worker,
+                      initargs=(self.lang, self.pdf_path, self.dpi, self.ocr_batch_size, cache_config,
+                                self.ocr_server_url, self.adaptive_dpi, self.form_template)) as pool:
+            for segment_index, page_jsons, error, cache_counts, render_counts in pool.imap_unordered(
+                    _ocr_worker_process_segment, pending):
+                if self.ocr_cache is not None:
+                    self.ocr_cache.record(**cache_counts)
+                self.render_stats.merge(render_counts)
+                if page_jsons is None:
+                    print(f"❌ Segment {segment_index+1}: {error}")
+                    self._record_segment_failure(segment_index)
+                    continue
+                self._record_segment_result(segments_by_index[segment_index], page_jsons)
+                successful_segments += 1
+                print(f"✅ Segment {segment_index+1} terminé! "
+                      f"({self.progress['completed_chunks']}/{self.progress['total_segments']})")
+        
+        return successful_segments
 
-    def _split_row_into_columns(self,row, min_gap_ratio=0.35):
+    def _segment_needs_ocr(self, segment):
+        """Indique si un segment doit encore passer à l'OCR"""
+        segment_index = segment['index']
+        segment_type = segment.get('type', 'logcard')
+        
+        # Les clés de progression deviennent des chaînes après un rechargement JSON
+        if segment_index in self.progress['chunk_files'] or str(segment_index) in self.progress['chunk_files']:
+            print(f"⏭️  Segment {segment_index+1} ({segment_type}) déjà traité")
+            return False
+        
+        if segment_type != 'logcard':
+            print(f"⏩ Segment {segment_index+1} ignoré (type: {segment_type})")
+            return False
+        
+        return True
+
+    def _ocr_cache_settings(self):
+        """Paramètres OCR qui invalident le cache lorsqu'ils changent"""
+        settings = {
+            'ocr_engine': "PaddleOCR 3.1.0",
+            'lang': self.lang,
+            'dpi': self.dpi,
+            **PADDLE_OCR_PARAMS
+        }
+        if self.adaptive_dpi is not None:
+            # Les JSON en cache ont alors leurs boîtes ramenées au DPI de référence
+            settings.update(self.adaptive_dpi.settings())
+        if self.form_template is not None:
+            settings.update(self.form_template.settings())
+        return settings
+
+    def _record_segment_result(self, segment, page_jsons):
         """
-        découpe une ligne en colonnes en détectant les 'grands gaps' horizontaux.
-        min_gap_ratio: fraction de la largeur moyenne d’un mot pour décider un saut de colonne.
+        Persiste les JSON Paddle d'un segment complet et met à jour la progression.
+        Appelé uniquement depuis le processus parent.
         """
-        if not row: return [row]
-        # largeur moyenne
-        widths = [(t["xmax"]-t["xmin"]) for t in row]
-        avg_w = max(1.0, sum(widths)/len(widths))
-
-        cols = [[]]
-        prev = None
-        for t in row:
-            if prev is None:
-                cols[-1].append(t)
-                prev = t
-                continue
-            gap = t["xmin"] - prev["xmax"]
-            if gap > min_gap_ratio * avg_w:
-                cols.append([t])
+        for page_pos, page_json in enumerate(page_jsons):
+            self._persist_page_result(segment, page_pos, page_json)
+        self._mark_segment_completed(segment)
+
+    def _page_result_path(self, segment_index, page_pos):
+        """Fichier du JSON Paddle d'une page (segment_XXX_pYY_paddle.json ou .npz)"""
+        return os.path.join(self.temp_dir,
+                            f"segment_{segment_index:03d}_p{page_pos+1:02d}_paddle.{self.ocr_storage}")
+
+    @staticmethod
+    def _page_segment_info(segment, page_pos):
+        """
+        Place d'une page dans sa LogCard, transmise à la Phase 2 avec le JSON de page :
+        les pages d'un même segment (recto, verso, continuations) y sont regroupées
+        """
+        page = segment['pages'][page_pos]
+        segment_info = {
+            'type': segment.get('type', 'logcard'),
+            'index': segment['index'],
+            'pages': [page],
+            'segment_pages': segment['pages']
+        }
+        # Étiquettes de la détection automatique (page_classifier), par numéro de page
+        source = segment.get('segment_info') or {}
+        labels = dict(zip(source.get('pages') or [], source.get('page_labels') or []))
+        if page in labels:
+            segment_info['page_label'] = labels[page]
+        if segment.get('page_offset') is not None:
+            segment_info['logcard_number'] = segment['page_offset'] + page_pos + 1
+        return segment_info
+
+    def _persist_page_result(self, segment, page_pos, page_json):
+        """Écrit le JSON Paddle d'une page (segment_XXX_pYY_paddle.json ou .npz)"""
+        json_out = self._page_result_path(segment['index'], page_pos)
+        # Copie : le JSON reçu peut être celui du cache OCR
+        page_json = dict(page_json, segment_info=self._page_segment_info(segment, page_pos))
+        if self.ocr_storage == 'npz':
+            save_ocr_pages(json_out, [page_json])
+        else:
+            with open(json_out, "w", encoding="utf-8") as fj:
+                json.dump(page_json, fj, ensure_ascii=False, indent=2)
+        
+        if self.page_sink is not None:
+            self.page_sink(segment['page_offset'] + page_pos + 1, page_json)
+        
+        markdown_text = self._paddle_segment_to_markdown(page_json)
+        print(f"    ✅ Page {segment['pages'][page_pos]} - {len(markdown_text)} caractères extraits")
+        
+        roi = page_json.get('roi_ocr')
+        if roi:
+            self.template_stats['pages'] += 1
+            self.template_stats['pixels'] += roi['pixels']
+            self.template_stats['page_pixels'] += roi['page_pixels']
+            if 'fallback' in roi:
+                self.template_stats['fallbacks'] += 1
+                print(f"    🧭 Gabarit non recalé ({roi['fallback']}) → OCR pleine page")
             else:
-                cols[-1].append(t)
-            prev = t
-        return cols
+                print(f"    🧭 Gabarit recalé ({roi['anchors']} ancres) → {len(roi['regions'])} zones, "
+                      f"{roi['pixels'] / roi['page_pixels']:.0%} de la page")
+        return json_out
 
+    def _mark_segment_completed(self, segment):
+        """
+        Met à jour la progression une fois toutes les pages d'un segment persistées :
+        le segment est inscrit dans chunk_files (ignoré par _segment_needs_ocr lors
+        d'une reprise) avec ses fichiers de page, lus dans cet ordre à la consolidation
+        """
+        segment_index = segment['index']
+        self.progress['chunk_files'][segment_index] = {
+            'file_json': [self._page_result_path(segment_index, page_pos)
+                          for page_pos in range(len(segment['pages']))],
+            'pages': segment['pages'],
+            'start_page': segment['start_page'],
+            'end_page': segment['end_page'],
+            'page_offset': segment.get('page_offset'),
+            'segment_type': segment.get('type', 'logcard'),
+            'completed_at': datetime.now().isoformat()
+        }
+        self.progress['completed_chunks'] = len(self.progress['chunk_files'])
+        if segment_index in self.progress['failed_chunks']:
+            self.progress['failed_chunks'].remove(segment_index)
+        self._save_progress()
 
-    def _rows_to_markdown_table(self,rows, min_cols=2, max_cols=6):
+    def _record_segment_failure(self, segment_index):
+        """Marque un segment comme échoué dans la progression"""
+        self.progress['failed_chunks'].append(segment_index)
+        self._save_progress()
+        print(f"💥 Segment {segment_index+1} a échoué définitivement")
+    
+    def _paddle_list_to_json_like(self, paddle_list):
         """
-        Convertit des lignes -> table Markdown.
-        On harmonise le nombre de colonnes sur l’ensemble (max observé borné).
+        Convertit la sortie liste [[box, (text, score)], ...] en un dict
+        {'rec_texts': [...], 'rec_scores': [...], 'rec_boxes': [...]}
         """
-        # transformer chaque ligne en liste de cellules (chaque cellule = concat des tokens)
-        line_cells = []
-        maxc = 0
-        for row in rows:
-            cols =self._split_row_into_columns(row)
-            cells = [" ".join(t["text"] for t in c).strip() for c in cols]
-            maxc = max(maxc, len(cells))
-            line_cells.append(cells)
-        maxc = max(min_cols, min(maxc, max_cols))
-
-        # normaliser la largeur (ajouter cellules vides à droite si besoin)
-        line_cells = [c + [""]*(maxc-len(c)) if len(c)<maxc else c[:maxc] for c in line_cells]
-
-        # construire markdown
-        header = "| " + " | ".join(f"Col {i+1}" for i in range(maxc)) + " |"
-        sep    = "| " + " | ".join("---" for _ in range(maxc)) + " |"
-        body   = "\n".join("| " + " | ".join(c.replace("|","/") for c in cells) + " |" for cells in line_cells)
-        return header + "\n" + sep + "\n" + body
+        return _paddle_list_to_json_like(paddle_list)
+
 
 
     def _paddle_segment_to_markdown_table(self, seg: dict, conf_thresh: float = 0.30,
                                         min_cols: int = 2, max_cols: int = 6) -> str:
-        toks = self._tokens_from_seg(seg, conf_thresh=conf_thresh)
-        if not toks:
-            return ""
-        rows = self._bucket_rows_by_y(toks)
-        if not rows:
-            return ""
-        return self._rows_to_markdown_table(rows, min_cols=min_cols, max_cols=max_cols)
+        return segment_to_markdown_table(seg, conf_thresh=conf_thresh, min_cols=min_cols,
+                                         max_cols=max_cols, tolerance=0.6)
 
 
     def _paddle_segment_to_markdown(self, seg: dict, conf_thresh: float = 0.30) -> str:
@@ -739,62 +1173,7 @@ class Phase1OCRExtractor:
         { 'rec_texts': [...], 'rec_scores': [...],
         'rec_boxes': [[xmin,ymin,xmax,ymax], ...] } ou 'rec_polys' (4 points).
         """
-        texts  = seg.get("rec_texts")  or []
-        scores = seg.get("rec_scores") or []
-        boxes  = seg.get("rec_boxes")  # [xmin,ymin,xmax,ymax]
-        polys  = seg.get("rec_polys")  # [[x,y],...]*4
-
-        items = []
-        if boxes and len(boxes) == len(texts):
-            for txt, sc, b in zip(texts, scores, boxes):
-                try: sc = float(sc)
-                except: sc = 0.0
-                if not txt or sc < conf_thresh: 
-                    continue
-                xmin, ymin, xmax, ymax = map(float, b)
-                cx = 0.5 * (xmin + xmax)
-                cy = 0.5 * (ymin + ymax)
-                h  = max(1.0, ymax - ymin)
-                items.append((cy, cx, h, txt.strip()))
-        elif polys and len(polys) == len(texts):
-            for txt, sc, poly in zip(texts, scores, polys):
-                try: sc = float(sc)
-                except: sc = 0.0
-                if not txt or sc < conf_thresh: 
-                    continue
-                xs = [p[0] for p in poly]; ys = [p[1] for p in poly]
-                cx = sum(xs)/len(xs); cy = sum(ys)/len(ys)
-                h  = max(1.0, (max(ys)-min(ys)))
-                items.append((cy, cx, h, txt.strip()))
-        else:
-            return ""
-
-        if not items:
-            return ""
-
-        # Tri haut→bas puis gauche→droite + regroupement par lignes
-        items.sort(key=lambda t: (t[0], t[1]))
-        try:
-            import statistics
-            med_h = statistics.median([t[2] for t in items])
-        except Exception:
-            med_h = 12.0
-        tol = max(8.0, 0.6 * med_h)
-
-        lines, current_line, current_y = [], [], None
-        for cy, cx, h, txt in items:
-            if current_y is None or abs(cy - current_y) <= tol:
-                current_y = cy if current_y is None else current_y
-                current_line.append((cx, txt))
-            else:
-                current_line.sort(key=lambda t: t[0])
-                lines.append(" ".join([t[1] for t in current_line]))
-                current_y = cy
-                current_line = [(cx, txt)]
-        if current_line:
-            current_line.sort(key=lambda t: t[0])
-            lines.append(" ".join([t[1] for t in current_line]))
-        return "\n".join(lines)
+        return segment_to_text(seg, conf_thresh=conf_thresh, poly_keys=("rec_polys",))
 
 
     def _paddle_result_to_markdown(self, phase1_json: dict, conf_thresh: float = 0.30) -> str:
@@ -862,39 +1241,55 @@ class Phase1OCRExtractor:
 
 
 
-        def _ingest_segment_paths(file_md, file_json):
+        def _ingest_segment_paths(file_md, file_json, page_offset=None):
             # Priorité au .md si présent
             if file_md and os.path.exists(file_md):
                 with open(file_md, "r", encoding="utf-8") as f:
                     consolidated_content_md.append(f.read())
-            # Toujours tenter d’ajouter le JSON (alimente la clé "segments")
-            if file_json and os.path.exists(file_json):
-                with open(file_json, "r", encoding="utf-8") as f:
-                    sj = json.load(f)
+            # Toujours tenter d’ajouter le JSON (alimente la clé "segments") ;
+            # chunk_files liste les fichiers de chaque page du segment
+            for path in (file_json if isinstance(file_json, list) else [file_json]):
+                if not path or not os.path.exists(path):
+                    continue
+                for sj in load_page_file(path):
+                    if page_offset is not None:
+                        # Numéro de LogCard de la page, identique à celui transmis par page_sink :
+                        # la numérotation ne se décale pas quand un segment a échoué
+                        page_offset += 1
+                        sj.setdefault("segment_info", {})["logcard_number"] = page_offset
                     consolidated_json_data["segments"].append(sj)
-                # Si on n’a pas de .md, on peut reconstruire depuis le JSON
-                if (not file_md or not os.path.exists(file_md)) and "content" in sj:
-                    fm = sj["content"].get("full_markdown", "")
-                    if fm:
-                        consolidated_content_md.append(
-                            f"<!-- reconstruit depuis JSON -->\n{fm}"
-                        )
+                    # Si on n’a pas de .md, on peut reconstruire depuis le JSON
+                    if (not file_md or not os.path.exists(file_md)) and "content" in sj:
+                        fm = sj["content"].get("full_markdown", "")
+                        if fm:
+                            consolidated_content_md.append(
+                                f"<!-- reconstruit depuis JSON -->\n{fm}"
+                            )
 
         # 2.a) Parcours normal via progress['chunk_files']
         had_any = False
-        for _, seg in sorted(self.progress.get("chunk_files", {}).items(), key=lambda x: x[0] if isinstance(x[0], int) else 0):
+        # Clés = index de segment (chaînes après rechargement JSON), triées numériquement
+        for _, seg in sorted(self.progress.get("chunk_files", {}).items(), key=lambda x: int(x[0])):
             had_any = True
             file_md = seg.get("file_md") or seg.get("file")  # compat
             file_json = seg.get("file_json")
-            _ingest_segment_paths(file_md, file_json)
+            _ingest_segment_paths(file_md, file_json, seg.get("page_offset"))
 
-        # 2.b) Fallback : anciens noms "segment_XXX_pYY_paddle.json"
+        # 2.b) Fallback : anciens noms "segment_XXX_pYY_paddle.json" (ou .npz)
         if not had_any or (not consolidated_content_md and not consolidated_json_data["segments"]):
             import glob, re
-            pattern = os.path.join(self.temp_dir, "segment_*_p??_paddle.json")
-            for p in sorted(glob.glob(pattern)):
+            # Une page présente dans les deux formats (reprise après changement de
+            # --ocr-storage) n'est lue qu'une fois, dans le format courant
+            page_files = {}
+            for storage in OCR_STORAGE_FORMATS:
+                pattern = os.path.join(self.temp_dir, f"segment_*_p??_paddle.{storage}")
+                for p in glob.glob(pattern):
+                    stem = os.path.splitext(p)[0]
+                    if stem not in page_files or storage == self.ocr_storage:
+                        page_files[stem] = p
+            for _, p in sorted(page_files.items()):
                 # Essaie un .md du même index s’il existe
-                m = re.search(r"segment_(\d+)_p\d+_paddle\.json$", os.path.basename(p))
+                m = re.search(r"segment_(\d+)_p\d+_paddle\.(json|npz)$", os.path.basename(p))
                 file_md = None
                 if m:
                     idx = int(m.group(1))
@@ -924,13 +1319,17 @@ class Phase1OCRExtractor:
         with open(self.final_markdown_path, "w", encoding="utf-8") as f:
             f.write(final_content_with_metadata)
 
-        # Sauvegarde JSON (inchangé)
+        # Sauvegarde JSON (ou .npz : mêmes métadonnées et segments, tableaux empaquetés)
         self.final_json_path = os.path.join(
             self.output_dir,
-            f"{os.path.splitext(os.path.basename(self.final_markdown_path))[0]}.json"
+            f"{os.path.splitext(os.path.basename(self.final_markdown_path))[0]}.{self.ocr_storage}"
         )
-        with open(self.final_json_path, "w", encoding="utf-8") as f:
-            json.dump(consolidated_json_data, f, indent=2, ensure_ascii=False)
+        if self.ocr_storage == 'npz':
+            save_ocr_pages(self.final_json_path, consolidated_json_data["segments"],
+                           consolidated_json_data["metadata"])
+        else:
+            with open(self.final_json_path, "w", encoding="utf-8") as f:
+                json.dump(consolidated_json_data, f, indent=2, ensure_ascii=False)
 
         print(f"📄 Markdown final: {self.final_markdown_path}")
         print(f"📄 JSON final: {self.final_json_path}")
@@ -971,6 +1370,20 @@ def main():
     parser.add_argument('--output-dir', help="Dossier de sortie (optionnel)")
     parser.add_argument('--structure-config', help="Chemin vers le fichier de configuration de structure JSON")
     parser.add_argument('--keep-temp', action='store_true', help="Conserver les fichiers temporaires")
+    parser.add_argument('--ocr-workers', type=int, default=1, help="Nombre de processus OCR en parallèle (défaut: 1)")
+    parser.add_argument('--prefetch-pages', type=int, default=2, help="Pages rendues en avance sur l'OCR (défaut: 2)")
+    parser.add_argument('--ocr-batch-size', type=int, default=1, help="Pages envoyées ensemble à PaddleOCR (défaut: 1)")
+    parser.add_argument('--ocr-cache-dir', help="Dossier du cache OCR par page (désactivé par défaut)")
+    parser.add_argument('--ocr-cache-max-mb', type=float, default=1024, help="Taille maximale du cache OCR en MB (défaut: 1024)")
+    parser.add_argument('--ocr-server', help="URL d'un serveur OCR persistant (ex: http://127.0.0.1:8866)")
+    parser.add_argument('--detect-structure', action='store_true',
+                        help="Détecter titres, rectos, versos et continuations au lieu des listes de pages de --structure-config")
+    parser.add_argument('--form-template',
+                        help="Gabarit de formulaire JSON (ex: logcard_form_template.json) : OCR limité aux zones utiles")
+    parser.add_argument('--adaptive-dpi', action='store_true',
+                        help="Résolution choisie page par page d'après une vignette (DPI bas pour les pages vides, haut pour les scans pâles)")
+    parser.add_argument('--ocr-storage', choices=OCR_STORAGE_FORMATS, default='json',
+                        help="Format des résultats OCR : json (défaut) ou npz (tableaux NumPy compacts)")
     
     args = parser.parse_args()
     
@@ -980,7 +1393,11 @@ def main():
         print(f"❌ Fichier PDF non trouvé: {args.pdf}")
         return
     
-    extractor = Phase1OCRExtractor(api_key)
+    extractor = Phase1OCRExtractor(api_key, ocr_workers=args.ocr_workers, prefetch_pages=args.prefetch_pages,
+                                   ocr_batch_size=args.ocr_batch_size, ocr_cache_dir=args.ocr_cache_dir,
+                                   ocr_cache_max_mb=args.ocr_cache_max_mb, ocr_server_url=args.ocr_server,
+                                   adaptive_dpi=args.adaptive_dpi, form_template_path=args.form_template,
+                                   detect_structure=args.detect_structure, ocr_storage=args.ocr_storage)
     
     try:
         result = extractor.extract_pdf_to_markdown(
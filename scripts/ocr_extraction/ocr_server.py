@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+ocr_server.py - Serveur PaddleOCR persistant (HTTP local)
+Responsabilité : garder les modèles détection/classification/reconnaissance chargés
+entre plusieurs exécutions de la Phase 1 (un chargement par machine au lieu d'un par PDF)
+
+Lancement :
+    python ocr_server.py --port 8866 --lang fr
+
+Utilisation côté extracteur :
+    python ocr_extractor_6_lilian.py --pdf doc.pdf --ocr-server http://127.0.0.1:8866
+"""
+
+import io
+import json
+import time
+import argparse
+import threading
+import urllib.request
+import urllib.error
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8866
+
+
+def _encode_images(img_arrays):
+    """Sérialise une liste d'images numpy au format .npz (non compressé)"""
+    buffer = io.BytesIO()
+    np.savez(buffer, *[np.ascontiguousarray(img) for img in img_arrays])
+    return buffer.getvalue()
+
+
+def _decode_images(payload):
+    """Désérialise les images envoyées par _encode_images, dans l'ordre d'origine"""
+    with np.load(io.BytesIO(payload), allow_pickle=False) as archive:
+        return [archive[f"arr_{i}"] for i in range(len(archive.files))]
+
+
+class RemotePageResult(dict):
+    """
+    Résultat OCR d'une page renvoyé par le serveur.
+    Expose save_to_json() comme les objets résultat de PaddleOCR 3.x.
+    """
+
+    def save_to_json(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(dict(self), f, ensure_ascii=False, indent=2)
+
+
+class RemoteOCREngine:
+    """
+    Client du serveur OCR, utilisable à la place de PaddleOCR :
+    ocr.ocr(image) ou ocr.ocr([images]) retournent une liste de résultats
+    compatibles save_to_json(), une entrée par image.
+    """
+
+    def __init__(self, server_url, timeout=600):
+        """
+        Args:
+            server_url (str): URL du serveur (ex: http://127.0.0.1:8866)
+            timeout (int): Délai maximal d'une requête OCR en secondes
+        """
+        self.server_url = server_url.rstrip('/')
+        self.timeout = timeout
+        self.server_info = self.health()
+        print(f"🔌 Serveur OCR connecté: {self.server_url} "
+              f"(langue: {self.server_info.get('lang')}, pages servies: {self.server_info.get('pages_served')})")
+
+    def health(self):
+        """Interroge /health ; lève une exception si le serveur est injoignable"""
+        with urllib.request.urlopen(f"{self.server_url}/health", timeout=10) as response:
+            return json.loads(response.read().decode('utf-8'))
+
+    def ocr(self, img, **kwargs):
+        """
+        OCR d'une image ou d'une liste d'images
+
+        Les options PaddleOCR (cls=...) sont ignorées : c'est la configuration
+        du serveur qui s'applique.
+        """
+        img_arrays = list(img) if isinstance(img, (list, tuple)) else [img]
+        request = urllib.request.Request(
+            f"{self.server_url}/ocr",
+            data=_encode_images(img_arrays),
+            headers={'Content-Type': 'application/octet-stream'},
+            method='POST'
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                body = json.loads(response.read().decode('utf-8'))
+        except urllib.error.HTTPError as e:
+            raise RuntimeError(f"Serveur OCR: HTTP {e.code} - {e.read().decode('utf-8', 'replace')}")
+
+        pages = body.get('pages', [])
+        if len(pages) != len(img_arrays):
+            raise ValueError("réponse du serveur OCR incomplète")
+        return [RemotePageResult(page) for page in pages]
+
+
+class OCRRequestHandler(BaseHTTPRequestHandler):
+    """Endpoints : GET /health, POST /ocr (corps .npz, réponse {'pages': [...]})"""
+
+    server_version = "LogCardOCR/1.0"
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != '/health':
+            self._send_json(404, {'error': 'endpoint inconnu'})
+            return
+        self._send_json(200, {
+            'status': 'ok',
+            'lang': self.server.lang,
+            'pages_served': self.server.pages_served,
+            'uptime_s': round(time.time() - self.server.started_at, 1)
+        })
+
+    def do_POST(self):
+        if self.path != '/ocr':
+            self._send_json(404, {'error': 'endpoint inconnu'})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            img_arrays = _decode_images(self.rfile.read(length))
+        except Exception as e:
+            self._send_json(400, {'error': f"images illisibles: {e}"})
+            return
+
+        try:
+            # PaddleOCR n'est pas thread-safe : un seul lot à la fois sur le moteur
+            with self.server.ocr_lock:
+                pages = self.server.ocr_pages(self.server.ocr, img_arrays)
+                self.server.pages_served += len(pages)
+        except Exception as e:
+            self._send_json(500, {'error': str(e)})
+            return
+
+        self._send_json(200, {'pages': pages})
+
+    def log_message(self, format, *args):
+        print(f"🌐 {self.address_string()} - {format % args}")
+
+
+def run_server(host=DEFAULT_HOST, port=DEFAULT_PORT, lang='fr'):
+    """
+    Charge PaddleOCR une fois puis sert les requêtes jusqu'à interruption
+
+    Args:
+        host (str): Adresse d'écoute (localhost par défaut)
+        port (int): Port d'écoute
+        lang (str): Langue pour PaddleOCR
+    """
+    # Import tardif : l'extracteur importe lui-même le client de ce module
+    from ocr_extractor_6_lilian import _build_paddle_ocr, _ocr_images_to_page_jsons
+
+    server = ThreadingHTTPServer((host, port), OCRRequestHandler)
+    server.ocr = _build_paddle_ocr(lang)
+    server.ocr_pages = _ocr_images_to_page_jsons
+    server.ocr_lock = threading.Lock()
+    server.lang = lang
+    server.pages_served = 0
+    server.started_at = time.time()
+
+    print(f"🚀 Serveur OCR prêt sur http://{host}:{port} (langue: {lang})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n⏹️ Arrêt du serveur OCR")
+    finally:
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serveur PaddleOCR persistant pour la Phase 1")
+    parser.add_argument('--host', default=DEFAULT_HOST, help=f"Adresse d'écoute (défaut: {DEFAULT_HOST})")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f"Port d'écoute (défaut: {DEFAULT_PORT})")
+    parser.add_argument('--lang', default='fr', help="Langue PaddleOCR (défaut: fr)")
+    args = parser.parse_args()
+
+    run_server(args.host, args.port, args.lang)
+
+
+if __name__ == "__main__":
+    main()
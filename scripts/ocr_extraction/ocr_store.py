@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+ocr_store.py - Stockage compact des résultats OCR par page (format .npz)
+Responsabilité : écrire et relire les JSON PaddleOCR (rec_texts/rec_scores/rec_boxes...)
+sous forme de tableaux NumPy empaquetés plutôt qu'en JSON indenté, où chaque
+coordonnée de polygone occupe une ligne.
+
+Un fichier .npz (np.savez, non compressé, lisible sans pickle) contient une ou
+plusieurs pages dans deux membres seulement (chaque membre lu coûte un accès zip
+et un en-tête .npy, prépondérants pour un fichier d'une page) :
+- header : JSON {métadonnées du document, disposition de chaque page (ordre des
+  clés, clés empaquetées et leur type, autres clés telles quelles), table des tableaux}
+- data (uint8) : tableaux bout à bout, relus par np.frombuffer sans copie :
+  - texts_blob + texts_offsets : table des chaînes de 'rec_texts' (UTF-8, bornes en
+    caractères : la table est décodée une seule fois puis découpée)
+  - <clé> + <clé>__offsets (pages + 1) : tableaux numériques de toutes les pages
+    concaténés sur l'axe 0 (rec_scores, rec_boxes, rec_polys, dt_polys, ...)
+
+Les pages relues sont des dicts identiques aux JSON d'origine (listes Python),
+les consommateurs (mise en page, Phase 2) ne voient pas la différence.
+"""
+
+import json
+import math
+
+import numpy as np
+
+# Formats de stockage des résultats OCR (également extensions des fichiers)
+OCR_STORAGE_FORMATS = ('json', 'npz')
+
+TEXT_KEY = 'rec_texts'
+NUMERIC_KEYS = ('rec_scores', 'rec_boxes', 'rec_polys', 'dt_polys', 'textline_orientation_angles')
+
+
+def _encode_json(obj):
+    return np.frombuffer(json.dumps(obj, ensure_ascii=False).encode('utf-8'), dtype=np.uint8)
+
+
+def _decode_json(arr):
+    return json.loads(arr.tobytes().decode('utf-8'))
+
+
+def _as_numeric_array(values):
+    """Tableau numérique rectangulaire, ou None si la valeur ne s'y prête pas (ragged, None, texte)"""
+    if not isinstance(values, list):
+        return None
+    try:
+        arr = np.asarray(values)
+    except ValueError:
+        return None
+    if arr.dtype.kind not in 'iuf':
+        # Liste vide : float64 de forme (0,), rattachée à la forme des autres pages
+        return arr if arr.size == 0 and arr.ndim == 1 else None
+    return arr
+
+
+def _pack_dtype(arrays):
+    """int32 si toutes les valeurs sont entières et tiennent sur 32 bits, sinon float64"""
+    values = [arr for arr in arrays if arr.size]
+    if values and all(arr.dtype.kind in 'iu' for arr in values):
+        info = np.iinfo(np.int32)
+        if all(arr.min() >= info.min and arr.max() <= info.max for arr in values):
+            return np.int32
+        return np.int64
+    return np.float64
+
+
+def save_ocr_pages(path, pages, metadata=None):
+    """
+    Écrit des JSON de page PaddleOCR dans un fichier .npz
+
+    Args:
+        path (str): Fichier de sortie (.npz)
+        pages (list): JSON de page (dicts)
+        metadata (dict): Métadonnées du document (optionnel)
+
+    Returns:
+        str: Chemin écrit
+    """
+    layouts = []
+    text_bytes = []
+    text_offsets = [0]
+    page_text_offsets = [0]
+    numeric = {key: [None] * len(pages) for key in NUMERIC_KEYS}
+
+    for i, page in enumerate(pages):
+        layout = {'keys': list(page), 'packed': {}, 'extra': {}}
+        for key, value in page.items():
+            if key == TEXT_KEY and isinstance(value, list) and all(isinstance(t, str) for t in value):
+                for text in value:
+                    text_bytes.append(text.encode('utf-8'))
+                    text_offsets.append(text_offsets[-1] + len(text))
+                layout['packed'][key] = 's'
+                continue
+            arr = _as_numeric_array(value) if key in NUMERIC_KEYS else None
+            if arr is None:
+                layout['extra'][key] = value
+            else:
+                numeric[key][i] = arr
+        page_text_offsets.append(len(text_offsets) - 1)
+        layouts.append(layout)
+
+    arrays = {
+        'texts_blob': np.frombuffer(b''.join(text_bytes), dtype=np.uint8),
+        'texts_offsets': np.asarray(text_offsets, dtype=np.int64),
+        f'{TEXT_KEY}__offsets': np.asarray(page_text_offsets, dtype=np.int64),
+    }
+
+    for key, per_page in numeric.items():
+        present = [arr for arr in per_page if arr is not None]
+        if not present:
+            continue
+        # Forme d'un élément (ex: (4,) pour rec_boxes, (4, 2) pour rec_polys) fixée par
+        # la première page non vide ; une page de forme différente reste en JSON
+        item_shape = next((arr.shape[1:] for arr in present if arr.size), ())
+        dtype = _pack_dtype(present)
+        chunks, offsets = [], [0]
+        for i, arr in enumerate(per_page):
+            if arr is not None and arr.size == 0:
+                arr = arr.reshape((0,) + item_shape)
+            if arr is None or arr.shape[1:] != item_shape:
+                if arr is not None:
+                    layouts[i]['extra'][key] = pages[i][key]
+                offsets.append(offsets[-1])
+                continue
+            layouts[i]['packed'][key] = 'i' if arr.dtype.kind in 'iu' else 'f'
+            chunks.append(arr.astype(dtype, copy=False))
+            offsets.append(offsets[-1] + len(arr))
+        arrays[key] = np.concatenate(chunks) if chunks else np.zeros((0,) + item_shape, dtype=dtype)
+        arrays[f'{key}__offsets'] = np.asarray(offsets, dtype=np.int64)
+
+    # Tableaux bout à bout, alignés sur 8 octets
+    table, chunks, position = {}, [], 0
+    for name, arr in arrays.items():
+        arr = np.ascontiguousarray(arr)
+        padding = -position % 8
+        chunks.append(b'\0' * padding)
+        position += padding
+        table[name] = [arr.dtype.str, list(arr.shape), position]
+        chunks.append(arr.tobytes())
+        position += arr.nbytes
+
+    header = {'metadata': metadata or {}, 'pages': layouts, 'arrays': table}
+    with open(path, 'wb') as f:
+        np.savez(f, header=_encode_json(header),
+                 data=np.frombuffer(b''.join(chunks), dtype=np.uint8))
+    return path
+
+
+def _read_header(data):
+    return _decode_json(data['header'])
+
+
+def read_ocr_metadata(path):
+    """Métadonnées d'un fichier .npz (le membre data n'est pas lu)"""
+    with np.load(path, allow_pickle=False) as data:
+        return _read_header(data)['metadata']
+
+
+def iter_ocr_pages(path):
+    """
+    Relit les pages d'un fichier .npz, une à une, sous forme de dicts JSON
+
+    Les tableaux empaquetés sont chargés une fois ; chaque page n'est convertie
+    en listes Python qu'au moment où elle est demandée.
+    """
+    with np.load(path, allow_pickle=False) as data:
+        header = _read_header(data)
+        buffer = data['data']
+
+    arrays = {}
+    for name, (dtype, shape, offset) in header['arrays'].items():
+        dtype = np.dtype(dtype)
+        count = math.prod(shape)
+        if count == 0:
+            arrays[name] = np.zeros(shape, dtype=dtype)
+        else:
+            arrays[name] = np.frombuffer(buffer, dtype=dtype, count=count, offset=offset).reshape(shape)
+
+    layouts = header['pages']
+    texts = arrays['texts_blob'].tobytes().decode('utf-8')
+    text_offsets = arrays['texts_offsets']
+    page_text_offsets = arrays[f'{TEXT_KEY}__offsets']
+
+    for i, layout in enumerate(layouts):
+        packed = layout['packed']
+        page = {}
+        for key in layout['keys']:
+            if key not in packed:
+                page[key] = layout['extra'][key]
+            elif key == TEXT_KEY:
+                start, end = page_text_offsets[i], page_text_offsets[i + 1]
+                bounds = text_offsets[start:end + 1].tolist()
+                page[key] = [texts[a:b] for a, b in zip(bounds, bounds[1:])]
+            else:
+                offsets = arrays[f'{key}__offsets']
+                values = arrays[key][offsets[i]:offsets[i + 1]]
+                if packed[key] == 'i' and values.dtype.kind == 'f':
+                    values = values.astype(np.int64)
+                page[key] = values.tolist()
+        yield page
+
+
+def load_ocr_pages(path):
+    """
+    Returns:
+        tuple: (métadonnées, liste des JSON de page)
+    """
+    return read_ocr_metadata(path), list(iter_ocr_pages(path))
+
+
+def load_page_file(path):
+    """
+    Lit un résultat OCR de page, quel que soit son format (.json ou .npz)
+
+    Returns:
+        list: JSON de page contenus dans le fichier (un seul pour segment_XXX_pYY_paddle.*)
+    """
+    if path.endswith('.npz'):
+        return list(iter_ocr_pages(path))
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.load(f)]
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+page_classifier.py - Détection automatique des LogCards d'un dossier PDF
+Responsabilité : étiqueter chaque page (title, logcard_front, logcard_back, continuation,
+other) à partir de sondes peu coûteuses, puis en déduire les segments LogCard au format
+de DocumentStructureManager, sans liste de pages écrite à la main.
+
+Sondes, de la moins chère à la plus chère :
+- couche texte du PDF (PyPDF2), présente sur la plupart des scans du dossier
+- vignette basse résolution : une page blanche n'est pas sondée plus loin
+- OCR du seul bandeau d'en-tête de la page (callable fourni par l'appelant)
+
+L'en-tête imprimé suffit à reconnaître le formulaire : recto « Modification and
+Services Bulletin checking » (parties 1 à 6), verso « Successive status and
+minor/major maintenance and overhaul operations » (partie 7).
+"""
+
+import re
+import json
+import unicodedata
+
+import PyPDF2
+
+from adaptive_dpi import page_profile
+
+PAGE_LABELS = ('title', 'logcard_front', 'logcard_back', 'continuation', 'other')
+
+# Marqueurs normalisés (minuscules, sans accents, espaces ni ponctuation) :
+# la couche texte des scans coupe ou déforme les mots ("Bulle tins", "INDI VIDUEL")
+FRONT_MARKERS = ('modificationandservicesbulletin', 'controledexecutiondesmodifications',
+                 'servicesbulletinschecking', 'logcardn')
+BACK_MARKERS = ('successivestatus', 'positionssuccessives', 'overhauloperations',
+                'entretienetderemise')
+TITLE_MARKERS = ('individualinspectionlogbook', 'registreindividueldecontrole',
+                 'inspectionlogbook', 'fichesmatricules')
+
+# En dessous, la couche texte est considérée absente
+_MIN_TEXT_CHARS = 20
+
+
+def _normalize_probe(text):
+    text = unicodedata.normalize('NFKD', text or '').encode('ascii', 'ignore').decode('ascii')
+    return re.sub(r'[^a-z0-9]+', '', text.lower())
+
+
+def label_from_text(text):
+    """
+    Étiquette d'une page d'après son texte (couche texte ou OCR de l'en-tête)
+
+    Returns:
+        str: 'logcard_front', 'logcard_back', 'title' ou None si aucun marqueur
+    """
+    probe = _normalize_probe(text)
+    front = sum(marker in probe for marker in FRONT_MARKERS)
+    back = sum(marker in probe for marker in BACK_MARKERS)
+    if front or back:
+        return 'logcard_front' if front >= back else 'logcard_back'
+    if any(marker in probe for marker in TITLE_MARKERS):
+        return 'title'
+    return None
+
+
+def read_text_layer(pdf_path):
+    """
+    Texte de la couche OCR/texte de chaque page du PDF
+
+    Returns:
+        list: Texte par page (chaîne vide si absent ou illisible)
+    """
+    texts = []
+    with open(pdf_path, 'rb') as f:
+        reader = PyPDF2.PdfReader(f)
+        for page in reader.pages:
+            try:
+                texts.append(page.extract_text() or '')
+            except Exception:
+                texts.append('')
+    return texts
+
+
+def classify_pages(pdf_path, rasterizer=None, header_ocr=None, probe_dpi=50, blank_ink_ratio=0.002):
+    """
+    Étiquette toutes les pages d'un PDF
+
+    Args:
+        pdf_path (str): PDF du dossier
+        rasterizer (PdfPageRasterizer): Rendu des vignettes (optionnel)
+        header_ocr (callable): page (1-based) → texte OCR du bandeau d'en-tête (optionnel)
+        probe_dpi (int): DPI des vignettes
+        blank_ink_ratio (float): Part d'encre en dessous de laquelle une page est blanche
+
+    Returns:
+        list: [{'page', 'label', 'source'}] dans l'ordre des pages ; 'source' indique
+              la sonde décisive ('text', 'thumbnail', 'header_ocr', 'position')
+    """
+    raw = []
+    for page_number, text in enumerate(read_text_layer(pdf_path), start=1):
+        label, source = None, None
+        if len(_normalize_probe(text)) >= _MIN_TEXT_CHARS:
+            label, source = label_from_text(text), 'text'
+        else:
+            blank = False
+            if rasterizer is not None:
+                profile = page_profile(rasterizer.render_page(page_number, dpi=probe_dpi))
+                blank = profile['ink_ratio'] < blank_ink_ratio
+                source = 'thumbnail'
+            if not blank and header_ocr is not None:
+                label, source = label_from_text(header_ocr(page_number)), 'header_ocr'
+        raw.append((page_number, label, source))
+
+    # Pages sans marqueur : le verso suit son recto (verso vierge, en-tête illisible) ;
+    # un verso suivi d'un autre verso est une feuille de continuation de la partie 7
+    pages = []
+    previous = None
+    for page_number, label, source in raw:
+        if label is None:
+            if previous == 'logcard_front':
+                label, source = 'logcard_back', 'position'
+            else:
+                label = 'other'
+        elif label == 'logcard_back' and previous in ('logcard_back', 'continuation'):
+            label = 'continuation'
+        pages.append({'page': page_number, 'label': label, 'source': source})
+        previous = label
+    return pages
+
+
+def build_segments(page_labels):
+    """
+    Regroupe les pages étiquetées en segments LogCard (format DocumentStructureManager) :
+    un recto ouvre une LogCard, versos et continuations s'y rattachent
+
+    Args:
+        page_labels (list): Sortie de classify_pages
+
+    Returns:
+        list: [{'pages', 'type': 'logcard', 'start_page', 'end_page', 'index', 'page_labels'}]
+    """
+    segments = []
+    current = None
+    for item in page_labels:
+        label = item['label']
+        if label == 'logcard_front' or (label in ('logcard_back', 'continuation') and current is None):
+            current = {'pages': [], 'page_labels': []}
+            if label != 'logcard_front':
+                # Verso sans recto : gardé pour ne pas perdre ses opérations
+                current['special'] = 'no_front'
+            segments.append(current)
+        elif label not in ('logcard_back', 'continuation'):
+            current = None
+            continue
+        current['pages'].append(item['page'])
+        current['page_labels'].append(label)
+
+    for index, segment in enumerate(segments):
+        segment.update({
+            'type': 'logcard',
+            'start_page': segment['pages'][0],
+            'end_page': segment['pages'][-1],
+            'index': index
+        })
+    return segments
+
+
+def structure_config_from_segments(segments, page_labels=None):
+    """
+    Configuration de structure équivalente (segmentation manuelle), réutilisable
+    avec --structure-config et relisible par un humain
+
+    Returns:
+        dict: {'document_structure': {'manual_segmentation': {...}}, 'page_labels': [...]}
+    """
+    config = {
+        'document_structure': {
+            'manual_segmentation': {
+                'enabled': True,
+                'segments': [{'pages': segment['pages'], 'type': 'logcard'} for segment in segments]
+            }
+        }
+    }
+    if page_labels is not None:
+        config['page_labels'] = page_labels
+    return config
+
+
+def save_structure_config(path, segments, page_labels=None):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(structure_config_from_segments(segments, page_labels), f, indent=2, ensure_ascii=False)
+    return path
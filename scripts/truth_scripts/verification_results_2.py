@@ -13,6 +13,11 @@ from openpyxl.styles import PatternFill, Font, Alignment
 from openpyxl.utils.dataframe import dataframe_to_rows
 import argparse
 import os
+import glob
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Statuts comptés dans la matrice de précision (les autres valeurs sont informatives)
+VALIDATION_STATUSES = ('correct', 'incorrect', 'no_ground_truth', 'both_empty')
 
 def compare_and_create_validated_excel(extracted_json_path, ground_truth_json_path, output_dir=None):
     """
@@ -65,6 +70,39 @@ def compare_and_create_validated_excel(extracted_json_path, ground_truth_json_pa
     print(f"📊 LogCards extraites: {extracted_count}")
     print(f"📊 LogCards de référence: {ground_truth_count}")
     
+    excel_data, validation_data, matched_cards = validate_logcards(extracted_data, ground_truth_data)
+    
+    print(f"🔗 LogCards avec référence: {matched_cards}/{extracted_count}")
+    
+    # Créer le DataFrame
+    if not excel_data:
+        print("❌ Aucune donnée à traiter")
+        return None
+    
+    df = pd.DataFrame(excel_data)
+    
+    # Créer le fichier Excel avec couleurs
+    output_path = get_output_path(extracted_json_path, ground_truth_json_path, output_dir)
+    create_colored_excel(df, validation_data, output_path, extracted_data, ground_truth_data)
+    
+    # Statistiques de validation
+    print_validation_stats(validation_data, matched_cards, extracted_count)
+    
+    return output_path
+
+def validate_logcards(extracted_data, ground_truth_data, verbose=True):
+    """
+    Valide chaque LogCard extraite contre sa référence (même numéro logCard)
+    
+    Args:
+        extracted_data (dict): Données extraites
+        ground_truth_data (dict): Données de référence
+        verbose (bool): Afficher le détail par LogCard
+    
+    Returns:
+        tuple: (lignes de données, statuts de validation par ligne, nombre de LogCards avec référence)
+    """
+    
     # Création du mapping des données vraies par logCard ID
     ground_truth_map = {}
     for card in ground_truth_data.get('logCards', []):
@@ -72,7 +110,8 @@ def compare_and_create_validated_excel(extracted_json_path, ground_truth_json_pa
         if card_id is not None:
             ground_truth_map[card_id] = card.get('logCardData', {})
     
-    print(f"🗂️  Mapping créé pour {len(ground_truth_map)} LogCards de référence")
+    if verbose:
+        print(f"🗂️  Mapping créé pour {len(ground_truth_map)} LogCards de référence")
     
     # Préparation des données pour l'Excel avec validation
     excel_data = []
@@ -86,8 +125,9 @@ def compare_and_create_validated_excel(extracted_json_path, ground_truth_json_pa
         
         if ground_truth_card_data:
             matched_cards += 1
-            print(f"✅ LogCard {card_id}: Données de référence trouvées")
-        else:
+            if verbose:
+                print(f"✅ LogCard {card_id}: Données de référence trouvées")
+        elif verbose:
             print(f"⚠️  LogCard {card_id}: Aucune donnée de référence")
         
         # Construction de la ligne de données
@@ -96,23 +136,7 @@ def compare_and_create_validated_excel(extracted_json_path, ground_truth_json_pa
         excel_data.append(row_data)
         validation_data.append(row_validation)
     
-    print(f"🔗 LogCards avec référence: {matched_cards}/{extracted_count}")
-    
-    # Créer le DataFrame
-    if not excel_data:
-        print("❌ Aucune donnée à traiter")
-        return None
-    
-    df = pd.DataFrame(excel_data)
-    
-    # Créer le fichier Excel avec couleurs
-    output_path = get_output_path(extracted_json_path, ground_truth_json_path, output_dir)
-    create_colored_excel(df, validation_data, output_path, extracted_data, ground_truth_data)
-    
-    # Statistiques de validation
-    print_validation_stats(validation_data, matched_cards, extracted_count)
-    
-    return output_path
+    return excel_data, validation_data, matched_cards
 
 def build_validated_row(card_id, extracted_data, ground_truth_data):
     """
@@ -535,16 +559,241 @@ def get_output_path(extracted_json_path, ground_truth_json_path, output_dir=None
     
     return output_directory / output_filename
 
+def discover_workflow_outputs(workflows_dir):
+    """
+    Recherche les résultats Phase 2 de tous les workflows d'un dossier
+    
+    Args:
+        workflows_dir (str): Dossier contenant les workflow_* (ex: WORKFLOW_RESULTS)
+    
+    Returns:
+        list: [{'run', 'extracted'}] triés par nom de workflow
+    """
+    runs = []
+    for workflow_dir in sorted(glob.glob(os.path.join(workflows_dir, "workflow_*"))):
+        extracted_files = sorted(glob.glob(os.path.join(workflow_dir, "phase2_logcard", "*_logcards.json")))
+        for extracted_path in extracted_files:
+            run_name = os.path.basename(workflow_dir)
+            if len(extracted_files) > 1:
+                run_name = f"{run_name}/{Path(extracted_path).stem}"
+            runs.append({'run': run_name, 'extracted': extracted_path})
+    return runs
+
+def score_workflow_run(run, ground_truth_data, colored_excel=False, ground_truth_json_path=None):
+    """
+    Valide un workflow et compte les statuts par champ (exécuté dans un processus du pool)
+    
+    Args:
+        run (dict): {'run', 'extracted'} (discover_workflow_outputs)
+        ground_truth_data (dict): Données de référence déjà chargées
+        colored_excel (bool): Créer aussi l'Excel coloré du workflow (validation_results/)
+        ground_truth_json_path (str): Chemin de la référence (nom du fichier Excel)
+    
+    Returns:
+        dict: {'run', 'extracted', 'extracted_cards', 'matched_cards', 'field_counts', 'excel_file', 'error'}
+    """
+    result = {'run': run['run'], 'extracted': run['extracted'], 'extracted_cards': 0, 'matched_cards': 0,
+              'field_counts': {}, 'excel_file': None, 'error': None}
+    try:
+        with open(run['extracted'], 'r', encoding='utf-8') as file:
+            extracted_data = json.load(file)
+        
+        excel_data, validation_data, matched_cards = validate_logcards(extracted_data, ground_truth_data, verbose=False)
+        result['extracted_cards'] = len(extracted_data.get('logCards', []))
+        result['matched_cards'] = matched_cards
+        
+        # Comptage des statuts par champ
+        field_counts = {}
+        for row in validation_data:
+            for field, status in row.items():
+                if status in VALIDATION_STATUSES:
+                    counts = field_counts.setdefault(field, dict.fromkeys(VALIDATION_STATUSES, 0))
+                    counts[status] += 1
+        result['field_counts'] = field_counts
+        
+        if colored_excel and excel_data:
+            output_path = get_output_path(run['extracted'], ground_truth_json_path)
+            create_colored_excel(pd.DataFrame(excel_data), validation_data, output_path,
+                                 extracted_data, ground_truth_data)
+            result['excel_file'] = str(output_path)
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+    return result
+
+def _accuracy(counts):
+    """Précision sur les champs comparables (None si aucun)"""
+    compared = counts['correct'] + counts['incorrect']
+    return counts['correct'] / compared if compared else None
+
+def build_accuracy_matrix(results):
+    """
+    Construit la matrice de précision champ × workflow et le détail des comptages
+    
+    Args:
+        results (list): Résultats de score_workflow_run
+    
+    Returns:
+        tuple: (DataFrame précision [champs + 'ALL_FIELDS'] × workflows, DataFrame détail)
+    """
+    fields = []
+    for result in results:
+        for field in result['field_counts']:
+            if field not in fields:
+                fields.append(field)
+    
+    matrix = {}
+    details = []
+    for result in results:
+        column = {}
+        total = dict.fromkeys(VALIDATION_STATUSES, 0)
+        for field in fields:
+            counts = result['field_counts'].get(field, dict.fromkeys(VALIDATION_STATUSES, 0))
+            column[field] = _accuracy(counts)
+            for status in VALIDATION_STATUSES:
+                total[status] += counts[status]
+            details.append({'Run': result['run'], 'Field': field, **counts, 'accuracy': column[field]})
+        column['ALL_FIELDS'] = _accuracy(total)
+        matrix[result['run']] = column
+    
+    matrix_df = pd.DataFrame(matrix, index=fields + ['ALL_FIELDS'], dtype=float)
+    matrix_df.index.name = 'Field'
+    return matrix_df, pd.DataFrame(details)
+
+def write_accuracy_matrix(matrix_df, details_df, results, output_path):
+    """
+    Écrit la matrice de précision (pourcentages), le détail des comptages et la liste des workflows
+    
+    Args:
+        matrix_df (DataFrame): Matrice champ × workflow (build_accuracy_matrix)
+        details_df (DataFrame): Comptages par workflow et par champ
+        results (list): Résultats de score_workflow_run
+        output_path (str): Fichier Excel de sortie
+    """
+    runs_df = pd.DataFrame([{
+        'Run': result['run'],
+        'Extracted_JSON': result['extracted'],
+        'LogCards': result['extracted_cards'],
+        'LogCards_with_reference': result['matched_cards'],
+        'Colored_Excel': result['excel_file'],
+        'Error': result['error']
+    } for result in results])
+    
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    with pd.ExcelWriter(output_path, engine='openpyxl') as writer:
+        matrix_df.to_excel(writer, sheet_name='Accuracy')
+        details_df.to_excel(writer, sheet_name='Details', index=False)
+        runs_df.to_excel(writer, sheet_name='Runs', index=False)
+        
+        ws = writer.sheets['Accuracy']
+        for row in ws.iter_rows(min_row=2, min_col=2):
+            for cell in row:
+                cell.number_format = '0.0%'
+        ws.column_dimensions['A'].width = 28
+        for cell in ws[1][1:]:
+            ws.column_dimensions[cell.column_letter].width = min(max(len(str(cell.value)) + 2, 12), 60)
+            cell.alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
+    
+    print(f"📊 Matrice de précision créée : {output_path}")
+
+def batch_validate(workflows_dir, ground_truth_json_path, output_path=None, workers=None, colored_excel=False):
+    """
+    Valide en parallèle tous les workflows d'un dossier et produit une matrice de précision
+    
+    Args:
+        workflows_dir (str): Dossier contenant les workflow_*
+        ground_truth_json_path (str): Fichier JSON de référence
+        output_path (str): Fichier Excel de la matrice (défaut: <workflows_dir>/validation_matrix.xlsx)
+        workers (int): Nombre de processus (défaut: nombre de CPU ; 1 = sans pool)
+        colored_excel (bool): Créer aussi l'Excel coloré de chaque workflow
+    
+    Returns:
+        str: Chemin du fichier Excel de la matrice, None en cas d'échec
+    """
+    
+    print("📊 VALIDATION DE TOUS LES WORKFLOWS")
+    print("="*50)
+    
+    try:
+        with open(ground_truth_json_path, 'r', encoding='utf-8') as file:
+            ground_truth_data = json.load(file)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"❌ Erreur de lecture du ground truth : {e}")
+        return None
+    
+    runs = discover_workflow_outputs(workflows_dir)
+    if not runs:
+        print(f"❌ Aucun résultat Phase 2 trouvé dans : {workflows_dir}")
+        return None
+    
+    workers = max(1, min(workers or os.cpu_count() or 1, len(runs)))
+    print(f"🔍 {len(runs)} workflows à valider ({workers} processus)")
+    
+    results = {}
+    if workers == 1:
+        for run in runs:
+            results[run['run']] = score_workflow_run(run, ground_truth_data, colored_excel, ground_truth_json_path)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(score_workflow_run, run, ground_truth_data, colored_excel,
+                                       ground_truth_json_path): run for run in runs}
+            for future in as_completed(futures):
+                run = futures[future]
+                try:
+                    results[run['run']] = future.result()
+                except Exception as e:
+                    results[run['run']] = {'run': run['run'], 'extracted': run['extracted'], 'extracted_cards': 0,
+                                           'matched_cards': 0, 'field_counts': {}, 'excel_file': None,
+                                           'error': f"{type(e).__name__}: {e}"}
+    
+    # Ordre de découverte pour les colonnes de la matrice
+    results = [results[run['run']] for run in runs]
+    for result in results:
+        if result['error']:
+            print(f"❌ {result['run']}: {result['error']}")
+        else:
+            print(f"✅ {result['run']}: {result['matched_cards']}/{result['extracted_cards']} LogCards avec référence")
+    
+    matrix_df, details_df = build_accuracy_matrix(results)
+    output_path = output_path or os.path.join(workflows_dir, "validation_matrix.xlsx")
+    write_accuracy_matrix(matrix_df, details_df, results, output_path)
+    
+    print(f"\n🎯 Précision par workflow (sur champs comparables)")
+    for run_name, accuracy in matrix_df.loc['ALL_FIELDS'].items():
+        print(f"   {run_name}: {'n/a' if pd.isna(accuracy) else f'{accuracy*100:.1f}%'}")
+    
+    return output_path
+
 def main():
     """Interface CLI pour le script de validation"""
     
     parser = argparse.ArgumentParser(description="Validation des données LogCard extraites")
-    parser.add_argument('--extracted', required=True, help="Chemin vers le fichier JSON des données extraites")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--extracted', help="Chemin vers le fichier JSON des données extraites")
+    source.add_argument('--workflows-dir', help="Valider tous les workflow_* de ce dossier (ex: WORKFLOW_RESULTS)")
     parser.add_argument('--ground-truth', required=True, help="Chemin vers le fichier JSON des données de référence")
     parser.add_argument('--output-dir', help="Dossier de sortie (optionnel)")
+    parser.add_argument('--matrix', help="Fichier Excel de la matrice de précision (défaut: <workflows-dir>/validation_matrix.xlsx)")
+    parser.add_argument('--workers', type=int, help="Nombre de processus en parallèle (défaut: nombre de CPU)")
+    parser.add_argument('--colored-excel', action='store_true', help="Créer aussi l'Excel coloré de chaque workflow")
     
     args = parser.parse_args()
     
+    if args.workflows_dir:
+        if not os.path.isdir(args.workflows_dir):
+            print(f"❌ Dossier de workflows non trouvé: {args.workflows_dir}")
+            return
+        if not os.path.exists(args.ground_truth):
+            print(f"❌ Fichier de données de référence non trouvé: {args.ground_truth}")
+            return
+        matrix_file = batch_validate(args.workflows_dir, args.ground_truth, output_path=args.matrix,
+                                     workers=args.workers, colored_excel=args.colored_excel)
+        if matrix_file:
+            print(f"\n🎉 Validation terminée avec succès!")
+            print(f"📁 Matrice de précision: {matrix_file}")
+        else:
+            print("\n❌ Validation échouée")
+        return
+    
     # Vérifier les fichiers d'entrée
     if not os.path.exists(args.extracted):
         print(f"❌ Fichier de données extraites non trouvé: {args.extracted}")
@@ -576,4 +825,7 @@ if __name__ == "__main__":
     main()
 
 
-# python verification_results_2.py --extracted "C:\Users\lilia\Desktop\freelance\clients\Wingleet\Aerochain_IA_RD\scripts\main_scripts\WORKFLOW_RESULTS\workflow_LOGCARDS-INVENTORYLOGBOOKDataSet_ocr_result_20250825_172922\phase2_logcard\LOGCARDS-INVENTORYLOGBOOKDataSet_ocr_result_logcards.json" --ground-truth "C:\Users\lilia\Desktop\freelance\clients\Wingleet\Aerochain_IA_RD\INPUT_DOCS\LOG_CARDS_INVENTORY_LOG_BOOK_ground_truth.json"
\ No newline at end of file
+# python verification_results_2.py --extracted "C:\Users\lilia\Desktop\freelance\clients\Wingleet\Aerochain_IA_RD\scripts\main_scripts\WORKFLOW_RESULTS\workflow_LOGCARDS-INVENTORYLOGBOOKDataSet_ocr_result_20250825_172922\phase2_logcard\LOGCARDS-INVENTORYLOGBOOKDataSet_ocr_result_logcards.json" --ground-truth "C:\Users\lilia\Desktop\freelance\clients\Wingleet\Aerochain_IA_RD\INPUT_DOCS\LOG_CARDS_INVENTORY_LOG_BOOK_ground_truth.json"
+#
+# Tous les workflows (matrice de précision champ × workflow, Excel colorés seulement avec --colored-excel):
+# python verification_results_2.py --workflows-dir ../main_scripts/WORKFLOW_RESULTS --ground-truth ../../INPUT_DOCS/LOG_CARDS_INVENTORY_LOG_BOOK_ground_truth.json --workers 4
@@ -0,0 +1,548 @@
+#!/usr/bin/env python3
+"""
+kardex_writer.py - Écriture en bloc dans le classeur KARDEX (.xlsm)
+Responsabilité : ajouter ou modifier des lignes de la feuille KARDEX sans parcours
+cellule par cellule. Deux moteurs :
+- openpyxl : dernière ligne trouvée via l'index des cellules, lignes converties en une passe
+- patch XML : seule la feuille ciblée est réécrite dans l'archive ; VBA, styles, chaînes
+  partagées et autres feuilles sont recopiés à l'identique
+"""
+
+import os
+import re
+import html
+import math
+import numbers
+import zipfile
+import datetime
+import tempfile
+import posixpath
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape
+
+import pandas as pd
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format
+from openpyxl.utils import get_column_letter, column_index_from_string
+from openpyxl.utils.datetime import from_excel, to_excel
+
+KARDEX_SHEET_NAME = "KARDEX"
+KARDEX_FIRST_DATA_ROW = 4  # lignes 1 à 3 : en-têtes
+
+NS_MAIN = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+NS_DOC_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+NS_PKG_REL = "http://schemas.openxmlformats.org/package/2006/relationships"
+
+_SHEET_DATA_RE = re.compile(r'<sheetData\b[^>]*?(?:/>|>(.*?)</sheetData>)', re.S)
+_ROW_RE = re.compile(r'<row\b[^>]*?(?:/>|>.*?</row>)', re.S)
+_CELL_RE = re.compile(r'<c\b[^>]*?(?:/>|>.*?</c>)', re.S)
+_ROW_NUM_RE = re.compile(r'\br="(\d+)"')
+_CELL_REF_RE = re.compile(r'\br="([A-Z]+)(\d+)"')
+_STYLE_RE = re.compile(r'\bs="(\d+)"')
+_TYPE_RE = re.compile(r'\bt="(\w+)"')
+_SPANS_RE = re.compile(r'\sspans="[^"]*"')
+_VALUE_RE = re.compile(r'<v>(.*?)</v>', re.S)
+_TEXT_RE = re.compile(r'<t\b[^>]*>(.*?)</t>', re.S)
+_DIMENSION_RE = re.compile(r'<dimension\b[^>]*\bref="([^"]*)"[^>]*/>')
+
+
+def dataframe_to_rows(df):
+    """
+    Convertit un DataFrame en lignes de valeurs Python prêtes pour Excel
+    (NaN/NaT → None, Timestamp → date), colonne par colonne
+
+    Args:
+        df (pandas.DataFrame): Données à écrire
+
+    Returns:
+        list: Une liste de valeurs par ligne, dans l'ordre des colonnes
+    """
+    columns = []
+    for col in df.columns:
+        series = df[col]
+        values = series.astype(object).where(series.notna(), None).tolist()
+        if series.dtype.kind == 'M' or series.dtype == object:
+            values = [v.to_pydatetime().date() if isinstance(v, pd.Timestamp) else v for v in values]
+        columns.append(values)
+    return [list(row) for row in zip(*columns)]
+
+
+def find_last_data_row(worksheet):
+    """
+    Dernière ligne contenant au moins une cellule non vide (1 au minimum).
+    Utilise l'index des cellules déjà chargées au lieu de balayer max_row × max_column.
+    """
+    last_row = 1
+    for (row, _), cell in worksheet._cells.items():
+        if row > last_row:
+            value = cell.value
+            if value is not None and str(value).strip() != '':
+                last_row = row
+    return last_row
+
+
+def dataframe_column_widths(df, max_width=50, padding=2, sample_size=None):
+    """
+    Largeurs de colonnes Excel calculées sur le DataFrame avant écriture
+    (longueurs de texte vectorisées), mêmes règles que le parcours des cellules
+    openpyxl : len(str(valeur)), en-tête compris, cellule vide comptée comme "None"
+
+    Args:
+        df (pandas.DataFrame): Données écrites avec to_excel(index=False)
+        max_width (int): Largeur maximale
+        padding (int): Marge ajoutée à la longueur maximale
+        sample_size (int): Nombre de lignes échantillonnées par colonne (None = toutes)
+
+    Returns:
+        list: Largeur de chaque colonne, dans l'ordre du DataFrame
+    """
+    if sample_size is not None and len(df) > sample_size:
+        df = df.sample(n=sample_size, random_state=0)
+
+    empty_length = len(str(None))
+    widths = []
+    for col in df.columns:
+        series = df[col]
+        if series.dtype.kind == 'M':
+            # Les cellules contiennent des datetime : str() → "AAAA-MM-JJ HH:MM:SS"
+            texts = series.dt.strftime('%Y-%m-%d %H:%M:%S')
+        else:
+            texts = series.astype(object).astype(str)
+        lengths = texts.str.len().where(series.notna(), empty_length)
+        max_length = max(len(str(col)), int(lengths.max()) if len(lengths) else 0)
+        widths.append(min(max_length + padding, max_width))
+    return widths
+
+
+def write_dataframes_write_only(excel_file_path, sheets, column_widths=None):
+    """
+    Écrit plusieurs DataFrames avec un classeur openpyxl en écriture seule (flux, mémoire constante),
+    avec le même rendu que DataFrame.to_excel(index=False) : en-tête gras encadré centré,
+    cellules manquantes vides, formats de date de pandas
+
+    Args:
+        excel_file_path (str): Fichier .xlsx à créer
+        sheets (dict): {nom de feuille: DataFrame}
+        column_widths (dict): {nom de feuille: [largeurs]} appliquées avant l'écriture des lignes
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Alignment, Border, Font, Side
+
+    workbook = Workbook(write_only=True)
+    thin = Side(style='thin')
+    for sheet_name, df in sheets.items():
+        worksheet = workbook.create_sheet(sheet_name)
+        for col_idx, width in enumerate((column_widths or {}).get(sheet_name, []), start=1):
+            worksheet.column_dimensions[get_column_letter(col_idx)].width = width
+
+        header = []
+        for col in df.columns:
+            cell = WriteOnlyCell(worksheet, str(col))
+            cell.font = Font(bold=True)
+            cell.border = Border(left=thin, right=thin, top=thin, bottom=thin)
+            cell.alignment = Alignment(horizontal='center', vertical='top')
+            header.append(cell)
+        worksheet.append(header)
+
+        # Colonnes converties en listes Python (manquant → '' comme na_rep de to_excel)
+        columns = []
+        for col in df.columns:
+            series = df[col]
+            values = series.astype(object).where(series.notna(), '').tolist()
+            if series.dtype.kind == 'M' or series.dtype == object:
+                values = [_write_only_date_cell(worksheet, v) for v in values]
+            columns.append(values)
+
+        for row in zip(*columns):
+            worksheet.append(row)
+
+    workbook.save(excel_file_path)
+
+
+def _write_only_date_cell(worksheet, value):
+    """Cellule datée au format de pandas ; les autres valeurs sont retournées telles quelles"""
+    from openpyxl.cell import WriteOnlyCell
+
+    if isinstance(value, datetime.datetime):
+        cell = WriteOnlyCell(worksheet, value.to_pydatetime() if isinstance(value, pd.Timestamp) else value)
+        cell.number_format = 'YYYY-MM-DD HH:MM:SS'
+        return cell
+    if isinstance(value, datetime.date):
+        cell = WriteOnlyCell(worksheet, value)
+        cell.number_format = 'YYYY-MM-DD'
+        return cell
+    return value
+
+
+def normalize_cell_value(value):
+    """
+    Forme comparable d'une valeur de cellule : None et '' équivalents, 7 == 7.0,
+    datetime à minuit == date (les dates sont relues en datetime)
+    """
+    if value is None or value == '':
+        return None
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, datetime.datetime):
+        return value.date() if value.time() == datetime.time() else value
+    if isinstance(value, datetime.date):
+        return value
+    if isinstance(value, numbers.Number):
+        number = float(value)
+        return int(number) if number.is_integer() else number
+    return value
+
+
+def plan_upsert(existing_rows, new_rows, key_columns, update_columns):
+    """
+    Compare les lignes à synchroniser aux lignes existantes indexées par clé
+
+    Une clé présente plusieurs fois est appariée dans l'ordre (k-ième nouvelle ligne ↔
+    k-ième ligne existante), ce qui rend une resynchronisation idempotente.
+    Les lignes existantes à clé entièrement vide (titres de section, lignes blanches) sont ignorées.
+
+    Args:
+        existing_rows (dict): {numéro de ligne: [valeurs]} de la feuille
+        new_rows (list): Lignes à synchroniser (dataframe_to_rows)
+        key_columns (list): Index (base 0) des colonnes formant la clé
+        update_columns (list): Index (base 0) des colonnes comparées et mises à jour
+
+    Returns:
+        dict: {'inserts': [lignes à ajouter], 'updates': {ligne: {colonne (base 1): valeur}},
+               'inserted', 'updated', 'unchanged'}
+    """
+    index = {}
+    for row_num in sorted(existing_rows):
+        values = existing_rows[row_num]
+        key = tuple(normalize_cell_value(values[c]) for c in key_columns)
+        if any(part is not None for part in key):
+            index.setdefault(key, []).append(row_num)
+
+    inserts, updates, unchanged = [], {}, 0
+    matched = {}
+    for row in new_rows:
+        key = tuple(normalize_cell_value(row[c]) for c in key_columns)
+        candidates = index.get(key, ())
+        position = matched.get(key, 0)
+        if position >= len(candidates):
+            inserts.append(row)
+            continue
+
+        matched[key] = position + 1
+        row_num = candidates[position]
+        existing = existing_rows[row_num]
+        changes = {c + 1: row[c] for c in update_columns
+                   if normalize_cell_value(row[c]) != normalize_cell_value(existing[c])}
+        if changes:
+            updates[row_num] = changes
+        else:
+            unchanged += 1
+
+    return {
+        'inserts': inserts,
+        'updates': updates,
+        'inserted': len(inserts),
+        'updated': len(updates),
+        'unchanged': unchanged
+    }
+
+
+def write_rows_block(worksheet, rows, start_row):
+    """
+    Écrit des lignes déjà converties (dataframe_to_rows) à partir de start_row
+
+    Args:
+        worksheet: Feuille openpyxl
+        rows (list): Lignes de valeurs
+        start_row (int): Première ligne à écrire
+    """
+    for row_idx, row in enumerate(rows, start=start_row):
+        for col_idx, value in enumerate(row, start=1):
+            worksheet.cell(row=row_idx, column=col_idx, value=value)
+
+
+def _xml_text(value):
+    return escape(ILLEGAL_CHARACTERS_RE.sub('', value))
+
+
+class SheetXMLPatcher:
+    """
+    Modifie les cellules d'une feuille directement dans l'archive .xlsx/.xlsm.
+
+    Seul le XML de la feuille est réécrit (cellules modifiées et balise <dimension>) ;
+    les chaînes nouvelles sont écrites en ligne (inlineStr) pour ne pas toucher
+    sharedStrings.xml, et les dates réutilisent un style de date du classeur.
+    """
+
+    def __init__(self, xlsx_path, sheet_name=KARDEX_SHEET_NAME):
+        """
+        Args:
+            xlsx_path (str): Classeur à modifier
+            sheet_name (str): Feuille ciblée (première feuille si absente)
+        """
+        self.xlsx_path = xlsx_path
+        with zipfile.ZipFile(xlsx_path) as archive:
+            self.sheet_name, self.sheet_part = self._locate_sheet(archive, sheet_name)
+            self.date_styles = self._find_date_styles(archive)
+            self.date_style = min(self.date_styles) if self.date_styles else None
+            self._shared_strings = None
+            if 'xl/sharedStrings.xml' in archive.namelist():
+                self._shared_strings_xml = archive.read('xl/sharedStrings.xml')
+            else:
+                self._shared_strings_xml = None
+            sheet_xml = archive.read(self.sheet_part).decode('utf-8')
+
+        match = _SHEET_DATA_RE.search(sheet_xml)
+        if match is None:
+            raise ValueError(f"pas de <sheetData> dans {self.sheet_part}")
+        self._head = sheet_xml[:match.start()]
+        self._tail = sheet_xml[match.end():]
+        body = match.group(1) or ''
+
+        # Lignes existantes : numéro → XML brut (conservées telles quelles si non modifiées)
+        self.rows = {}
+        for row_match in _ROW_RE.finditer(body):
+            row_xml = row_match.group(0)
+            row_num = int(_ROW_NUM_RE.search(row_xml[:row_xml.index('>')]).group(1))
+            self.rows[row_num] = row_xml
+        self.modified_rows = set()
+
+    @staticmethod
+    def _locate_sheet(archive, sheet_name):
+        """Retourne (nom de feuille, chemin du XML de la feuille dans l'archive)"""
+        workbook = ET.fromstring(archive.read('xl/workbook.xml'))
+        sheets = [(s.get('name'), s.get(f'{{{NS_DOC_REL}}}id'))
+                  for s in workbook.iter(f'{{{NS_MAIN}}}sheet')]
+        if not sheets:
+            raise ValueError("classeur sans feuille")
+        name, rel_id = next(((n, r) for n, r in sheets if n == sheet_name), sheets[0])
+        if name != sheet_name:
+            print(f"⚠️  Feuille '{sheet_name}' non trouvée, utilisation de: {name}")
+
+        rels = ET.fromstring(archive.read('xl/_rels/workbook.xml.rels'))
+        for rel in rels.iter(f'{{{NS_PKG_REL}}}Relationship'):
+            if rel.get('Id') == rel_id:
+                target = rel.get('Target')
+                part = target.lstrip('/') if target.startswith('/') else posixpath.normpath(posixpath.join('xl', target))
+                return name, part
+        raise ValueError(f"relation {rel_id} introuvable pour la feuille {name}")
+
+    @staticmethod
+    def _find_date_styles(archive):
+        """Index des styles de cellule (cellXfs) dont le format numérique est une date"""
+        date_styles = set()
+        if 'xl/styles.xml' not in archive.namelist():
+            return date_styles
+        styles = ET.fromstring(archive.read('xl/styles.xml'))
+        custom_formats = {int(fmt.get('numFmtId')): fmt.get('formatCode')
+                          for fmt in styles.iter(f'{{{NS_MAIN}}}numFmt')}
+        cell_xfs = styles.find(f'{{{NS_MAIN}}}cellXfs')
+        if cell_xfs is None:
+            return date_styles
+        for idx, xf in enumerate(cell_xfs.findall(f'{{{NS_MAIN}}}xf')):
+            fmt_id = int(xf.get('numFmtId', 0))
+            fmt_code = custom_formats.get(fmt_id, BUILTIN_FORMATS.get(fmt_id))
+            if fmt_code and is_date_format(fmt_code):
+                date_styles.add(idx)
+        return date_styles
+
+    def _shared_string(self, idx):
+        if self._shared_strings is None:
+            self._shared_strings = []
+            if self._shared_strings_xml is not None:
+                root = ET.fromstring(self._shared_strings_xml)
+                for si in root.iter(f'{{{NS_MAIN}}}si'):
+                    # Texte simple (<t>) ou riche (<r><t>), sans la phonétique (<rPh>)
+                    texts = si.findall(f'{{{NS_MAIN}}}t') + si.findall(f'{{{NS_MAIN}}}r/{{{NS_MAIN}}}t')
+                    self._shared_strings.append(''.join(t.text or '' for t in texts))
+        return self._shared_strings[idx] if 0 <= idx < len(self._shared_strings) else ''
+
+    def _cell_has_data(self, cell_xml):
+        """Même règle que openpyxl : valeur non nulle et non vide après strip"""
+        if '<f' in cell_xml:
+            return True
+        type_match = _TYPE_RE.search(cell_xml[:cell_xml.index('>')])
+        cell_type = type_match.group(1) if type_match else 'n'
+        if cell_type == 'inlineStr':
+            return html.unescape(''.join(_TEXT_RE.findall(cell_xml))).strip() != ''
+        value = _VALUE_RE.search(cell_xml)
+        if value is None:
+            return False
+        if cell_type == 's':
+            return self._shared_string(int(value.group(1))).strip() != ''
+        return value.group(1).strip() != ''
+
+    def last_data_row(self):
+        """Dernière ligne avec au moins une cellule non vide (1 au minimum)"""
+        for row_num in sorted(self.rows, reverse=True):
+            if row_num <= 1:
+                break
+            if any(self._cell_has_data(m.group(0)) for m in _CELL_RE.finditer(self.rows[row_num])):
+                return row_num
+        return 1
+
+    def read_row(self, row_num):
+        """
+        Valeurs d'une ligne {colonne: valeur}, typées comme openpyxl les lirait
+        (chaînes partagées résolues, nombres, booléens, dates pour les styles de date)
+        """
+        values = {}
+        for cell_match in _CELL_RE.finditer(self.rows.get(row_num, '')):
+            cell_xml = cell_match.group(0)
+            start_tag = cell_xml[:cell_xml.index('>')]
+            col_idx = column_index_from_string(_CELL_REF_RE.search(start_tag).group(1))
+            type_match = _TYPE_RE.search(start_tag)
+            cell_type = type_match.group(1) if type_match else 'n'
+            if cell_type == 'inlineStr':
+                values[col_idx] = html.unescape(''.join(_TEXT_RE.findall(cell_xml)))
+                continue
+
+            raw = _VALUE_RE.search(cell_xml)
+            if raw is None:
+                continue
+            raw = html.unescape(raw.group(1))
+            if cell_type == 's':
+                value = self._shared_string(int(raw))
+            elif cell_type == 'b':
+                value = raw.strip() == '1'
+            elif cell_type == 'n':
+                number = float(raw)
+                style_match = _STYLE_RE.search(start_tag)
+                if style_match and int(style_match.group(1)) in self.date_styles:
+                    value = from_excel(number)
+                else:
+                    value = int(number) if number.is_integer() and 'E' not in raw.upper() and '.' not in raw else number
+            else:
+                value = raw
+            values[col_idx] = value
+        return values
+
+    def read_rows(self, first_row, last_row, max_col):
+        """
+        Valeurs des lignes first_row..last_row sur les colonnes 1..max_col
+
+        Returns:
+            dict: {numéro de ligne: [valeurs]} (lignes absentes du XML ignorées)
+        """
+        rows = {}
+        for row_num in sorted(self.rows):
+            if first_row <= row_num <= last_row:
+                values = self.read_row(row_num)
+                rows[row_num] = [values.get(col) for col in range(1, max_col + 1)]
+        return rows
+
+    def _cell_xml(self, ref, value, style):
+        if isinstance(value, (datetime.datetime, datetime.date)):
+            if style not in self.date_styles and self.date_style is not None:
+                style = self.date_style
+            elif style not in self.date_styles:
+                value = value.isoformat()
+        elif hasattr(value, 'item'):
+            # Scalaires NumPy → types Python
+            value = value.item()
+        if isinstance(value, float) and not math.isfinite(value):
+            value = str(value)
+
+        s_attr = f' s="{style}"' if style is not None else ''
+        if value is None or value == '':
+            # Chaîne vide : cellule sans valeur, comme openpyxl à l'enregistrement
+            return f'<c r="{ref}"{s_attr}/>'
+        if isinstance(value, bool):
+            return f'<c r="{ref}"{s_attr} t="b"><v>{int(value)}</v></c>'
+        if isinstance(value, (datetime.datetime, datetime.date)):
+            return f'<c r="{ref}"{s_attr}><v>{to_excel(value)!r}</v></c>'
+        if isinstance(value, numbers.Number):
+            return f'<c r="{ref}"{s_attr}><v>{value!r}</v></c>'
+        return f'<c r="{ref}"{s_attr} t="inlineStr"><is><t xml:space="preserve">{_xml_text(str(value))}</t></is></c>'
+
+    def set_row_values(self, row_num, values_by_col):
+        """
+        Remplace les valeurs de certaines cellules d'une ligne (style des cellules existantes conservé)
+
+        Args:
+            row_num (int): Numéro de ligne Excel
+            values_by_col (dict): {index de colonne (1 = A): valeur Python ou None}
+        """
+        row_xml = self.rows.get(row_num)
+        cells = {}
+        if row_xml is None:
+            start_tag = f'<row r="{row_num}">'
+        else:
+            end = row_xml.index('>')
+            if row_xml[end - 1] == '/':
+                start_tag, body = row_xml[:end - 1] + '>', ''
+            else:
+                start_tag, body = row_xml[:end + 1], row_xml[end + 1:-len('</row>')]
+            # spans n'est qu'une indication : retiré car les colonnes peuvent changer
+            start_tag = _SPANS_RE.sub('', start_tag)
+            for cell_match in _CELL_RE.finditer(body):
+                cell_xml = cell_match.group(0)
+                col_letters = _CELL_REF_RE.search(cell_xml[:cell_xml.index('>')]).group(1)
+                cells[column_index_from_string(col_letters)] = cell_xml
+
+        for col_idx, value in values_by_col.items():
+            existing = cells.get(col_idx)
+            style_match = _STYLE_RE.search(existing[:existing.index('>')]) if existing else None
+            style = int(style_match.group(1)) if style_match else None
+            cells[col_idx] = self._cell_xml(f"{get_column_letter(col_idx)}{row_num}", value, style)
+
+        self.rows[row_num] = start_tag + ''.join(cells[c] for c in sorted(cells)) + '</row>'
+        self.modified_rows.add(row_num)
+
+    def append_rows(self, rows, start_row=None):
+        """
+        Écrit des lignes (dataframe_to_rows) à la suite de la dernière ligne de données
+
+        Returns:
+            int: Première ligne écrite
+        """
+        if start_row is None:
+            start_row = self.last_data_row() + 1
+        for row_num, row in enumerate(rows, start=start_row):
+            self.set_row_values(row_num, dict(enumerate(row, start=1)))
+        return start_row
+
+    def _sheet_xml(self):
+        body = ''.join(self.rows[r] for r in sorted(self.rows))
+        head = self._head
+        if self.rows:
+            # Étendre la zone utilisée aux lignes/colonnes écrites
+            max_row = max(self.rows)
+            max_col = 1
+            for row_num in self.modified_rows:
+                refs = _CELL_REF_RE.findall(self.rows[row_num])
+                if refs:
+                    max_col = max(max_col, max(column_index_from_string(c) for c, _ in refs))
+            dim = _DIMENSION_RE.search(head)
+            if dim:
+                ref = dim.group(1)
+                first, _, last = ref.partition(':')
+                last = last or first
+                last_col, last_row = re.match(r'([A-Z]+)(\d+)', last).groups()
+                new_last = (f"{get_column_letter(max(column_index_from_string(last_col), max_col))}"
+                            f"{max(int(last_row), max_row)}")
+                head = head[:dim.start(1)] + f"{first}:{new_last}" + head[dim.end(1):]
+        return head + f'<sheetData>{body}</sheetData>' + self._tail
+
+    def save(self, output_path=None):
+        """
+        Réécrit l'archive : la feuille modifiée, toutes les autres entrées recopiées à l'identique
+        (écriture dans un fichier temporaire puis remplacement atomique)
+        """
+        output_path = output_path or self.xlsx_path
+        sheet_bytes = self._sheet_xml().encode('utf-8')
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(output_path)), suffix='.tmp')
+        os.close(fd)
+        try:
+            with zipfile.ZipFile(self.xlsx_path) as source, \
+                    zipfile.ZipFile(tmp_path, 'w', compression=zipfile.ZIP_DEFLATED) as target:
+                for info in source.infolist():
+                    data = sheet_bytes if info.filename == self.sheet_part else source.read(info.filename)
+                    target.writestr(info, data, compress_type=info.compress_type)
+            os.replace(tmp_path, output_path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.modified_rows.clear()
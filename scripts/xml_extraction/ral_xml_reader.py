@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+ral_xml_reader.py - Lecture en flux des exports XML RalWebDataTable
+Responsabilité : lire les lignes RalWebDataTable avec iterparse (éléments libérés au fur
+et à mesure) et les ranger directement dans des colonnes, sans arbre XML complet
+ni liste de dicts intermédiaire.
+
+Le DataFrame obtenu est identique à pd.DataFrame([dict par ligne]) de l'ancienne
+lecture ET.parse : colonnes dans l'ordre de première apparition, valeurs nettoyées
+(strip, "" si vide), NaN pour une balise absente d'une ligne.
+"""
+
+import xml.etree.ElementTree as ET
+
+import numpy as np
+import pandas as pd
+
+ROW_TAG = 'RalWebDataTable'
+
+
+def _iter_row_elements(xml_file_path, row_tag=ROW_TAG):
+    """
+    Parcourt les éléments `row_tag` enfants directs de la racine.
+    Chaque élément est vidé après usage, et détaché de la racine,
+    pour que la mémoire ne dépende pas de la taille du fichier.
+
+    Yields:
+        tuple: (balise racine, élément ligne complet)
+    """
+    root = None
+    depth = 0
+    for event, elem in ET.iterparse(xml_file_path, events=('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = elem
+            depth += 1
+            continue
+
+        depth -= 1
+        if depth == 1 and elem.tag == row_tag:
+            yield root.tag, elem
+        if depth == 1:
+            # Libère la ligne (ou tout autre enfant direct) déjà traitée
+            root.clear()
+
+
+def iter_ral_rows(xml_file_path, row_tag=ROW_TAG, structure=None):
+    """
+    Lit les lignes une à une
+
+    Args:
+        xml_file_path (str): Chemin vers le fichier XML source
+        row_tag (str): Balise d'une ligne de données
+        structure (dict): Si fourni, complété au fil de la lecture comme scan_ral_structure
+            ('root_tag', 'row_count', 'first_row')
+
+    Yields:
+        dict: {colonne: valeur nettoyée} pour chaque ligne
+    """
+    if structure is not None:
+        structure.update({'root_tag': None, 'row_count': 0, 'first_row': []})
+    for root_tag, table in _iter_row_elements(xml_file_path, row_tag):
+        if structure is not None:
+            if structure['row_count'] == 0:
+                structure['root_tag'] = root_tag
+                structure['first_row'] = [(child.tag, child.text) for child in table]
+            structure['row_count'] += 1
+        row_data = {}
+        for child in table:
+            row_data[child.tag.strip()] = child.text.strip() if child.text else ""
+        yield row_data
+
+
+def read_ral_columns(xml_file_path, row_tag=ROW_TAG, structure=None):
+    """
+    Lit toutes les lignes dans des tampons colonne par colonne
+
+    Args:
+        xml_file_path (str): Chemin vers le fichier XML source
+        row_tag (str): Balise d'une ligne de données
+        structure (dict): Voir iter_ral_rows
+
+    Returns:
+        tuple: (dict {colonne: liste de valeurs}, nombre de lignes)
+    """
+    columns = {}
+    n_rows = 0
+    for row_data in iter_ral_rows(xml_file_path, row_tag, structure):
+        for column_name, value in row_data.items():
+            buffer = columns.get(column_name)
+            if buffer is None:
+                # Nouvelle colonne : NaN pour les lignes précédentes
+                buffer = columns[column_name] = [np.nan] * n_rows
+            buffer.append(value)
+        n_rows += 1
+        # Colonnes absentes de cette ligne
+        for buffer in columns.values():
+            if len(buffer) < n_rows:
+                buffer.append(np.nan)
+    return columns, n_rows
+
+
+def read_ral_dataframe(xml_file_path, row_tag=ROW_TAG, structure=None):
+    """
+    Lit le fichier XML en flux et retourne le DataFrame brut (une ligne par RalWebDataTable)
+
+    Args:
+        xml_file_path (str): Chemin vers le fichier XML source
+        row_tag (str): Balise d'une ligne de données
+        structure (dict): Voir iter_ral_rows
+
+    Returns:
+        pandas.DataFrame: Données brutes (chaînes), comme pd.DataFrame(liste de dicts)
+    """
+    columns, n_rows = read_ral_columns(xml_file_path, row_tag, structure)
+    return pd.DataFrame(columns, index=pd.RangeIndex(n_rows))
+
+
+def scan_ral_structure(xml_file_path, row_tag=ROW_TAG):
+    """
+    Parcourt le fichier en flux pour décrire sa structure
+
+    Args:
+        xml_file_path (str): Chemin vers le fichier XML source
+        row_tag (str): Balise d'une ligne de données
+
+    Returns:
+        dict: {'root_tag', 'row_count', 'first_row': [(balise, texte brut), ...]}
+    """
+    root_tag = None
+    row_count = 0
+    first_row = []
+    for root_tag, table in _iter_row_elements(xml_file_path, row_tag):
+        if row_count == 0:
+            first_row = [(child.tag, child.text) for child in table]
+        row_count += 1
+
+    if root_tag is None:
+        # Aucune ligne : lire seulement la balise racine
+        for _, elem in ET.iterparse(xml_file_path, events=('start',)):
+            root_tag = elem.tag
+            break
+
+    return {'root_tag': root_tag, 'row_count': row_count, 'first_row': first_row}
@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+xml_batch.py - Conversion XML → KARDEX pour toute une flotte
+Responsabilité : associer chaque export Applied Configuration à son fichier KARDEX
+(dossier ou manifeste), convertir les appareils en parallèle dans un pool de processus
+et écrire un rapport par appareil. L'échec d'un appareil n'arrête pas les autres.
+
+Exemples:
+    python xml_batch.py --xml-dir INPUT_DOCS/xml --kardex-dir Output_docs --workers 4
+    python xml_batch.py --manifest flotte.csv
+"""
+
+import os
+import re
+import io
+import csv
+import sys
+import json
+import time
+import argparse
+import contextlib
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from xml_extract_5 import xml_to_excel, xml_to_existing_kardex
+
+# MSN dans les noms de fichiers : "H160-MIS-DATA-PACK-1054-Applied Configuration.xml",
+# "10_KARDEX_H160_MSN1054_V3_6.xlsm"
+XML_MSN_PATTERN = re.compile(r'[-_ ](\d{3,6})[-_ ]Applied Configuration', re.IGNORECASE)
+KARDEX_MSN_PATTERN = re.compile(r'MSN[-_ ]?(\d{3,6})', re.IGNORECASE)
+KARDEX_EXTENSIONS = ('.xlsm', '.xlsx')
+
+REPORT_COLUMNS = ['msn', 'status', 'mode', 'rows', 'inserted', 'updated', 'unchanged',
+                  'duration_s', 'xml', 'kardex', 'output', 'error']
+
+
+def _msn_from_name(file_path, pattern):
+    match = pattern.search(os.path.basename(file_path))
+    return match.group(1) if match else None
+
+
+def discover_jobs(xml_dir, kardex_dir=None):
+    """
+    Associe les exports XML d'un dossier aux fichiers KARDEX par numéro MSN
+
+    Args:
+        xml_dir (str): Dossier des exports XML
+        kardex_dir (str): Dossier des fichiers KARDEX (défaut: xml_dir)
+
+    Returns:
+        list: [{'msn', 'xml', 'kardex'}] ; 'kardex' vaut None si aucun fichier ne correspond
+            (un nouveau fichier Excel sera créé). Si plusieurs versions existent pour un MSN,
+            la plus récemment modifiée est retenue.
+    """
+
+    kardex_dir = kardex_dir or xml_dir
+    kardex_by_msn = {}
+    for file_name in sorted(os.listdir(kardex_dir)):
+        # "~$..." : fichiers de verrouillage Excel
+        if file_name.startswith('~$') or not file_name.lower().endswith(KARDEX_EXTENSIONS):
+            continue
+        msn = _msn_from_name(file_name, KARDEX_MSN_PATTERN)
+        if msn is None:
+            continue
+        kardex_by_msn.setdefault(msn, []).append(os.path.join(kardex_dir, file_name))
+
+    jobs = []
+    for file_name in sorted(os.listdir(xml_dir)):
+        if not file_name.lower().endswith('.xml'):
+            continue
+        xml_path = os.path.join(xml_dir, file_name)
+        msn = _msn_from_name(file_name, XML_MSN_PATTERN)
+        candidates = kardex_by_msn.get(msn, []) if msn else []
+        kardex_path = max(candidates, key=os.path.getmtime) if candidates else None
+        jobs.append({'msn': msn or os.path.splitext(file_name)[0], 'xml': xml_path, 'kardex': kardex_path})
+
+    return jobs
+
+
+def read_manifest(manifest_path):
+    """
+    Lit un manifeste de paires (XML, KARDEX)
+
+    Args:
+        manifest_path (str): Fichier CSV (colonnes xml, kardex et msn optionnelle)
+            ou JSON (liste d'objets avec les mêmes clés). Les chemins relatifs
+            sont résolus par rapport au dossier du manifeste.
+
+    Returns:
+        list: [{'msn', 'xml', 'kardex'}]
+    """
+
+    if manifest_path.lower().endswith('.json'):
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+    else:
+        with open(manifest_path, 'r', encoding='utf-8-sig', newline='') as f:
+            entries = list(csv.DictReader(f))
+
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    jobs = []
+    for entry in entries:
+        xml_path = (entry.get('xml') or '').strip()
+        if not xml_path:
+            continue
+        kardex_path = (entry.get('kardex') or '').strip() or None
+        xml_path = os.path.join(base_dir, xml_path)
+        if kardex_path:
+            kardex_path = os.path.join(base_dir, kardex_path)
+        msn = (str(entry.get('msn') or '').strip()
+               or _msn_from_name(xml_path, XML_MSN_PATTERN)
+               or os.path.splitext(os.path.basename(xml_path))[0])
+        jobs.append({'msn': msn, 'xml': xml_path, 'kardex': kardex_path})
+
+    return jobs
+
+
+def convert_aircraft(job, patch_sheet_xml=True, upsert=True):
+    """
+    Convertit un appareil (exécuté dans un processus du pool). Ne lève jamais d'exception :
+    les messages de la conversion sont capturés dans le rapport.
+
+    Args:
+        job (dict): {'msn', 'xml', 'kardex'} ; sans KARDEX, un nouveau fichier Excel est créé
+        patch_sheet_xml (bool): Voir xml_to_existing_kardex
+        upsert (bool): Voir xml_to_existing_kardex
+
+    Returns:
+        dict: Rapport de l'appareil (statut, bilan, durée, journal)
+    """
+
+    report = {'msn': job['msn'], 'xml': job['xml'], 'kardex': job.get('kardex'), 'output': None,
+              'status': 'failed', 'error': None}
+    summary = {}
+    log = io.StringIO()
+    start_time = time.perf_counter()
+
+    try:
+        with contextlib.redirect_stdout(log):
+            if job.get('kardex'):
+                success = xml_to_existing_kardex(job['xml'], job['kardex'], patch_sheet_xml=patch_sheet_xml,
+                                                 upsert=upsert, summary=summary)
+                output = job['kardex'] if success else None
+            elif os.path.exists(job['xml']):
+                output = xml_to_excel(job['xml'], summary=summary)
+            else:
+                print(f"❌ Fichier XML non trouvé: {job['xml']}")
+                output = None
+        if output:
+            report.update(status='success', output=output)
+        else:
+            # Dernier message d'erreur de la conversion
+            errors = [line for line in log.getvalue().splitlines() if line.startswith('❌')]
+            report['error'] = errors[-1][1:].strip() if errors else "Erreur inconnue"
+    except Exception as e:
+        report['error'] = f"{type(e).__name__}: {e}"
+
+    report.update(summary)
+    report['duration_s'] = round(time.perf_counter() - start_time, 2)
+    report['log'] = log.getvalue()
+    return report
+
+
+def _check_targets(jobs):
+    """Rapports d'échec pour les appareils dont le fichier cible est partagé avec un autre"""
+    targets = {}
+    for job in jobs:
+        target = job.get('kardex') or f"{os.path.splitext(job['xml'])[0]}_converted.xlsx"
+        targets.setdefault(os.path.abspath(target), []).append(job)
+
+    rejected = {}
+    for target, target_jobs in targets.items():
+        if len(target_jobs) > 1:
+            for job in target_jobs:
+                rejected[id(job)] = {
+                    'msn': job['msn'], 'xml': job['xml'], 'kardex': job.get('kardex'), 'output': None,
+                    'status': 'failed', 'duration_s': 0.0, 'log': '',
+                    'error': f"Fichier cible partagé par {len(target_jobs)} appareils: {target}"
+                }
+    return rejected
+
+
+def run_batch(jobs, workers=None, report_dir=None, patch_sheet_xml=True, upsert=True):
+    """
+    Convertit tous les appareils en parallèle et écrit les rapports
+
+    Args:
+        jobs (list): [{'msn', 'xml', 'kardex'}] (discover_jobs ou read_manifest)
+        workers (int): Nombre de processus (défaut: nombre de CPU ; 1 = sans pool)
+        report_dir (str): Dossier des rapports (défaut: KARDEX_BATCH_REPORTS/batch_<horodatage>)
+        patch_sheet_xml (bool): Voir xml_to_existing_kardex
+        upsert (bool): Voir xml_to_existing_kardex
+
+    Returns:
+        list: Rapports par appareil, dans l'ordre des jobs
+    """
+
+    if report_dir is None:
+        report_dir = os.path.join("KARDEX_BATCH_REPORTS", f"batch_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+    os.makedirs(report_dir, exist_ok=True)
+
+    # Deux appareils ne doivent pas écrire dans le même fichier en même temps
+    reports = _check_targets(jobs)
+    pending = [job for job in jobs if id(job) not in reports]
+    workers = max(1, min(workers or os.cpu_count() or 1, len(pending) or 1))
+
+    print(f"🚁 Conversion de {len(jobs)} appareil(s) avec {workers} processus")
+    done = 0
+    for report in reports.values():
+        done += 1
+        _print_report_line(report, done, len(jobs))
+
+    batch_start = time.perf_counter()
+    if workers == 1:
+        for job in pending:
+            reports[id(job)] = convert_aircraft(job, patch_sheet_xml, upsert)
+            done += 1
+            _print_report_line(reports[id(job)], done, len(jobs))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(convert_aircraft, job, patch_sheet_xml, upsert): job for job in pending}
+            for future in as_completed(futures):
+                job = futures[future]
+                try:
+                    report = future.result()
+                except Exception as e:
+                    # Processus interrompu (mémoire, signal...) : seul cet appareil est en échec
+                    report = {'msn': job['msn'], 'xml': job['xml'], 'kardex': job.get('kardex'), 'output': None,
+                              'status': 'failed', 'duration_s': 0.0, 'log': '',
+                              'error': f"{type(e).__name__}: {e}"}
+                reports[id(job)] = report
+                done += 1
+                _print_report_line(report, done, len(jobs))
+
+    ordered_reports = [reports[id(job)] for job in jobs]
+    write_batch_reports(ordered_reports, report_dir)
+
+    succeeded = sum(1 for report in ordered_reports if report['status'] == 'success')
+    print(f"\n📊 {succeeded}/{len(jobs)} appareil(s) convertis en {time.perf_counter() - batch_start:.1f}s")
+    print(f"📁 Rapports: {report_dir}")
+    return ordered_reports
+
+
+def _print_report_line(report, done, total):
+    if report['status'] == 'success':
+        details = f"{report.get('rows', 0)} lignes"
+        if report.get('mode') == 'upsert':
+            details += (f", {report.get('inserted', 0)} ajoutées, {report.get('updated', 0)} modifiées, "
+                        f"{report.get('unchanged', 0)} inchangées")
+        print(f"✅ [{done}/{total}] MSN {report['msn']}: {details} ({report['duration_s']}s)")
+    else:
+        print(f"❌ [{done}/{total}] MSN {report['msn']}: {report['error']}")
+
+
+def write_batch_reports(reports, report_dir):
+    """
+    Écrit un rapport JSON par appareil (avec le journal de conversion) et un résumé CSV
+
+    Args:
+        reports (list): Rapports de convert_aircraft
+        report_dir (str): Dossier de sortie
+    """
+
+    for report in reports:
+        safe_msn = re.sub(r'[^\w.-]+', '_', str(report['msn']))
+        report_path = os.path.join(report_dir, f"MSN_{safe_msn}_report.json")
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    with open(os.path.join(report_dir, "batch_summary.csv"), 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=REPORT_COLUMNS, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(reports)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Conversion XML vers KARDEX pour plusieurs appareils")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--xml-dir', help="Dossier des exports XML Applied Configuration")
+    source.add_argument('--manifest', help="Manifeste CSV/JSON des paires (xml, kardex[, msn])")
+    parser.add_argument('--kardex-dir', help="Dossier des fichiers KARDEX (défaut: --xml-dir)")
+    parser.add_argument('--workers', type=int, help="Nombre de processus en parallèle (défaut: nombre de CPU)")
+    parser.add_argument('--report-dir', help="Dossier des rapports (défaut: KARDEX_BATCH_REPORTS/batch_<date>)")
+    parser.add_argument('--append', action='store_true', help="Ajouter toutes les lignes au lieu de synchroniser")
+    parser.add_argument('--openpyxl', action='store_true', help="Sauvegarde complète via openpyxl au lieu du patch XML de la feuille")
+
+    args = parser.parse_args()
+
+    if args.manifest:
+        if not os.path.exists(args.manifest):
+            print(f"❌ Manifeste non trouvé: {args.manifest}")
+            return
+        jobs = read_manifest(args.manifest)
+    else:
+        if not os.path.isdir(args.xml_dir):
+            print(f"❌ Dossier XML non trouvé: {args.xml_dir}")
+            return
+        jobs = discover_jobs(args.xml_dir, args.kardex_dir)
+
+    if not jobs:
+        print("⚠️  Aucun fichier XML à convertir")
+        return
+
+    print("=" * 80)
+    print("🚁 CONVERTISSEUR XML VERS KARDEX - MODE FLOTTE")
+    print("=" * 80)
+    for job in jobs:
+        print(f"   MSN {job['msn']}: {os.path.basename(job['xml'])} → "
+              f"{os.path.basename(job['kardex']) if job['kardex'] else 'nouveau fichier Excel'}")
+
+    reports = run_batch(jobs, workers=args.workers, report_dir=args.report_dir,
+                        patch_sheet_xml=not args.openpyxl, upsert=not args.append)
+
+    if any(report['status'] != 'success' for report in reports):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+xml_cache.py - Cache « sidecar » du DataFrame nettoyé d'un export XML
+Responsabilité : éviter de re-parser le XML et de refaire clean_and_format_dataframe
+(pd.to_datetime / pd.to_numeric) tant que le fichier source n'a pas changé.
+
+Le cache est un fichier à côté du XML, identifié par l'empreinte BLAKE2b du fichier :
+- Arrow IPC (.arrow), relu en mémoire mappée, si pyarrow est installé
+- sinon pickle pandas (.pkl), même contenu et mêmes dtypes
+"""
+
+import os
+import json
+import pickle
+import hashlib
+import tempfile
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+_HASH_CHUNK = 1024 * 1024
+
+
+def file_digest(path):
+    """Empreinte BLAKE2b (hex) du contenu d'un fichier, lu par blocs"""
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class CleanedXMLCache:
+    """
+    Cache du DataFrame nettoyé d'un fichier XML, stocké à côté de celui-ci.
+
+    La clé combine l'empreinte du XML et `version` (à changer quand le nettoyage change).
+    Taille et date de modification sont aussi enregistrées : si elles n'ont pas bougé,
+    le fichier n'est pas re-haché.
+    """
+
+    def __init__(self, version=1, cache_dir=None):
+        """
+        Args:
+            version (int): Version du nettoyage ; un cache d'une autre version est ignoré
+            cache_dir (str): Dossier des caches (défaut: à côté du fichier XML)
+        """
+        self.version = version
+        self.cache_dir = cache_dir
+        self.format = 'arrow' if pa is not None else 'pickle'
+
+        # Compteurs
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+
+    def path_for(self, xml_file_path):
+        """Chemin du fichier cache associé à un XML"""
+        extension = 'arrow' if self.format == 'arrow' else 'pkl'
+        directory = self.cache_dir or os.path.dirname(os.path.abspath(xml_file_path))
+        return os.path.join(directory, f"{os.path.basename(xml_file_path)}.cleaned.{extension}")
+
+    def _source_info(self, xml_file_path, digest=None):
+        st = os.stat(xml_file_path)
+        return {
+            'version': self.version,
+            'size': st.st_size,
+            'mtime_ns': st.st_mtime_ns,
+            'digest': digest
+        }
+
+    def _is_valid(self, meta, xml_file_path):
+        """Vérifie que le cache correspond au XML actuel (version puis empreinte)"""
+        if not meta or meta.get('version') != self.version:
+            return False
+        st = os.stat(xml_file_path)
+        if meta.get('size') == st.st_size and meta.get('mtime_ns') == st.st_mtime_ns:
+            return True
+        # Date modifiée (copie, checkout...) : le contenu peut être identique
+        return meta.get('size') == st.st_size and meta.get('digest') == file_digest(xml_file_path)
+
+    def get(self, xml_file_path):
+        """
+        Returns:
+            tuple: (DataFrame nettoyé, métadonnées) ou (None, None) si absent/périmé
+        """
+        path = self.path_for(xml_file_path)
+        try:
+            if self.format == 'arrow':
+                df, meta = self._read_arrow(path, xml_file_path)
+            else:
+                df, meta = self._read_pickle(path, xml_file_path)
+        except (OSError, ValueError, KeyError, pickle.UnpicklingError, EOFError):
+            df, meta = None, None
+
+        if df is None:
+            self.misses += 1
+            return None, None
+        self.hits += 1
+        return df, meta
+
+    def read_metadata(self, xml_file_path):
+        """Métadonnées d'un cache valide (ex: structure du XML) sans charger les données"""
+        path = self.path_for(xml_file_path)
+        try:
+            if self.format == 'arrow':
+                with pa.memory_map(path, 'r') as source:
+                    meta = _decode_meta(pa.ipc.open_file(source).schema.metadata)
+            else:
+                with open(path, 'rb') as f:
+                    meta = pickle.load(f)['meta']
+        except (OSError, ValueError, KeyError, pickle.UnpicklingError, EOFError):
+            return None
+        return meta if self._is_valid(meta, xml_file_path) else None
+
+    def put(self, xml_file_path, df, extra=None):
+        """
+        Enregistre le DataFrame nettoyé (écriture atomique)
+
+        Args:
+            xml_file_path (str): Fichier XML source
+            df (pandas.DataFrame): DataFrame nettoyé
+            extra (dict): Métadonnées supplémentaires sérialisables en JSON
+        """
+        meta = self._source_info(xml_file_path, file_digest(xml_file_path))
+        meta.update(extra or {})
+
+        path = self.path_for(xml_file_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        os.close(fd)
+        try:
+            if self.format == 'arrow':
+                self._write_arrow(tmp_path, df, meta)
+            else:
+                with open(tmp_path, 'wb') as f:
+                    pickle.dump({'meta': meta, 'df': df}, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.writes += 1
+        return path
+
+    def _read_pickle(self, path, xml_file_path):
+        with open(path, 'rb') as f:
+            entry = pickle.load(f)
+        if not self._is_valid(entry['meta'], xml_file_path):
+            return None, None
+        return entry['df'], entry['meta']
+
+    # --- Arrow -------------------------------------------------------------
+
+    @staticmethod
+    def _write_arrow(path, df, meta):
+        # Arrow n'a qu'une sorte de null : on note où les colonnes objet avaient NaN plutôt que pd.NA
+        nan_positions = {}
+        arrow_df = df.copy()
+        for col in df.columns:
+            series = df[col]
+            if series.dtype == object:
+                missing = series.isna()
+                is_float_nan = missing & series.map(lambda v: isinstance(v, float))
+                if is_float_nan.any():
+                    nan_positions[col] = [int(i) for i in is_float_nan.to_numpy().nonzero()[0]]
+                arrow_df[col] = series.where(~missing, None)
+        meta = dict(meta, nan_positions=nan_positions)
+
+        table = pa.Table.from_pandas(arrow_df, preserve_index=False)
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}),
+                                               b'cleaned_xml_cache': json.dumps(meta).encode('utf-8')})
+        with pa.OSFile(path, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+
+    def _read_arrow(self, path, xml_file_path):
+        with pa.memory_map(path, 'r') as source:
+            reader = pa.ipc.open_file(source)
+            meta = _decode_meta(reader.schema.metadata)
+            if not self._is_valid(meta, xml_file_path):
+                return None, None
+            df = reader.read_all().to_pandas()
+
+        # Nulls des colonnes objet : pd.NA (remplacement des chaînes vides), sauf NaN d'origine
+        for col, dtype in df.dtypes.items():
+            if dtype == object:
+                missing = df[col].isna()
+                if missing.any():
+                    df[col] = df[col].where(~missing, pd.NA)
+        for col, positions in meta.get('nan_positions', {}).items():
+            df.iloc[positions, df.columns.get_loc(col)] = float('nan')
+        return df, meta
+
+
+def _decode_meta(schema_metadata):
+    raw = (schema_metadata or {}).get(b'cleaned_xml_cache')
+    if raw is None:
+        raise ValueError("métadonnées de cache absentes")
+    return json.loads(raw.decode('utf-8'))
@@ -1,11 +1,36 @@
 # /Users/sebastienbatty/Documents/1_Wingleet/2_DEV/THC/scripts/xml_extraction/xml_extract_5.py
 
 import xml.etree.ElementTree as ET
+import numpy as np
 import pandas as pd
 from datetime import datetime
 import os
+import sys
 
-def xml_to_excel(xml_file_path, excel_file_path=None, append_to_existing=False):
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from ral_xml_reader import read_ral_dataframe, scan_ral_structure
+from xml_cache import CleanedXMLCache
+from openpyxl.utils import get_column_letter
+from kardex_writer import (KARDEX_SHEET_NAME, KARDEX_FIRST_DATA_ROW, SheetXMLPatcher, dataframe_to_rows,
+                           dataframe_column_widths, find_last_data_row, plan_upsert, write_rows_block,
+                           write_dataframes_write_only)
+
+# Version du nettoyage : à incrémenter si clean_and_format_dataframe change (invalide les caches)
+CLEANED_CACHE_VERSION = 1
+
+# Clé d'une ligne KARDEX pour la synchronisation (upsert)
+KARDEX_KEY_COLUMNS = ['P_N', 'S_N', 'Kardex No']
+
+# Colonnes complétées à la main dans le Kardex : jamais écrasées par une synchronisation
+KARDEX_MANUAL_COLUMNS = [
+    'Analyse', 'F.I.N Code', 'Access', 'Item Consumed (at installation) Overhaul',
+    'Item Consumed (at installation) Maintenance', 'Item Consumed (at installation) Inspection',
+    'Monitoring', 'JAA/EASA Certificate', 'Item Monitoring : New (at installation) Task N',
+    'Item Monitoring : New (at installation) Authorized'
+]
+
+def xml_to_excel(xml_file_path, excel_file_path=None, append_to_existing=False, patch_sheet_xml=False,
+                 upsert=False, use_cache=True, summary=None):
     """
     Convertit un fichier XML avec structure RalWebDataTable en fichier Excel
     
@@ -13,6 +38,12 @@ def xml_to_excel(xml_file_path, excel_file_path=None, append_to_existing=False):
         xml_file_path (str): Chemin vers le fichier XML source
         excel_file_path (str): Chemin de sortie pour le fichier Excel (optionnel)
         append_to_existing (bool): Si True, ajoute aux données existantes
+        patch_sheet_xml (bool): En mode ajout, modifie seulement le XML de la feuille KARDEX
+        upsert (bool): En mode ajout, synchronise par clé (P_N, S_N, Kardex No) au lieu
+            d'ajouter toutes les lignes
+        use_cache (bool): Réutiliser le cache des données nettoyées si le XML n'a pas changé
+        summary (dict): Si fourni, complété avec le mode ('create', 'append' ou 'upsert'),
+            le nombre de lignes lues et le bilan de la synchronisation
     
     Returns:
         str: Chemin du fichier Excel créé/modifié
@@ -24,49 +55,43 @@ def xml_to_excel(xml_file_path, excel_file_path=None, append_to_existing=False):
         excel_file_path = f"{base_name}_converted.xlsx"
     
     try:
-        # Parser le fichier XML
-        tree = ET.parse(xml_file_path)
-        root = tree.getroot()
-        
-        # Liste pour stocker toutes les données
-        data_list = []
-        
-        # Parcourir tous les éléments RalWebDataTable
-        for table in root.findall('RalWebDataTable'):
-            # Dictionnaire pour une ligne de données
-            row_data = {}
-            
-            # Extraire toutes les données de chaque élément
-            for child in table:
-                # Nettoyer le nom de la colonne et la valeur
-                column_name = child.tag.strip()
-                value = child.text.strip() if child.text else ""
-                row_data[column_name] = value
-            
-            data_list.append(row_data)
-        
-        # Créer un DataFrame pandas
-        df = pd.DataFrame(data_list)
-        
-        # Nettoyer et formater les données
-        df = clean_and_format_dataframe(df)
+        # Lire et nettoyer le fichier XML (ou recharger le cache si le fichier n'a pas changé)
+        df = load_cleaned_dataframe(xml_file_path, use_cache=use_cache)
         
         # Transformer vers le format personnalisé
         transformed_df = transform_to_custom_format(df)
+        if summary is not None:
+            summary['rows'] = len(transformed_df)
         
         # Gestion du fichier Excel selon le mode
-        if append_to_existing and os.path.exists(excel_file_path):
+        upsert_summary = None
+        if append_to_existing and os.path.exists(excel_file_path) and upsert:
+            # Mode synchronisation : seulement les lignes nouvelles ou modifiées
+            upsert_summary = upsert_existing_excel(transformed_df, excel_file_path, patch_sheet_xml=patch_sheet_xml)
+            if upsert_summary is None:
+                return None
+            mode = 'upsert'
+        elif append_to_existing and os.path.exists(excel_file_path):
             # Mode ajout : ajouter aux données existantes
-            result = append_to_existing_excel(transformed_df, excel_file_path)
+            result = append_to_existing_excel(transformed_df, excel_file_path, patch_sheet_xml=patch_sheet_xml)
             if not result:
                 return None
+            mode = 'append'
         else:
             # Mode création : créer un nouveau fichier
             create_new_excel_file(transformed_df, df, excel_file_path)
+            mode = 'create'
+        
+        if summary is not None:
+            summary['mode'] = mode
+            summary.update(upsert_summary or {})
         
         print(f"✅ Conversion réussie!")
         print(f"📁 Fichier Excel: {excel_file_path}")
-        if append_to_existing:
+        if upsert_summary is not None:
+            print(f"📊 Synchronisation: {upsert_summary['inserted']} ajoutées, "
+                  f"{upsert_summary['updated']} modifiées, {upsert_summary['unchanged']} inchangées")
+        elif append_to_existing:
             print(f"📊 Nouvelles lignes ajoutées: {len(transformed_df)}")
         else:
             print(f"📊 Feuille 'Aircraft_Data_Custom': {len(transformed_df)} lignes, {len(transformed_df.columns)} colonnes")
@@ -81,6 +106,42 @@ def xml_to_excel(xml_file_path, excel_file_path=None, append_to_existing=False):
         print(f"❌ Erreur générale: {e}")
         return None
 
+def load_cleaned_dataframe(xml_file_path, use_cache=True):
+    """
+    Lit le XML en flux puis le nettoie, en passant par le cache placé à côté du fichier
+    (clé = empreinte du XML) pour ne pas refaire ce travail tant que le fichier n'a pas changé
+    
+    Args:
+        xml_file_path (str): Chemin vers le fichier XML source
+        use_cache (bool): Lire/écrire le cache des données nettoyées
+    
+    Returns:
+        pandas.DataFrame: DataFrame nettoyé (clean_and_format_dataframe)
+    """
+    
+    cache = CleanedXMLCache(version=CLEANED_CACHE_VERSION) if use_cache else None
+    if cache is not None:
+        df, _ = cache.get(xml_file_path)
+        if df is not None:
+            print(f"⚡ Données nettoyées chargées depuis le cache: {cache.path_for(xml_file_path)}")
+            return df
+    
+    # Lire le fichier XML en flux (iterparse) directement dans un DataFrame
+    structure = {}
+    df = read_ral_dataframe(xml_file_path, structure=structure)
+    
+    # Nettoyer et formater les données
+    df = clean_and_format_dataframe(df)
+    
+    if cache is not None:
+        try:
+            cache_path = cache.put(xml_file_path, df, extra={'structure': structure})
+            print(f"💾 Cache des données nettoyées ({cache.format}): {cache_path}")
+        except Exception as e:
+            print(f"⚠️  Cache des données nettoyées non écrit: {e}")
+    
+    return df
+
 def clean_and_format_dataframe(df):
     """
     Nettoie et formate le DataFrame
@@ -117,10 +178,52 @@ def clean_and_format_dataframe(df):
     
     return df
 
+def _source_column(df, column_name, default='', rows_as_dates=None):
+    """
+    Colonne source alignée sur un index 0..n-1 (valeur par défaut si la colonne est absente),
+    équivalent vectorisé de row.get(column_name, default)
+    """
+    if column_name not in df.columns:
+        return pd.Series([default] * len(df), dtype=object)
+
+    values = df[column_name].reset_index(drop=True)
+    if rows_as_dates is not None and rows_as_dates.any() and values.dtype.kind != 'M':
+        values = values.astype(object)
+        values[rows_as_dates] = pd.NaT
+    return values
+
+def _rows_read_as_dates(df):
+    """
+    Lignes qu'un parcours df.iterrows() convertit en datetime64 : celles dont toutes les
+    valeurs hors colonnes de dates sont manquantes (ex: RalWebDataTable vide).
+    Leurs valeurs manquantes y deviennent NaT au lieu de NaN ; on reproduit ce comportement.
+    """
+    date_columns = [col for col in df.columns if df[col].dtype.kind == 'M']
+    other_columns = [col for col in df.columns if col not in date_columns]
+    if not date_columns:
+        return np.zeros(len(df), dtype=bool)
+
+    candidates = df[other_columns].isna().all(axis=1).to_numpy()
+    rows_as_dates = np.zeros(len(df), dtype=bool)
+    if candidates.any():
+        # Peu de lignes concernées : même construction de Series que iterrows
+        positions = np.flatnonzero(candidates)
+        values = df.iloc[positions].to_numpy()
+        for i, row_values in zip(positions, values):
+            rows_as_dates[i] = pd.Series(row_values, index=df.columns).dtype.kind == 'M'
+    return rows_as_dates
+
+def _non_empty_mask(values):
+    """Valeurs non nulles dont la représentation texte n'est pas vide"""
+    return values.notna() & (values.astype(str).str.strip() != '')
+
 def transform_to_custom_format(df):
     """
     Transforme le DataFrame selon le format demandé avec les nouvelles colonnes
     
+    Toutes les règles sont appliquées colonne par colonne (sélections masquées et
+    opérations texte vectorisées) ; le résultat est identique à l'ancien parcours ligne à ligne.
+    
     Args:
         df (pandas.DataFrame): DataFrame source avec les données XML
     
@@ -128,106 +231,81 @@ def transform_to_custom_format(df):
         pandas.DataFrame: DataFrame transformé avec les nouvelles colonnes
     """
     
-    # Créer un nouveau DataFrame avec les colonnes demandées
-    transformed_data = []
-    
-    for _, row in df.iterrows():
-        # Extraire Location et ATAChapter
-        location = str(row.get('Location', '')) if pd.notna(row.get('Location')) else ''
-        ata_chapter_xml = row.get('ATAChapter', '')
-        model_tree_level_raw = row.get('ModelTreeLevel', 0)
-
-        # Nettoyer ModelTreeLevel pour éviter les erreurs NaT/NaN
-        model_tree_level = 0
-        if pd.notna(model_tree_level_raw):
-            try:
-                model_tree_level = int(float(model_tree_level_raw))
-            except (ValueError, TypeError):
-                model_tree_level = 0
-
-        # Calculer Assembly Level selon les règles
-        assembly_level = ''
-        if model_tree_level > 0 : 
-            print(f"ModelTreeLevel : {model_tree_level}")
-            if model_tree_level == 1:
-                assembly_level = 1
-            elif model_tree_level == 2:
-                assembly_level = 11
-            elif model_tree_level >= 3:
-                assembly_level = 111
-        
-        # Calculer Kardex No basé sur Location + "00"
-        kardex_no = ''
-        if location.endswith('-00'):
-            # Si Location se termine par "-00", garder tel quel
-            kardex_no = location
-        else: 
-            # Sinon, ajouter "00" à la fin
-            kardex_no = f"{location}00"
-
-        
-        
-        # Calculer ATA : utiliser ATAChapter si disponible, sinon extraire de Location
-        ata_value = ''
-        if pd.notna(ata_chapter_xml) and str(ata_chapter_xml).strip() != '':
-            # ATAChapter est disponible
-            ata_chapter = str(int(float(ata_chapter_xml))) if ata_chapter_xml != '' else ''
-            ata_value = f"{ata_chapter}-00" if ata_chapter else ''
-        elif location:
-            # ATAChapter est vide, extraire de Location
-            # Exemple: "32-30-02" → "32"
-            ata_from_location = location.split('-')[0] if '-' in location else location
-            ata_value = ata_from_location
-        
-        # Extraire TSN et CSN Part (données à l'installation)
-        tsn_part = row.get('ComponentAgeingatInstallationinHours', '')
-        csn_part = row.get('ComponentAgeingatInstallationinCycles', '')
-        
-        # Calculer "Item Consumed (at installation) NEW"
-        item_consumed_new = ''
-        if pd.notna(tsn_part) and str(tsn_part).strip() != '' and str(tsn_part) != '0:00':
-            if pd.notna(csn_part) and str(csn_part).strip() != '' and str(csn_part) != '0.00':
-                item_consumed_new = f"{tsn_part} FH & {csn_part} FC"
-            else:
-                item_consumed_new = f"{tsn_part} FH"
-        elif pd.notna(csn_part) and str(csn_part).strip() != '' and str(csn_part) != '0.00':
-            item_consumed_new = f"{csn_part} FC"
-        
-        # Extraire les autres données importantes
-        installation_date = row.get('FirstInstallationDate', '')
-        tsn_ac = row.get('HigherAssemblyAgeingAtFitInHours', '')
-        csn_ac = row.get('HigherAssemblyAgeingAtFitInCycles', '')
-        
-        # Construire la nouvelle ligne avec toutes les colonnes dans l'ordre
-        new_row = {
-            'Analyse': '',  # Colonne A
-            'Assembly level': assembly_level,  # Colonne B
-            'ATA': ata_value,  # Colonne C
-            'Kardex No': kardex_no,  # Colonne D
-            'Kardex designation / Function' : row.get('InstalledPartDescription', ''),  # Colonne E
-            'Designation': row.get('InstalledPartDescription', ''),  # Colonne F
-            'F.I.N Code' : '', # Trouver dans ....... Colonne G
-            'Zone' : row.get('Position', ''), # Colonne H
-            'Access' : '', # Trouver dans ....... Colonne I
-            'P_N': row.get('InstalledManufacturerPartNumber', ''),  # Colonne J
-            'S_N': row.get('InstalledSerialNumber', ''),  # Colonne K
-            'Installation_Date_AC': installation_date,  # Colonne L
-            'TSN_AC': tsn_ac,  # Colonne M
-            'CSN_AC': csn_ac,  # Colonne N
-            'Item Consumed (at installation) NEW': item_consumed_new,  # Colonne O
-            'Item Consumed (at installation) Overhaul': '',  # Colonne P
-            'Item Consumed (at installation) Maintenance': '',  # Colonne Q
-            'Item Consumed (at installation) Inspection': '',  # Colonne R
-            'Monitoring': '',  # Trouver dans document Maintenance Status Colonne S
-            'JAA/EASA Certificate': '',  # Colonne T
-            'Item Monitoring : New (at installation) Task N': '',  # Colonne U
-            'Item Monitoring : New (at installation) Authorized': ''  # Colonne V
-        }
-        
-        transformed_data.append(new_row)
-    
-    # Créer le nouveau DataFrame
-    transformed_df = pd.DataFrame(transformed_data)
+    n_rows = len(df)
+    if n_rows == 0:
+        # Aucune ligne : même résultat que pd.DataFrame([])
+        return pd.DataFrame()
+    
+    # Location en texte ('' si absente)
+    location_raw = _source_column(df, 'Location')
+    location = location_raw.astype(str).where(location_raw.notna(), '').astype(object)
+    
+    # Nettoyer ModelTreeLevel pour éviter les erreurs NaT/NaN (int(float(x)), 0 si invalide)
+    model_tree_level = pd.to_numeric(_source_column(df, 'ModelTreeLevel', 0), errors='coerce')
+    model_tree_level = np.trunc(model_tree_level.fillna(0).to_numpy(dtype=np.float64))
+    
+    # Calculer Assembly Level selon les règles : 1 → 1, 2 → 11, ≥ 3 → 111
+    assembly_level = np.full(n_rows, '', dtype=object)
+    assembly_level[model_tree_level == 1] = 1
+    assembly_level[model_tree_level == 2] = 11
+    assembly_level[model_tree_level >= 3] = 111
+    
+    # Calculer Kardex No basé sur Location + "00" (tel quel si Location se termine par "-00")
+    kardex_no = location.where(location.str.endswith('-00'), location + '00')
+    
+    # Calculer ATA : utiliser ATAChapter si disponible, sinon extraire de Location
+    # Exemple: "32-30-02" → "32"
+    ata_chapter_xml = _source_column(df, 'ATAChapter')
+    has_ata_chapter = _non_empty_mask(ata_chapter_xml)
+    ata_value = location.str.split('-', n=1).str[0].astype(object)
+    if has_ata_chapter.any():
+        ata_chapter = pd.to_numeric(ata_chapter_xml[has_ata_chapter]).to_numpy(dtype=np.float64)
+        ata_value[has_ata_chapter] = np.trunc(ata_chapter).astype(np.int64).astype(str).astype(object) + '-00'
+    
+    # Calculer "Item Consumed (at installation) NEW" à partir des TSN et CSN Part
+    tsn_part = _source_column(df, 'ComponentAgeingatInstallationinHours')
+    csn_part = _source_column(df, 'ComponentAgeingatInstallationinCycles')
+    tsn_text = tsn_part.astype(str).astype(object)
+    csn_text = csn_part.astype(str).astype(object)
+    has_tsn = _non_empty_mask(tsn_part) & (tsn_text != '0:00')
+    has_csn = _non_empty_mask(csn_part) & (csn_text != '0.00')
+    item_consumed_new = pd.Series(np.select(
+        [has_tsn & has_csn, has_tsn, has_csn],
+        [tsn_text + ' FH & ' + csn_text + ' FC', tsn_text + ' FH', csn_text + ' FC'],
+        default=''
+    ), dtype=object)
+    
+    empty = np.full(n_rows, '', dtype=object)
+    rows_as_dates = _rows_read_as_dates(df)
+    
+    # Construire le nouveau DataFrame avec toutes les colonnes dans l'ordre
+    transformed_df = pd.DataFrame({
+        'Analyse': empty,  # Colonne A
+        'Assembly level': assembly_level,  # Colonne B
+        'ATA': ata_value,  # Colonne C
+        'Kardex No': kardex_no,  # Colonne D
+        'Kardex designation / Function' : _source_column(df, 'InstalledPartDescription', rows_as_dates=rows_as_dates),  # Colonne E
+        'Designation': _source_column(df, 'InstalledPartDescription', rows_as_dates=rows_as_dates),  # Colonne F
+        'F.I.N Code' : empty, # Trouver dans ....... Colonne G
+        'Zone' : _source_column(df, 'Position', rows_as_dates=rows_as_dates), # Colonne H
+        'Access' : empty, # Trouver dans ....... Colonne I
+        'P_N': _source_column(df, 'InstalledManufacturerPartNumber', rows_as_dates=rows_as_dates),  # Colonne J
+        'S_N': _source_column(df, 'InstalledSerialNumber', rows_as_dates=rows_as_dates),  # Colonne K
+        'Installation_Date_AC': _source_column(df, 'FirstInstallationDate', rows_as_dates=rows_as_dates),  # Colonne L
+        'TSN_AC': _source_column(df, 'HigherAssemblyAgeingAtFitInHours', rows_as_dates=rows_as_dates),  # Colonne M
+        'CSN_AC': _source_column(df, 'HigherAssemblyAgeingAtFitInCycles', rows_as_dates=rows_as_dates),  # Colonne N
+        'Item Consumed (at installation) NEW': item_consumed_new,  # Colonne O
+        'Item Consumed (at installation) Overhaul': empty,  # Colonne P
+        'Item Consumed (at installation) Maintenance': empty,  # Colonne Q
+        'Item Consumed (at installation) Inspection': empty,  # Colonne R
+        'Monitoring': empty,  # Trouver dans document Maintenance Status Colonne S
+        'JAA/EASA Certificate': empty,  # Colonne T
+        'Item Monitoring : New (at installation) Task N': empty,  # Colonne U
+        'Item Monitoring : New (at installation) Authorized': empty  # Colonne V
+    })
+    
+    # Mêmes types de colonnes qu'un DataFrame construit ligne par ligne (ex: Assembly level entièrement numérique)
+    transformed_df = transformed_df.infer_objects()
     
     # Nettoyer les valeurs vides mais garder les chaînes vides pour les colonnes vides volontaires
     for col in transformed_df.columns:
@@ -243,55 +321,75 @@ def transform_to_custom_format(df):
     
     return transformed_df
 
-def append_to_existing_excel(new_data_df, excel_file_path):
+def _open_kardex_sheet(excel_file_path):
+    """
+    Charge le classeur (macros conservées) et retourne (workbook, feuille KARDEX ou première feuille)
+    """
+    from openpyxl import load_workbook
+    
+    # Charger le workbook existant
+    workbook = load_workbook(excel_file_path, keep_vba=True)  # keep_vba=True pour les fichiers .xlsm
+    
+    # Chercher la feuille "KARDEX"
+    target_sheet_name = KARDEX_SHEET_NAME
+    if target_sheet_name in workbook.sheetnames:
+        worksheet = workbook[target_sheet_name]
+        print(f"📄 Feuille trouvée: {target_sheet_name}")
+    else:
+        print(f"⚠️  Feuille '{target_sheet_name}' non trouvée!")
+        print(f"📋 Feuilles disponibles: {workbook.sheetnames}")
+        # Utiliser la première feuille comme fallback
+        sheet_name = workbook.sheetnames[0]
+        worksheet = workbook[sheet_name]
+        print(f"📄 Utilisation de la feuille par défaut: {sheet_name}")
+    
+    return workbook, worksheet
+
+def _print_append_preview(new_data_df):
+    """Affiche un aperçu des premières lignes à ajouter"""
+    print(f"\n🔍 Aperçu des données à ajouter:")
+    for i, (_, row) in enumerate(new_data_df.head(3).iterrows()):
+        print(f"  Ligne {i+1}:")
+        print(f"    ATA: {row.get('ATA', 'N/A')}")
+        print(f"    Kardex No: {row.get('Kardex No', 'N/A')}")
+        print(f"    Designation: {row.get('Designation', 'N/A')}")
+        print(f"    P_N: {row.get('P_N', 'N/A')}")
+        print(f"    S_N: {row.get('S_N', 'N/A')}")
+        print(f"    Installation_Date_AC: {row.get('Installation_Date_AC', 'N/A')}")
+    
+    print(f"\n📊 Nombre total de colonnes à ajouter: {len(new_data_df.columns)}")
+    print(f"📋 Colonnes: {list(new_data_df.columns)}")
+
+def append_to_existing_excel(new_data_df, excel_file_path, patch_sheet_xml=False):
     """
     Ajoute de nouvelles données à un fichier Excel existant
     
     Args:
         new_data_df (pandas.DataFrame): Nouvelles données à ajouter
         excel_file_path (str): Chemin vers le fichier Excel existant
+        patch_sheet_xml (bool): Si True, réécrit seulement le XML de la feuille KARDEX dans
+            l'archive (VBA et autres feuilles intacts) au lieu de recharger/sauver le classeur
     
     Returns:
         bool: True si succès, False sinon
     """
     
     try:
-        from openpyxl import load_workbook
-        
         print(f"📖 Lecture du fichier existant: {excel_file_path}")
         
-        # Charger le workbook existant
-        workbook = load_workbook(excel_file_path, keep_vba=True)  # keep_vba=True pour les fichiers .xlsm
+        # Conversion en bloc des valeurs (NaN → None, Timestamp → date)
+        rows = dataframe_to_rows(new_data_df)
         
-        # Chercher la feuille "KARDEX"
-        target_sheet_name = "KARDEX"
-        if target_sheet_name in workbook.sheetnames:
-            worksheet = workbook[target_sheet_name]
-            print(f"📄 Feuille trouvée: {target_sheet_name}")
+        if patch_sheet_xml:
+            # Mode patch : seule la feuille KARDEX est réécrite dans l'archive
+            patcher = SheetXMLPatcher(excel_file_path, KARDEX_SHEET_NAME)
+            print(f"📄 Feuille trouvée: {patcher.sheet_name} ({patcher.sheet_part})")
+            last_row = patcher.last_data_row()
         else:
-            print(f"⚠️  Feuille '{target_sheet_name}' non trouvée!")
-            print(f"📋 Feuilles disponibles: {workbook.sheetnames}")
-            # Utiliser la première feuille comme fallback
-            sheet_name = workbook.sheetnames[0]
-            worksheet = workbook[sheet_name]
-            print(f"📄 Utilisation de la feuille par défaut: {sheet_name}")
-        
-        # Trouver la dernière ligne avec des données
-        last_row = worksheet.max_row
-        
-        # Vérifier s'il y a des données existantes (en ignorant l'en-tête)
-        while last_row > 1:
-            # Vérifier si la ligne contient des données (au moins une cellule non vide)
-            has_data = False
-            for col in range(1, worksheet.max_column + 1):
-                cell_value = worksheet.cell(row=last_row, column=col).value
-                if cell_value is not None and str(cell_value).strip() != '':
-                    has_data = True
-                    break
+            workbook, worksheet = _open_kardex_sheet(excel_file_path)
             
-            if has_data:
-                break
-            last_row -= 1
+            # Trouver la dernière ligne avec des données (index des cellules, pas de balayage)
+            last_row = find_last_data_row(worksheet)
         
         print(f"📍 Dernière ligne avec données: {last_row}")
         
@@ -301,34 +399,16 @@ def append_to_existing_excel(new_data_df, excel_file_path):
         print(f"📝 Ajout des nouvelles données à partir de la ligne: {start_row}")
         
         # Debug: Afficher les premières lignes de données à ajouter
-        print(f"\n🔍 Aperçu des données à ajouter:")
-        for i, (_, row) in enumerate(new_data_df.head(3).iterrows()):
-            print(f"  Ligne {i+1}:")
-            print(f"    ATA: {row.get('ATA', 'N/A')}")
-            print(f"    Kardex No: {row.get('Kardex No', 'N/A')}")
-            print(f"    Designation: {row.get('Designation', 'N/A')}")
-            print(f"    P_N: {row.get('P_N', 'N/A')}")
-            print(f"    S_N: {row.get('S_N', 'N/A')}")
-            print(f"    Installation_Date_AC: {row.get('Installation_Date_AC', 'N/A')}")
-        
-        print(f"\n📊 Nombre total de colonnes à ajouter: {len(new_data_df.columns)}")
-        print(f"📋 Colonnes: {list(new_data_df.columns)}")
-        
-        # Ajouter les nouvelles données ligne par ligne
-        for idx, (_, row) in enumerate(new_data_df.iterrows(), start=start_row):
-            for col_idx, value in enumerate(row.values, start=1):
-                # Convertir les valeurs pandas NaN en None pour Excel
-                if pd.isna(value):
-                    value = None
-                elif isinstance(value, pd.Timestamp):
-                    # Convertir les dates pandas en dates Python
-                    value = value.to_pydatetime().date()
-                
-                worksheet.cell(row=idx, column=col_idx, value=value)
-        
-        # Sauvegarder le fichier
-        workbook.save(excel_file_path)
-        workbook.close()
+        _print_append_preview(new_data_df)
+        
+        # Ajouter les nouvelles données en un bloc puis sauvegarder
+        if patch_sheet_xml:
+            patcher.append_rows(rows, start_row)
+            patcher.save()
+        else:
+            write_rows_block(worksheet, rows, start_row)
+            workbook.save(excel_file_path)
+            workbook.close()
         
         print(f"✅ {len(new_data_df)} nouvelles lignes ajoutées avec succès!")
         
@@ -338,7 +418,85 @@ def append_to_existing_excel(new_data_df, excel_file_path):
         print(f"❌ Erreur lors de l'ajout aux données existantes: {e}")
         return False
 
-def create_new_excel_file(transformed_df, original_df, excel_file_path):
+def upsert_existing_excel(new_data_df, excel_file_path, patch_sheet_xml=False):
+    """
+    Synchronise les données avec la feuille KARDEX existante, ligne par ligne, selon
+    la clé (P_N, S_N, Kardex No) : nouvelles lignes ajoutées à la fin, lignes existantes
+    modifiées seulement sur les cellules qui ont changé, le reste laissé intact.
+    Les colonnes renseignées à la main (KARDEX_MANUAL_COLUMNS) ne sont jamais écrasées.
+    
+    Args:
+        new_data_df (pandas.DataFrame): Données transformées (transform_to_custom_format)
+        excel_file_path (str): Chemin vers le fichier Excel existant
+        patch_sheet_xml (bool): Si True, réécrit seulement le XML de la feuille KARDEX
+    
+    Returns:
+        dict: {'inserted', 'updated', 'unchanged'} ou None en cas d'erreur
+    """
+    
+    try:
+        print(f"📖 Lecture du fichier existant: {excel_file_path}")
+        
+        rows = dataframe_to_rows(new_data_df)
+        columns = list(new_data_df.columns)
+        key_columns = [columns.index(col) for col in KARDEX_KEY_COLUMNS]
+        update_columns = [i for i, col in enumerate(columns) if col not in KARDEX_MANUAL_COLUMNS]
+        
+        # Lignes existantes sur les colonnes gérées par l'export
+        if patch_sheet_xml:
+            patcher = SheetXMLPatcher(excel_file_path, KARDEX_SHEET_NAME)
+            print(f"📄 Feuille trouvée: {patcher.sheet_name} ({patcher.sheet_part})")
+            last_row = patcher.last_data_row()
+            existing_rows = patcher.read_rows(KARDEX_FIRST_DATA_ROW, last_row, len(columns))
+        else:
+            workbook, worksheet = _open_kardex_sheet(excel_file_path)
+            last_row = find_last_data_row(worksheet)
+            existing_rows = {}
+            if last_row >= KARDEX_FIRST_DATA_ROW:
+                existing_rows = dict(enumerate(
+                    worksheet.iter_rows(min_row=KARDEX_FIRST_DATA_ROW, max_row=last_row,
+                                        max_col=len(columns), values_only=True),
+                    start=KARDEX_FIRST_DATA_ROW
+                ))
+        
+        print(f"📍 Dernière ligne avec données: {last_row} ({len(existing_rows)} lignes indexées)")
+        
+        plan = plan_upsert(existing_rows, rows, key_columns, update_columns)
+        summary = {k: plan[k] for k in ('inserted', 'updated', 'unchanged')}
+        
+        print(f"🔑 Clé de synchronisation: {', '.join(KARDEX_KEY_COLUMNS)}")
+        print(f"   ➕ Nouvelles lignes: {summary['inserted']}")
+        print(f"   ✏️  Lignes modifiées: {summary['updated']} "
+              f"({sum(len(c) for c in plan['updates'].values())} cellules)")
+        print(f"   ✅ Lignes inchangées: {summary['unchanged']}")
+        
+        if not plan['inserts'] and not plan['updates']:
+            print("💤 Aucune modification: fichier non réécrit")
+            return summary
+        
+        start_row = last_row + 1
+        if patch_sheet_xml:
+            for row_num, changes in plan['updates'].items():
+                patcher.set_row_values(row_num, changes)
+            if plan['inserts']:
+                patcher.append_rows(plan['inserts'], start_row)
+            patcher.save()
+        else:
+            for row_num, changes in plan['updates'].items():
+                for col_idx, value in changes.items():
+                    # cell(..., value=None) ne vide pas la cellule : affectation explicite
+                    worksheet.cell(row=row_num, column=col_idx).value = value
+            write_rows_block(worksheet, plan['inserts'], start_row)
+            workbook.save(excel_file_path)
+            workbook.close()
+        
+        return summary
+        
+    except Exception as e:
+        print(f"❌ Erreur lors de la synchronisation avec les données existantes: {e}")
+        return None
+
+def create_new_excel_file(transformed_df, original_df, excel_file_path, width_sample_size=None, write_only=True):
     """
     Crée un nouveau fichier Excel avec les données transformées
     
@@ -346,48 +504,49 @@ def create_new_excel_file(transformed_df, original_df, excel_file_path):
         transformed_df (pandas.DataFrame): Données transformées
         original_df (pandas.DataFrame): Données originales
         excel_file_path (str): Chemin de sortie
+        width_sample_size (int): Lignes échantillonnées pour la largeur des colonnes (None = toutes)
+        write_only (bool): Écriture en flux (classeur openpyxl write_only) au lieu de pd.ExcelWriter
     """
     
+    sheets = {
+        'Aircraft_Data_Custom': transformed_df,  # Feuille avec les données transformées (format demandé)
+        'Aircraft_Data_Original': original_df  # Feuille avec les données originales (pour référence)
+    }
+    
+    # Largeur des colonnes calculée sur les DataFrames (maximum raisonnable de 50)
+    widths = {sheet_name: dataframe_column_widths(sheet_df, max_width=50, sample_size=width_sample_size)
+              for sheet_name, sheet_df in sheets.items()}
+    
+    if write_only:
+        write_dataframes_write_only(excel_file_path, sheets, widths)
+        return
+    
     with pd.ExcelWriter(excel_file_path, engine='openpyxl') as writer:
-        # Feuille avec les données transformées (format demandé)
-        transformed_df.to_excel(writer, sheet_name='Aircraft_Data_Custom', index=False)
-        
-        # Feuille avec les données originales (pour référence)
-        original_df.to_excel(writer, sheet_name='Aircraft_Data_Original', index=False)
-        
-        # Obtenir les feuilles de calcul pour le formatage
-        for sheet_name in writer.sheets:
-            worksheet = writer.sheets[sheet_name]
+        for sheet_name, sheet_df in sheets.items():
+            sheet_df.to_excel(writer, sheet_name=sheet_name, index=False)
             
-            # Ajuster la largeur des colonnes
-            for column in worksheet.columns:
-                max_length = 0
-                column_letter = column[0].column_letter
-                
-                for cell in column:
-                    try:
-                        if len(str(cell.value)) > max_length:
-                            max_length = len(str(cell.value))
-                    except:
-                        pass
-                
-                # Définir une largeur maximale raisonnable
-                adjusted_width = min(max_length + 2, 50)
-                worksheet.column_dimensions[column_letter].width = adjusted_width
+            worksheet = writer.sheets[sheet_name]
+            for col_idx, width in enumerate(widths[sheet_name], start=1):
+                worksheet.column_dimensions[get_column_letter(col_idx)].width = width
 
-def xml_to_existing_kardex(xml_file_path, kardex_file_path):
+def xml_to_existing_kardex(xml_file_path, kardex_file_path, patch_sheet_xml=False, upsert=False, summary=None):
     """
     Fonction spécialisée pour ajouter des données XML au fichier Kardex existant
     
     Args:
         xml_file_path (str): Chemin vers le fichier XML
         kardex_file_path (str): Chemin vers le fichier Kardex (.xlsm)
+        patch_sheet_xml (bool): Réécrire seulement la feuille KARDEX dans l'archive .xlsm
+            (False par défaut = rechargement et sauvegarde complète via openpyxl)
+        upsert (bool): Synchroniser par clé (P_N, S_N, Kardex No) : seules les lignes nouvelles
+            ou modifiées sont écrites (False par défaut = ajout de toutes les lignes)
+        summary (dict): Voir xml_to_excel
     
     Returns:
         bool: True si succès, False sinon
     """
     
-    print(f"🎯 Mode Kardex: Ajout au fichier existant")
+    print(f"🎯 Mode Kardex: {'Synchronisation avec' if upsert else 'Ajout au'} fichier existant")
     print(f"📁 XML source: {xml_file_path}")
     print(f"📁 Kardex cible: {kardex_file_path}")
     
@@ -401,7 +560,8 @@ def xml_to_existing_kardex(xml_file_path, kardex_file_path):
         return False
     
     # Utiliser la fonction principale avec l'option append
-    result = xml_to_excel(xml_file_path, kardex_file_path, append_to_existing=True)
+    result = xml_to_excel(xml_file_path, kardex_file_path, append_to_existing=True,
+                          patch_sheet_xml=patch_sheet_xml, upsert=upsert, summary=summary)
     
     return result is not None
 
@@ -414,24 +574,27 @@ def analyze_xml_structure(xml_file_path):
     """
     
     try:
-        tree = ET.parse(xml_file_path)
-        root = tree.getroot()
+        # Structure enregistrée avec le cache des données nettoyées, sinon lecture en flux
+        cache_meta = CleanedXMLCache(version=CLEANED_CACHE_VERSION).read_metadata(xml_file_path)
+        if cache_meta and cache_meta.get('structure'):
+            structure = cache_meta['structure']
+        else:
+            structure = scan_ral_structure(xml_file_path)
         
         print("🔍 Analyse de la structure XML:")
-        print(f"Élément racine: {root.tag}")
+        print(f"Élément racine: {structure['root_tag']}")
         
         # Compter les tables
-        tables = root.findall('RalWebDataTable')
-        print(f"Nombre de RalWebDataTable: {len(tables)}")
+        print(f"Nombre de RalWebDataTable: {structure['row_count']}")
         
         # Analyser la première table pour voir la structure
-        if tables:
-            first_table = tables[0]
+        first_table = structure['first_row']
+        if first_table:
             print(f"\n📋 Colonnes disponibles ({len(first_table)} au total):")
             
-            for i, child in enumerate(first_table, 1):
-                value = child.text if child.text else "(vide)"
-                print(f"  {i:2d}. {child.tag:35} = {value}")
+            for i, (tag, text) in enumerate(first_table, 1):
+                value = text if text else "(vide)"
+                print(f"  {i:2d}. {tag:35} = {value}")
         
     except Exception as e:
         print(f"❌ Erreur lors de l'analyse: {e}")
@@ -465,8 +628,8 @@ def main():
     
     # Choisir le mode de fonctionnement
     if os.path.exists(kardex_file):
-        print("✅ Fichier Kardex trouvé - Mode AJOUT activé")
-        success = xml_to_existing_kardex(xml_file, kardex_file)
+        print("✅ Fichier Kardex trouvé - Mode SYNCHRONISATION activé")
+        success = xml_to_existing_kardex(xml_file, kardex_file, patch_sheet_xml=True, upsert=True)
     else:
         print("⚠️  Fichier Kardex non trouvé - Création d'un nouveau fichier")
         success = xml_to_excel(xml_file)
@@ -539,8 +702,14 @@ if __name__ == "__main__":
 # 1. Ajouter au fichier Kardex existant:
 # xml_to_existing_kardex("mon_fichier.xml", "/path/to/kardex.xlsm")
 #
+# 1b. Synchroniser le fichier Kardex existant (lignes nouvelles ou modifiées seulement):
+# xml_to_existing_kardex("mon_fichier.xml", "/path/to/kardex.xlsm", patch_sheet_xml=True, upsert=True)
+#
 # 2. Créer un nouveau fichier:
 # xml_to_excel("mon_fichier.xml", "nouveau_fichier.xlsx")
 #
 # 3. Ajouter à un fichier existant quelconque:
-# xml_to_excel("mon_fichier.xml", "fichier_existant.xlsx", append_to_existing=True)
\ No newline at end of file
+# xml_to_excel("mon_fichier.xml", "fichier_existant.xlsx", append_to_existing=True)
+#
+# 4. Plusieurs appareils en parallèle (dossier ou manifeste CSV/JSON de paires xml, kardex):
+# python xml_batch.py --xml-dir INPUT_DOCS/xml --kardex-dir Output_docs --workers 4